@@ -0,0 +1,182 @@
+'''Admission control of the results boards, so that the bot degrades
+gracefully under load instead of getting slow for every chat.
+
+Rendering a board and uploading it are the most expensive things the bot
+does, and they hold up the dispatcher: when many rounds end at once, the
+updates of every chat wait behind them. Before a board is rendered, the
+chat asks for admission, and gets the results as text instead (see
+`main.show_results_text`) if:
+- the boards being rendered or uploaded, and the jobs of the metered pools
+  (see `AdmissionControl.meter`), would be more than `max_renders`. Only the
+  pools whose jobs aren't admitted boards are metered: the animations, which
+  are rendered in another process while the static board is rendered, and
+  can outlive it. The tournament boards, rendered in the render pool, are
+  counted as the boards they are, and the speculative pre-renders aren't
+  counted;
+- more than `max_backlog` updates are waiting in the dispatcher's queue;
+- boards have been taking longer than `max_latency` seconds each, on
+  average over the last `window` seconds. Once those boards are out of
+  the window, boards are admitted again;
+- the messages sent to the games' chats (see `utils.send_message`) have
+  been taking longer than `max_send_latency` seconds each, or more than
+  `max_send_rate` of them were sent per second, over the window: Telegram
+  is throttling the bot, and a board would only wait behind them;
+- the bot is under pressure (half of the limits above) and the chat got a
+  board in the last `fair_interval` seconds, so that the chats with the
+  most rounds don't take all the boards.
+'''
+from collections import Counter, deque
+from time import monotonic
+import threading
+
+
+class MeteredPool:
+    '''Executor that counts its jobs that haven't finished yet'''
+    def __init__(self, executor):
+        self.executor = executor
+        self._lock = threading.Lock()
+        self._futures = set()
+
+    @property
+    def pending(self):
+        with self._lock:
+            return sum(not future.done() for future in self._futures)
+
+    def submit(self, function, *args, **kwargs):
+        future = self.executor.submit(function, *args, **kwargs)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def shutdown(self, *args, **kwargs):
+        self.executor.shutdown(*args, **kwargs)
+
+
+class AdmissionControl:
+    def __init__(self, max_renders=4, max_backlog=50, max_latency=5.0,
+                 window=60, fair_interval=30, max_send_latency=2.0,
+                 max_send_rate=20):
+        self.max_renders = max_renders
+        self.max_backlog = max_backlog
+        self.max_latency = max_latency
+        self.window = window
+        self.fair_interval = fair_interval
+        self.max_send_latency = max_send_latency
+        self.max_send_rate = max_send_rate
+        self._lock = threading.Lock()
+        self._rendering = Counter()  # {chat_id: boards in progress}
+        self._pools = []  # MeteredPools
+        self._last_board = {}  # {chat_id: time of its last admitted board}
+        self._latencies = deque()  # (time, seconds per board)
+        self._sends = deque()  # (time, seconds of the send)
+        self.admitted = 0
+        self.shed = Counter()  # {reason: boards shed}
+
+    def meter(self, executor):
+        '''Returns the executor wrapped in a MeteredPool, whose pending jobs
+        count as boards being rendered'''
+        pool = MeteredPool(executor)
+        self._pools.append(pool)
+        return pool
+
+    @property
+    def rendering(self):
+        '''Number of boards being rendered or uploaded, and of jobs waiting
+        in the metered pools'''
+        return (sum(self._rendering.values())
+                + sum(pool.pending for pool in self._pools))
+
+    def _window(self, samples, now):
+        '''Drops the (time, seconds) samples older than the window, and
+        returns their average seconds'''
+        while samples and samples[0][0] < now - self.window:
+            samples.popleft()
+        if not samples:
+            return 0
+        return sum(seconds for _, seconds in samples)/len(samples)
+
+    def _latency(self, now):
+        '''Average seconds per board in the window'''
+        return self._window(self._latencies, now)
+
+    def _send_load(self, now):
+        '''Average seconds per send, and sends per second, in the window'''
+        latency = self._window(self._sends, now)
+        return latency, len(self._sends)/self.window
+
+    def _shed_reason(self, chat_id, backlog, boards, now):
+        rendering = self.rendering
+        # More boards than the queue holds (a big tournament) only go alone
+        if rendering and rendering + boards > self.max_renders:
+            return 'renders'
+        if backlog > self.max_backlog:
+            return 'backlog'
+        latency = self._latency(now)
+        if latency > self.max_latency:
+            return 'latency'
+        send_latency, send_rate = self._send_load(now)
+        if (send_latency > self.max_send_latency
+                or send_rate > self.max_send_rate):
+            return 'sends'
+        under_pressure = (2*rendering > self.max_renders
+                          or 2*backlog > self.max_backlog
+                          or 2*latency > self.max_latency
+                          or 2*send_latency > self.max_send_latency
+                          or 2*send_rate > self.max_send_rate)
+        last_board = self._last_board.get(chat_id)
+        if (under_pressure and last_board is not None
+                and now - last_board < self.fair_interval):
+            return 'fairness'
+        return None
+
+    def admit(self, chat_id, backlog=0, boards=1, now=None):
+        '''Returns whether the chat may render `boards` results boards, with
+        `backlog` updates waiting in the dispatcher. If it may, `done` must
+        be called once they are sent'''
+        now = monotonic() if now is None else now
+        with self._lock:
+            reason = self._shed_reason(chat_id, backlog, boards, now)
+            if reason is not None:
+                self.shed[reason] += boards
+                return False
+            self._rendering[chat_id] += boards
+            self._last_board[chat_id] = now
+            self.admitted += boards
+            return True
+
+    def done(self, chat_id, seconds, boards=1, now=None):
+        '''Records that the admitted boards were rendered and sent in
+        `seconds`'''
+        now = monotonic() if now is None else now
+        with self._lock:
+            self._rendering[chat_id] -= boards
+            if self._rendering[chat_id] <= 0:
+                del self._rendering[chat_id]
+            self._latencies.append((now, seconds/boards))
+            # Chats that didn't get a board recently don't need to be kept
+            for other_chat_id, last_board in list(self._last_board.items()):
+                if now - last_board >= self.fair_interval:
+                    del self._last_board[other_chat_id]
+
+    def sent(self, seconds, now=None):
+        '''Records a message sent to a game's chat in `seconds`'''
+        now = monotonic() if now is None else now
+        with self._lock:
+            self._sends.append((now, seconds))
+
+    def stats(self, now=None):
+        '''Returns the admission metrics as a dict'''
+        now = monotonic() if now is None else now
+        with self._lock:
+            send_latency, send_rate = self._send_load(now)
+            return {'rendering': self.rendering,
+                    'admitted': self.admitted,
+                    'shed': dict(self.shed),
+                    'latency': round(self._latency(now), 3),
+                    'send_latency': round(send_latency, 3),
+                    'send_rate': round(send_rate, 2)}
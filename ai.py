@@ -0,0 +1,165 @@
+'''AI players, choosing cards and votes by the similarity between the clue and
+the cards' colours.
+
+Each card is described by a feature vector: a histogram of its hues (weighted
+by how vivid each pixel is), brightness and saturation. The vectors are
+computed offline from the card images and saved as a matrix in a .npy file,
+with row i for the card with image_id i, which is memory-mapped when loaded:
+
+    python ai.py assets/cards/png assets/card_index.npy
+
+Clues are mapped to the same space through a small lexicon of words with a
+colour or mood; other words get a fixed pseudo-random vector.
+'''
+from zlib import crc32
+import numpy as np
+import os
+import sys
+
+
+n_hues = 12  # Bins of 30 degrees, starting at red
+n_values = 4  # Brightness, from dark to bright
+n_saturations = 4  # From grey to vivid
+n_features = n_hues + n_values + n_saturations
+VALUE = n_hues
+SATURATION = n_hues + n_values
+
+RED, ORANGE, YELLOW, LIME, GREEN, TEAL, CYAN, AZURE, BLUE, VIOLET, MAGENTA, \
+        PINK = range(n_hues)
+DARK, DIM, LIT, BRIGHT = range(VALUE, VALUE + n_values)
+GREY, DULL, RICH, VIVID = range(SATURATION, SATURATION + n_saturations)
+
+# {word: {feature: weight}}
+lexicon = {
+    'red': {RED: 1},
+    'fire': {RED: 1, ORANGE: 0.5, BRIGHT: 0.3},
+    'love': {RED: 0.7, PINK: 0.7},
+    'blood': {RED: 1, DARK: 0.3},
+    'orange': {ORANGE: 1},
+    'autumn': {ORANGE: 1, RED: 0.4, DULL: 0.3},
+    'gold': {YELLOW: 1, ORANGE: 0.4, RICH: 0.3},
+    'sun': {YELLOW: 1, BRIGHT: 0.5},
+    'happy': {YELLOW: 0.6, BRIGHT: 0.6, VIVID: 0.4},
+    'light': {BRIGHT: 1, YELLOW: 0.3},
+    'hope': {LIME: 0.6, BRIGHT: 0.4},
+    'green': {GREEN: 1},
+    'nature': {GREEN: 1, LIME: 0.5},
+    'forest': {GREEN: 1, TEAL: 0.4, DIM: 0.3},
+    'sea': {AZURE: 1, BLUE: 0.6, CYAN: 0.4},
+    'water': {CYAN: 1, AZURE: 0.6},
+    'sky': {AZURE: 1, BRIGHT: 0.4},
+    'blue': {BLUE: 1},
+    'cold': {CYAN: 0.6, AZURE: 0.5, GREY: 0.3},
+    'sad': {BLUE: 0.6, DIM: 0.5, GREY: 0.4},
+    'calm': {AZURE: 0.5, DULL: 0.5, LIT: 0.3},
+    'dream': {VIOLET: 0.8, MAGENTA: 0.4},
+    'magic': {VIOLET: 1, DIM: 0.4},
+    'mystery': {VIOLET: 0.7, DARK: 0.5},
+    'pink': {PINK: 1},
+    'night': {DARK: 1, BLUE: 0.4},
+    'fear': {DARK: 1, DIM: 0.4, GREY: 0.3},
+    'death': {DARK: 1, GREY: 0.6},
+    'alone': {GREY: 0.6, DIM: 0.6},
+    'memory': {GREY: 0.7, DIM: 0.4, ORANGE: 0.3},
+    'time': {DULL: 0.6, ORANGE: 0.3, DIM: 0.3},
+    'chaos': {VIVID: 1, RED: 0.4, YELLOW: 0.3},
+    'energy': {VIVID: 0.8, ORANGE: 0.5, BRIGHT: 0.3},
+    }
+
+
+def normalize(vectors):
+    '''Scales the vectors (the rows, for a matrix) to unit length'''
+    norm = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norm == 0, 1, norm)
+
+
+def word_vector(word):
+    '''Feature vector of a word: from the lexicon if it's there, fixed
+    pseudo-random noise otherwise'''
+    vector = np.zeros(n_features, dtype=np.float32)
+    if word in lexicon:
+        for feature, weight in lexicon[word].items():
+            vector[feature] = weight
+        return vector
+    rng = np.random.default_rng(crc32(word.encode()))
+    return 0.2*rng.random(n_features, dtype=np.float32)
+
+
+lexicon_words = list(lexicon)
+lexicon_matrix = normalize(np.stack([word_vector(w) for w in lexicon_words]))
+
+
+def clue_vector(clue):
+    '''Feature vector of a clue, the normalized sum of its words' vectors'''
+    words = ''.join(c if c.isalpha() else ' ' for c in clue.lower()).split()
+    if not words:
+        return np.zeros(n_features, dtype=np.float32)
+    return normalize(sum(word_vector(word) for word in words))
+
+
+def image_features(image):
+    '''Feature vector of a PIL image'''
+    hsv = np.asarray(image.convert('RGB').convert('HSV'),
+                     dtype=np.float32).reshape(-1, 3) / 256
+    hue, saturation, value = hsv.T
+    vividness = saturation*value  # Grey and dark pixels have no real hue
+    features = np.concatenate([
+        np.bincount((hue*n_hues).astype(int), vividness, n_hues),
+        np.bincount((value*n_values).astype(int), minlength=n_values),
+        np.bincount((saturation*n_saturations).astype(int),
+                    minlength=n_saturations)]).astype(np.float32)
+    return features / len(hsv)
+
+
+def build_card_index(cards_dir, path):
+    '''Computes the features of the card images in `cards_dir`, named as
+    card_{image_id}.png, and saves them to the .npy file at `path`'''
+    from PIL import Image
+
+    features = {}
+    for card_file in os.listdir(cards_dir):
+        with Image.open(os.path.join(cards_dir, card_file)) as image:
+            image.thumbnail((128, 128))  # Plenty for colour histograms
+            features[int(card_file[5:-4])] = image_features(image)
+    matrix = np.zeros((max(features) + 1, n_features), dtype=np.float32)
+    for image_id, vector in features.items():
+        matrix[image_id] = vector
+    np.save(path, normalize(matrix))
+
+
+class CardIndex:
+    '''Memory-mapped matrix of the cards' feature vectors'''
+    def __init__(self, path):
+        self.features = np.load(path, mmap_mode='r')
+
+    def scores(self, clue, cards):
+        '''Similarity between the clue and each card, in one product'''
+        image_ids = [card.image_id for card in cards]
+        return self.features[image_ids] @ clue_vector(clue)
+
+    def closest_card(self, clue, cards):
+        '''Returns the card most similar to the clue'''
+        return cards[int(np.argmax(self.scores(clue, cards)))]
+
+    def describe(self, card):
+        '''Returns the lexicon word most similar to the card'''
+        return lexicon_words[int(np.argmax(lexicon_matrix
+                                           @ self.features[card.image_id]))]
+
+    def storyteller_play(self, hand, rng=np.random):
+        '''Picks a card from the hand and a clue for it'''
+        card = hand[rng.randint(len(hand))]
+        return card, self.describe(card)
+
+    def player_play(self, hand, clue):
+        '''Picks the card of the hand most likely to be voted for'''
+        return self.closest_card(clue, hand)
+
+    def vote(self, table_cards, clue):
+        '''Picks the card on the table (without one's own) closest to the
+        clue'''
+        return self.closest_card(clue, table_cards)
+
+
+if __name__ == '__main__':
+    build_card_index(*sys.argv[1:3])
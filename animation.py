@@ -0,0 +1,83 @@
+'''Animated results boards: the voters fly from their avatars to the cards
+they voted for, then the scores tick up, and the final board stays on screen.
+
+The frames are rendered incrementally: the base layer (see
+`draw.RenderContext`) and the clue and cards (`draw.draw_table`) are drawn
+once, and each frame only paints them and draws the moving parts
+(`draw.draw_votes`). Rendering and encoding run in a process pool (see
+`main.setup_dispatcher`), under a strict time budget: `show_animation` waits
+for the animation at most until its deadline, and the caller sends the static
+board instead if it isn't ready.
+
+The animations are GIFs, which Telegram converts to MP4 itself when they are
+sent with `send_animation`.
+'''
+from concurrent.futures import TimeoutError
+from cairo import Context, ImageSurface, FORMAT_RGB24
+from PIL import Image
+from time import time
+import logging
+import io
+import draw
+
+
+_render_context = draw.RenderContext()  # Of each worker process
+
+
+def render_animation(results, cards, deadline, n_frames=12,
+                     frame_duration=80, hold=3000, card_width=160):
+    '''Renders the animated board of `results` as a GIF and returns it.
+    `cards` are the PNGs of the round's cards, as {image_id: bytes}. Gives up
+    with TimeoutError once the `deadline` (a `time.time()`) has passed.
+    Each frame lasts `frame_duration` milliseconds, except for the final
+    board, which lasts `hold`'''
+    card_images = {image_id: io.BytesIO(data)
+                   for image_id, data in cards.items()}
+    width, height = draw.board_size(results.n_players, card_width)
+    # What doesn't move is drawn once
+    table = _render_context.table_layer(results, card_images, width, height)
+
+    frames = []
+    for n in range(n_frames + 1):
+        if time() > deadline:
+            raise TimeoutError('The animation is over its time budget')
+        surface = ImageSurface(FORMAT_RGB24, width, height)
+        ctx = Context(surface)
+        ctx.set_source_surface(table)
+        ctx.paint()
+        ctx.scale(width, height)
+        draw.draw_votes(ctx, results, progress=n/n_frames)
+        frames.append(draw.surface_to_image(surface))
+
+    # Every frame shares the palette of the final board, which has all the
+    # colours, so it is only computed once
+    final = frames[-1].quantize(colors=256)
+    frames = [frame.quantize(palette=final, dither=Image.Dither.NONE)
+              for frame in frames[:-1]] + [final]
+    with io.BytesIO() as file:
+        frames[0].save(file, 'GIF', save_all=True, append_images=frames[1:],
+                       duration=[frame_duration]*n_frames + [hold], loop=0)
+        return file.getvalue()
+
+
+def show_animation(results, card_images, pool, budget, **kwargs):
+    '''Starts rendering the animated board of `results` in `pool`. Returns a
+    function that waits for it until `budget` seconds from now, and returns
+    it, or None if it couldn't be rendered in time (or at all). The keyword
+    arguments go to `render_animation`'''
+    deadline = time() + budget
+    cards = {image_id: draw.card_data(image_id, card_images)
+             for image_id in results.cards}
+    future = pool.submit(render_animation, results, cards, deadline, **kwargs)
+
+    def wait():
+        try:
+            return future.result(timeout=max(0, deadline - time()))
+        except TimeoutError:
+            future.cancel()
+            return None
+        except Exception:
+            # The static board is still there to show the results
+            logging.exception('Animation - Could not render the animation')
+            return None
+    return wait
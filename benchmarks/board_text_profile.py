@@ -0,0 +1,112 @@
+'''Profile of the share of the results board's render time spent on text (the
+clue, the scores and looking up their font), per player count, in three
+modes:
+
+- before:  the font looked up by name and every score measured by cairo on
+           each render, as draw.py did before the caches
+- cached:  the cached font face and score extents (the default)
+- sprites: the scores drawn from pre-rendered digits (config.TEXT_SPRITES)
+
+Run from the repository root with `python -m benchmarks.board_text_profile`'''
+from cairo import FONT_SLANT_NORMAL, FONT_WEIGHT_NORMAL
+from contextlib import contextmanager, nullcontext
+import cProfile
+import pstats
+import draw
+from benchmarks.draw_bench import card_images, results
+
+
+class OldContext(draw.Context):
+    '''Context that looks the font up by name once per render, as draw_round
+    did with `select_font_face("Arial", ...)`, instead of setting the cached
+    font face'''
+    def new_render(self):
+        self._font_face = None
+
+    def set_font_face(self, font_face):
+        if self._font_face is None:
+            self.select_font_face("Arial", FONT_SLANT_NORMAL,
+                                  FONT_WEIGHT_NORMAL)
+            self._font_face = self.get_font_face()
+        else:
+            # draw_table and draw_votes both set the font, where draw_round
+            # selected it once
+            super().set_font_face(self._font_face)
+
+
+def old_show_score(ctx, score, delta_score, x, y, sprites=False):
+    '''The score measured by cairo, with the font of the context'''
+    ctx.set_source_rgb(*draw.score_color)
+    ctx.set_font_size(draw.score_height)
+    draw.show_centered_text(ctx, str(score), x, y, draw.score_height)
+    ctx.set_source_rgb(*draw.delta_score_color)
+    ctx.set_font_size(draw.delta_score_height)
+    ctx.show_text(f'+{delta_score}')
+
+
+@contextmanager
+def uncached():
+    '''Draws the scores the way they were drawn before the caches'''
+    show_score = draw.show_score
+    draw.show_score = old_show_score
+    try:
+        yield
+    finally:
+        draw.show_score = show_score
+
+
+def text_share(n_players, mode='cached', repeat=50, card_width=236):
+    '''Profiles draw_round in the `mode` and returns (ms per render, share of
+    it in text)'''
+    images = card_images(n_players)
+    round_results = results(n_players)
+    layout = draw.board_layout(n_players)
+    width = int(card_width*layout.total_width)
+    height = int(card_width*layout.total_height)
+    surface = draw.ImageSurface(draw.FORMAT_ARGB32, width, height)
+    before = mode == 'before'
+    ctx = OldContext(surface) if before else draw.Context(surface)
+    ctx.scale(width, height)
+    text_sprites = mode == 'sprites'
+
+    def draw_round():
+        if before:
+            ctx.new_render()
+        draw.draw_round(ctx, round_results, images, text_sprites)
+
+    draw_round()  # Warm caches
+    profile = cProfile.Profile()
+    with uncached() if before else nullcontext():
+        profile.enable()
+        for _ in range(repeat):
+            draw_round()
+        profile.disable()
+    stats = pstats.Stats(profile).stats
+
+    def cumulative_time(name, caller=None):
+        '''Time in the function `name`, if called by `caller`'''
+        return sum(cumtime if caller is None else sum(
+                       caller_time[3] for function, caller_time
+                       in callers.items() if function[2] == caller)
+                   for (_, _, function), (_, _, _, cumtime, callers)
+                   in stats.items() if function == name)
+
+    total = cumulative_time('draw_round')
+    # The clue, the scores with the text layout they do, and the font lookup
+    text = (cumulative_time('show_centered_text', caller='draw_table')
+            + cumulative_time('show_score')
+            + cumulative_time('old_show_score')
+            + cumulative_time('set_font_face'))
+    return 1000*total/repeat, text/total
+
+
+def main():
+    print(f'{"players":>7} {"mode":>8} {"ms":>8} {"text %":>7}')
+    for n_players in (3, 6, 12):
+        for mode in ('before', 'cached', 'sprites'):
+            elapsed, share = text_share(n_players, mode)
+            print(f'{n_players:>7} {mode:>8} {elapsed:>8.2f} {100*share:>7.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''Benchmark of drawing the round layer of the results board (clue, scores,
+cards and voters) over the cached base layer, and of finishing a board
+pre-rendered during the vote, per player count. Run from the repository root
+with `python -m benchmarks.draw_bench`'''
+from time import perf_counter
+from cairo import Context, ImageSurface, FORMAT_ARGB32
+from PIL import Image
+import io
+import draw
+from game import DixitResults
+
+
+def card_images(n_cards):
+    '''Plain PNGs to stand in for the card images'''
+    images = {}
+    for image_id in range(1, n_cards + 1):
+        file = io.BytesIO()
+        Image.new('RGB', (236, 354), (image_id*40 % 256, 90, 160)).save(file,
+                                                                       'PNG')
+        images[image_id] = file
+    return images
+
+
+def results(n_players):
+    '''Round where everyone votes for the next player's card'''
+    seats = range(n_players)
+    return DixitResults(
+            game_id=None, game_number=1, round_number=1,
+            player_ids=tuple(-seat - 1 for seat in seats),
+            player_names=tuple(f'Dummy {seat}' for seat in seats),
+            storyteller=0,
+            votes=tuple(-1 if seat == 0 else (seat + 1) % n_players
+                        for seat in seats),
+            cards=tuple(seat + 1 for seat in seats),
+            clue='A clue of average length', score=tuple(seats),
+            delta_score=tuple(seats), ranking=tuple(reversed(seats)))
+
+
+def draw_votes(ctx, results, images):
+    '''draw.draw_votes, with the arguments of draw.draw_round'''
+    draw.draw_votes(ctx, results)
+
+
+def main(repeat=20, card_width=236):
+    '''Times drawing the round layer over the base layer, as at the end of a
+    round without a pre-render, and the votes and scores over the table
+    layer, as after a pre-render during the vote'''
+    images = card_images(12)
+    print(f'{"players":>7} {"round ms":>9} {"votes ms":>9}')
+    for n_players in (3, 6, 12):
+        round_results = results(n_players)
+        width, height = draw.board_size(n_players, card_width)
+        render_context = draw.RenderContext()
+        base = render_context.base_layer(round_results.player_ids, width,
+                                         height)
+        table = render_context.table_layer(round_results, images, width,
+                                           height)
+        timings = []
+        for layer, draw_layer in ((base, draw.draw_round),
+                                  (table, draw_votes)):
+            start = perf_counter()
+            for _ in range(repeat):
+                surface = ImageSurface(FORMAT_ARGB32, width, height)
+                ctx = Context(surface)
+                ctx.set_source_surface(layer)
+                ctx.paint()
+                ctx.scale(width, height)
+                draw_layer(ctx, round_results, images)
+                surface.flush()
+            timings.append((perf_counter() - start)/repeat)
+        print(f'{n_players:>7} {1000*timings[0]:>9.1f} {1000*timings[1]:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+'''Benchmark of the encoders of the results pictures: encoding time and size
+per player count. The board is the real base layer, with synthetic photo-like
+card art painted where the cards go. Run from the repository root with
+`python -m benchmarks.encode_bench`'''
+from time import perf_counter
+from cairo import Context, ImageSurface, FORMAT_ARGB32, FORMAT_RGB24
+from PIL import Image
+import io
+import draw
+
+
+def card_art(seed, size=(236, 354)):
+    '''Photo-like noise to stand in for the card images'''
+    noise = Image.effect_noise(size, 48 + seed % 32).convert('RGB')
+    gradient = Image.radial_gradient('L').resize(size).convert('RGB')
+    mandelbrot = Image.effect_mandelbrot(size, (-2, -1.5, 1, 1.5), 50 + seed)
+    return Image.merge('RGB', (noise.getchannel(0), gradient.getchannel(0),
+                               mandelbrot.convert('L')))
+
+
+def board(n_players, surface_format, card_width=236):
+    '''Returns a surface with the base layer and card art of a results board'''
+    layout = draw.board_layout(n_players)
+    width = int(card_width*layout.total_width)
+    height = int(card_width*layout.total_height)
+    surface = ImageSurface(surface_format, width, height)
+    ctx = Context(surface)
+    player_ids = range(-1, -n_players - 1, -1)  # Dummies
+    ctx.set_source_surface(draw.RenderContext().base_layer(player_ids, width,
+                                                           height))
+    ctx.paint()
+    for seat in range(n_players):
+        with io.BytesIO() as file:
+            card_art(seat).save(file, 'PNG')
+            file.seek(0)
+            card = ImageSurface.create_from_png(file)
+        x, y = layout.cards[seat]
+        ctx.set_source_surface(card, card_width*x, card_width*y)
+        ctx.paint()
+    return surface
+
+
+def main(repeat=5):
+    print(f'{"players":>7} {"encoder":>9} {"ms":>8} {"KiB":>8}')
+    for n_players in (3, 6, 12):
+        for encoder in ('png', 'png-fast', 'jpeg', 'webp'):
+            surface_format = FORMAT_RGB24 if encoder in draw.opaque_encoders \
+                             else FORMAT_ARGB32
+            surface = board(n_players, surface_format)
+            start = perf_counter()
+            for _ in range(repeat):
+                with io.BytesIO() as file:
+                    draw.encode_surface(surface, file, encoder)
+                    size = file.tell()
+            elapsed = (perf_counter() - start)/repeat
+            print(f'{n_players:>7} {encoder:>9} {1000*elapsed:>8.1f} '
+                  f'{size/1024:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
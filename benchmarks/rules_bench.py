@@ -0,0 +1,67 @@
+'''Benchmark of the compiled scoring rules and end criteria against the
+previous hardcoded implementation, on a game set up like the test fixture in
+tests/game_test.py. Run from the repository root with
+`python -m benchmarks.rules_bench`'''
+from collections import Counter
+from timeit import timeit
+from telegram import User
+import game
+
+
+def old_point_counter(dixit):
+    '''Previous implementation of DixitGame.point_counter'''
+    player_points = Counter(dixit.votes.values())
+    storyteller = dixit.storyteller
+    good_hint = len(dixit.votes) > player_points[storyteller] > 0
+    player_points[storyteller] = 3 if good_hint else 0
+    for player, vote in dixit.votes.items():
+        player_points[player] += 3*(vote==storyteller) if good_hint else 2
+    for player in dixit.players:
+        dixit.delta_score[player] = player_points.get(player, 0)
+
+
+def old_has_ended(dixit):
+    '''Previous implementation of DixitGame.has_ended'''
+    if dixit.end_criterion == game.EndCriterion.LAST_CARD:
+        return len(dixit.cards) < len(dixit.players) * dixit.cards_per_player
+    elif dixit.end_criterion == game.EndCriterion.POINTS:
+        return max(dixit.score.values()) >= dixit.end_criterion_number
+    elif dixit.end_criterion == game.EndCriterion.ROUNDS:
+        return dixit.round_number >= dixit.end_criterion_number
+
+
+def voting_game(n_players):
+    '''A game with n_players (master included) at the end of a vote'''
+    players = [game.Player(User(id_, chr(ord('A') + id_), False, 'da Silva'))
+               for id_ in range(n_players - 1)]
+    dixit = game.DixitGame(master=game.Player(User(-1, 'Master', False)),
+                           players=players,
+                           end_criterion=game.EndCriterion.POINTS,
+                           end_criterion_number=30)
+    dixit.storyteller = dixit.players[0]
+    others = dixit.players[1:]
+    for player, vote in zip(others, others[1:] + [dixit.storyteller]):
+        dixit.votes[player] = vote
+    dixit.score = dict.fromkeys(dixit.players, 0)
+    return dixit
+
+
+def bench(label, f, number):
+    t = timeit(f, number=number)
+    print(f'{label:<32} {1e6*t/number:>8.2f} us/call')
+
+
+def main(number=50_000):
+    for n_players in (4, 12, 40):
+        dixit = voting_game(n_players)
+        print(f'{n_players} players')
+        bench('point_counter (hardcoded)',
+              lambda: old_point_counter(dixit), number)
+        bench('point_counter (compiled)', dixit.point_counter, number)
+        bench('has_ended POINTS (if-chain)',
+              lambda: old_has_ended(dixit), number)
+        bench('has_ended POINTS (running max)', dixit.has_ended, number)
+
+
+if __name__ == '__main__':
+    main()
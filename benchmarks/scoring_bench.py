@@ -0,0 +1,33 @@
+'''Benchmark of the batch scoring engine against scoring round by round. Run
+from the repository root with `python -m benchmarks.scoring_bench`'''
+from time import perf_counter
+import scoring
+
+
+def main(n_rounds=100_000, n_seats=6):
+    votes, storytellers = scoring.simulate_votes(n_rounds, n_seats, seed=0)
+
+    start = perf_counter()
+    scoring.batch_scores(votes, storytellers)
+    batch_time = perf_counter() - start
+
+    start = perf_counter()
+    score = dict.fromkeys(range(n_seats), 0)
+    for round_votes, storyteller in zip(votes.argmax(axis=2).tolist(),
+                                        storytellers.tolist()):
+        round_votes = {voter: voted for voter, voted in enumerate(round_votes)
+                       if voter != storyteller}
+        delta = scoring.round_delta(round_votes, storyteller, range(n_seats))
+        for seat, points in delta.items():
+            score[seat] += points
+        score = dict(sorted(score.items(), key=lambda x: x[1], reverse=True))
+    loop_time = perf_counter() - start
+
+    print(f'{n_rounds} rounds, {n_seats} seats')
+    print(f'batch_scores:        {batch_time:.3f} s')
+    print(f'round by round:      {loop_time:.3f} s '
+          f'({loop_time/batch_time:.0f}x slower)')
+
+
+if __name__ == '__main__':
+    main()
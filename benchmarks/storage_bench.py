@@ -0,0 +1,45 @@
+'''Benchmark of the game stores: game transitions (a change of stage followed
+by `put_game`) per second, for many concurrent games. Run from the repository
+root with `python -m benchmarks.storage_bench`'''
+from time import perf_counter
+from tempfile import TemporaryDirectory
+from telegram import Bot, User
+import os
+import game
+import storage
+
+
+def new_game(bot, n_players=6):
+    users = [User(id_, f'Player {id_}', False, bot=bot)
+             for id_ in range(1, n_players + 1)]
+    dixit = game.DixitGame(master=users[0])
+    for user in users[1:]:
+        dixit.add_player(user)
+    dixit.start_game(users[0])
+    return dixit
+
+
+def bench(label, store, games, n_transitions):
+    start = perf_counter()
+    for n in range(n_transitions):
+        chat_id = n % len(games)
+        dixit = store.get_game(chat_id) or games[chat_id]
+        dixit.stage = game.Stage((dixit.stage + 1) % len(game.Stage))
+        store.put_game(chat_id, dixit)
+    store.flush()
+    elapsed = perf_counter() - start
+    print(f'{label:<28} {n_transitions/elapsed:>10.0f} transitions/s')
+
+
+def main(n_games=100, n_transitions=20_000):
+    bot = Bot('123:abc')
+    games = [new_game(bot) for _ in range(n_games)]
+    bench('MemoryStore', storage.MemoryStore(), games, n_transitions)
+    with TemporaryDirectory() as directory:
+        store = storage.SQLiteStore(os.path.join(directory, 'games.sqlite3'),
+                                    bot=bot)
+        bench('SQLiteStore', store, games, n_transitions)
+        store.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+'''Micro-benchmark of the name formatting and markdown escaping paths against
+their alternatives. Run from the repository root with
+`python -m benchmarks.text_bench`'''
+from timeit import timeit
+from telegram import User
+from game import Player
+from utils import markdown_escape
+
+
+_markdown_escape_table = str.maketrans({symbol: '\\' + symbol
+                                        for symbol in '_*[]()~`>#+-=|{}.!'})
+
+def translate_markdown_escape(string):
+    '''Single-pass alternative to utils.markdown_escape, using str.translate.
+    It is slower on CPython, as str.translate with a str mapping falls back to
+    a generic per-character path, while str.replace is heavily optimized'''
+    return string.translate(_markdown_escape_table)
+
+
+def old_format(player, spec='full'):
+    '''Previous implementation of Player.__format__, without caching'''
+    form = spec.removeprefix('@').removesuffix("'s")
+    mention = spec.startswith('@')
+    possessive = spec.endswith("'s")
+    if form in ('full', ''):
+        name = ' '.join(filter(bool, [player.first_name, player.last_name]))
+    elif form == 'formal':
+        if player.last_name:
+            name =  player.first_name[0] + '. ' + player.last_name
+        else:
+            name = player.first_name
+    elif form == 'first':
+        name = player.first_name
+    name += ("'" if name.endswith('s') else "'s")*possessive
+    name = f'[{name}](tg://user?id={player.id})' if mention else name
+    return name
+
+
+def bench(label, f, number):
+    t = timeit(f, number=number)
+    print(f'{label:<28} {1e9*t/number:>8.0f} ns/call')
+
+
+def main(number=200_000):
+    player = Player(User(1, first_name='Jesus', last_name='da Silva',
+                         is_bot=False))
+    text = 'Damn you, Jesus! (a.k.a. J_s) [#1] is the storyteller!'
+    assert markdown_escape(text) == translate_markdown_escape(text)
+
+    bench('markdown_escape (replace)', lambda: markdown_escape(text), number)
+    bench('markdown_escape (translate)',
+          lambda: translate_markdown_escape(text), number)
+    for spec in ('full', "@full's", 'formal'):
+        assert format(player, spec) == old_format(player, spec)
+        bench(f'format {spec!r} (uncached)',
+              lambda: old_format(player, spec), number)
+        bench(f'format {spec!r} (cached)',
+              lambda: format(player, spec), number)
+
+
+if __name__ == '__main__':
+    main()
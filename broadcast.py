@@ -0,0 +1,155 @@
+from telegram.error import TelegramError, RetryAfter, Unauthorized
+from collections import deque
+from time import monotonic
+import logging
+import threading
+
+
+class Broadcaster:
+    '''Fans out the updates of games to the chats watching them (see /watch).
+
+    Messages are queued for every spectator and sent in batches of
+    `batch_size` every `interval` seconds, to stay under Telegram's limit of
+    about 30 messages per second. Pictures and animations are never uploaded
+    again: they are sent to the spectators by the `file_id` Telegram gave
+    them when they were sent to the game's chat, so a board is rendered and
+    uploaded once however many chats watch the game.
+
+    At most `max_queue` messages wait to be sent. Under load, the oldest are
+    dropped: spectators are the first to go without updates. When Telegram
+    rate limits the bot, nothing is sent until the `retry_after` it gave has
+    passed.
+
+    Under a supervisor, each worker broadcasts the games of its own chats, and
+    `watch_index`, the {spectator chat_id: game chat_id} dict shared by the
+    workers, says which game each chat watches (see supervisor.py). A chat
+    that switches to a game of another worker is dropped by the old one the
+    next time it has something to send it.
+    '''
+    def __init__(self, job_queue, batch_size=25, interval=1.0, max_queue=1000,
+                 watch_index=None):
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self._queue = deque()  # (method name, chat_id, game chat_id, kwargs)
+        self._spectators = {}  # {game chat_id: {spectator chat_id}}
+        # {spectator chat_id: game chat_id}
+        self._watching = {} if watch_index is None else watch_index
+        self._lock = threading.Lock()
+        self._paused_until = 0  # monotonic() time, after a rate limit
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        job_queue.run_repeating(self._flush, interval)
+
+    def __len__(self):
+        '''Number of messages waiting to be sent'''
+        return len(self._queue)
+
+    def subscribe(self, game_chat_id, chat_id):
+        '''Makes the chat watch the game of `game_chat_id`, instead of any
+        game it was watching'''
+        with self._lock:
+            self._unsubscribe(chat_id)
+            self._spectators.setdefault(game_chat_id, set()).add(chat_id)
+            self._watching[chat_id] = game_chat_id
+
+    def _forget(self, game_chat_id, chat_id):
+        '''Removes the chat from the game's spectators in this broadcaster'''
+        spectators = self._spectators.get(game_chat_id, set())
+        spectators.discard(chat_id)
+        if not spectators:
+            self._spectators.pop(game_chat_id, None)
+
+    def _unsubscribe(self, chat_id):
+        game_chat_id = self._watching.pop(chat_id, None)
+        if game_chat_id is not None:
+            self._forget(game_chat_id, chat_id)
+        return game_chat_id
+
+    def unsubscribe(self, chat_id):
+        '''Stops the chat from watching its game. Returns the game's chat id,
+        or None if it wasn't watching any'''
+        with self._lock:
+            return self._unsubscribe(chat_id)
+
+    def spectators(self, game_chat_id):
+        with self._lock:
+            return set(self._spectators.get(game_chat_id, ()))
+
+    def drop_game(self, game_chat_id):
+        '''Unsubscribes every spectator of a game that is over'''
+        with self._lock:
+            for chat_id in self._spectators.pop(game_chat_id, ()):
+                if self._watching.get(chat_id) == game_chat_id:
+                    del self._watching[chat_id]
+
+    def publish(self, game_chat_id, method, **kwargs):
+        '''Queues `bot.<method>(chat_id=spectator, **kwargs)` for every
+        spectator of the game'''
+        with self._lock:
+            self._queue.extend((method, chat_id, game_chat_id, kwargs)
+                               for chat_id in self._spectators.get(
+                                       game_chat_id, ()))
+            while len(self._queue) > self.max_queue:
+                self._queue.popleft()
+                self.dropped += 1
+
+    def publish_message(self, game_chat_id, text, **kwargs):
+        self.publish(game_chat_id, 'send_message', text=text, **kwargs)
+
+    def publish_photo(self, game_chat_id, message, **kwargs):
+        '''Queues the photo of a message sent to the game's chat, by its
+        file_id'''
+        self.publish(game_chat_id, 'send_photo',
+                     photo=message.photo[-1].file_id, **kwargs)
+
+    def publish_animation(self, game_chat_id, message, **kwargs):
+        '''Queues the animation of a message sent to the game's chat, by its
+        file_id'''
+        self.publish(game_chat_id, 'send_animation',
+                     animation=message.animation.file_id, **kwargs)
+
+    def _flush(self, context):
+        bot = context.bot
+        if monotonic() < self._paused_until:
+            return
+        for _ in range(self.batch_size):
+            with self._lock:
+                if not self._queue:
+                    return
+                item = method, chat_id, game_chat_id, kwargs = \
+                        self._queue.popleft()
+                if self._watching.get(chat_id) != game_chat_id:
+                    # The chat stopped watching, or watches another game
+                    self._forget(game_chat_id, chat_id)
+                    continue
+            try:
+                getattr(bot, method)(chat_id=chat_id, **kwargs)
+                self.sent += 1
+            except RetryAfter as e:
+                # Rate limited: resend it once Telegram allows it
+                with self._lock:
+                    self._queue.appendleft(item)
+                    self._paused_until = monotonic() + e.retry_after
+                logging.warning('Broadcaster - rate limited for %ss',
+                                e.retry_after)
+                return
+            except Unauthorized as e:
+                # The bot was removed from the chat
+                self.failed += 1
+                self.unsubscribe(chat_id)
+                logging.warning('Broadcaster - unsubscribed chat %s: %s',
+                                chat_id, e)
+            except TelegramError as e:
+                self.failed += 1
+                logging.warning('Broadcaster - could not send to chat %s: %s',
+                                chat_id, e)
+
+    def stats(self):
+        '''Returns the broadcasting metrics as a dict'''
+        with self._lock:
+            return {'spectators': len(self._watching),
+                    'queued': len(self._queue),
+                    'sent': self.sent,
+                    'failed': self.failed,
+                    'dropped': self.dropped}
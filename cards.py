@@ -0,0 +1,128 @@
+'''Card images fetched from the card host (see `game.card_url`), for bots
+without the cards in assets/cards/png (see config.CARD_SOURCE).
+
+Fetched cards are converted to PNG, which cairo reads, and kept in a local
+content-addressed cache: each PNG is a file named by the SHA-256 of its
+contents, and an index maps the image ids to them. Identical images are
+stored once, and a file only gets its name once it is completely written, so
+a crash never leaves a broken card in the cache.
+
+The cards on the table are fetched concurrently as soon as the vote starts
+(see `CardCache.prefetch`), so they are cached by the time the round ends.
+Reading a card, as the renders in draw.py do with `cache[image_id]`, never
+touches the network: a card that wasn't fetched is a KeyError.
+'''
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections.abc import Mapping
+from hashlib import sha256
+from urllib.request import urlopen
+from game import card_url
+import threading
+import logging
+import json
+import io
+import os
+
+
+def to_png(data):
+    '''Converts an image to PNG, unless it is one already'''
+    if data.startswith(b'\x89PNG'):
+        return data
+    from PIL import Image  # Imported on first use, to start up faster
+    with io.BytesIO() as file:
+        Image.open(io.BytesIO(data)).save(file, 'PNG')
+        return file.getvalue()
+
+
+class CardCache(Mapping):
+    '''{image_id: PNG file} mapping of the fetched cards, stored in
+    `directory`. Cards are fetched by `workers` threads, from `url(image_id)`,
+    giving up after `timeout` seconds'''
+    def __init__(self, directory, workers=8, timeout=10, url=card_url):
+        self.directory = directory
+        self.timeout = timeout
+        self.url = url
+        self._lock = threading.Lock()
+        self._pending = {}  # {image_id: future of its fetch}
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='cards')
+        self._index_path = os.path.join(directory, 'index.json')
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self._index_path) as file:
+                self._index = {int(image_id): digest for image_id, digest
+                               in json.load(file).items()}
+        except FileNotFoundError:
+            self._index = {}  # {image_id: SHA-256 of its PNG}
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f'{digest}.png')
+
+    def __getitem__(self, image_id):
+        '''Returns the PNG of a fetched card as a file. Never fetches it'''
+        with self._lock:
+            digest = self._index[image_id]
+        with open(self._path(digest), 'rb') as file:
+            return io.BytesIO(file.read())
+
+    def __contains__(self, image_id):
+        with self._lock:
+            return image_id in self._index
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._index))
+
+    def __len__(self):
+        return len(self._index)
+
+    def _write(self, path, data):
+        '''Writes the file under a temporary name, then renames it'''
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+    def _fetch(self, image_id):
+        try:
+            with urlopen(self.url(image_id), timeout=self.timeout) as response:
+                png = to_png(response.read())
+            digest = sha256(png).hexdigest()
+            if not os.path.exists(self._path(digest)):
+                self._write(self._path(digest), png)
+            with self._lock:
+                self._index[image_id] = digest
+                index = json.dumps(self._index)
+                self._write(self._index_path, index.encode())
+            logging.debug('Cards - Fetched card %s', image_id)
+        except OSError as e:  # Includes the network and image errors
+            logging.warning('Cards - Could not fetch card %s: %s', image_id, e)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(image_id, None)
+
+    def prefetch(self, image_ids):
+        '''Fetches the cards that aren't cached, concurrently and in the
+        background. Returns the futures of the fetches'''
+        futures = []
+        with self._lock:
+            for image_id in image_ids:
+                if image_id in self._index:
+                    continue
+                if image_id not in self._pending:
+                    self._pending[image_id] = self._pool.submit(self._fetch,
+                                                                image_id)
+                futures.append(self._pending[image_id])
+        return futures
+
+    def wait(self, image_ids, timeout=None):
+        '''Waits for the pending fetches of the cards, if any. Returns whether
+        all of them are cached'''
+        with self._lock:
+            futures = [self._pending[image_id] for image_id in image_ids
+                       if image_id in self._pending]
+        wait(futures, timeout)
+        return all(image_id in self for image_id in image_ids)
+
+    def close(self):
+        self._pool.shutdown()
@@ -0,0 +1,87 @@
+'''Bot settings. Change them here before running main.py'''
+
+# Encoder of the results pictures. One of:
+# 'png'      - cairo's PNG encoder (lossless, slowest, biggest)
+# 'png-fast' - Pillow's PNG encoder with the lowest compression level
+# 'jpeg'     - Pillow's JPEG encoder
+# 'webp'     - Pillow's WebP encoder
+RESULTS_ENCODER = 'png'
+RESULTS_QUALITY = 85  # For 'jpeg' and 'webp'
+# Draw the scores of the results board from pre-rendered digits, instead of
+# laying out their text on every render
+TEXT_SPRITES = False
+
+# Animated results boards (see animation.py), rendered by ANIMATION_WORKERS
+# processes. Chats get the static board instead if the animation isn't ready
+# within ANIMATION_BUDGET seconds of the end of the round
+ANIMATION_WORKERS = 2
+ANIMATION_BUDGET = 4.0
+ANIMATION_FRAMES = 12
+ANIMATION_FRAME_DURATION = 80  # Milliseconds
+ANIMATION_HOLD = 3000  # Milliseconds the final board is shown
+
+# Where the card images come from. One of:
+# 'assets' - assets/cards/png, loaded into memory at startup
+# 'web'    - The card host, fetched into a local cache in CARD_CACHE_DIR by
+#            CARD_FETCH_WORKERS threads (see cards.py). The cards on the table
+#            are fetched when the vote starts, and the results wait for them
+#            at most CARD_FETCH_TIMEOUT seconds before falling back to text
+CARD_SOURCE = 'assets'
+CARD_CACHE_DIR = 'tmp/cards'
+CARD_FETCH_WORKERS = 8
+CARD_FETCH_TIMEOUT = 10
+
+# Where the games are stored, besides the dispatcher's memory. One of:
+# None            - Nowhere else (games are lost when the bot stops)
+# 'memory'        - An in-memory store, mostly for testing
+# 'sqlite:<path>' - An SQLite database at <path>
+GAME_STORE = None
+
+# Games with no activity for longer than the timeout of their stage, in
+# minutes, are closed. The check runs every REAPER_INTERVAL seconds
+IDLE_TIMEOUTS = {'LOBBY': 60, 'STORYTELLER': 30, 'PLAYERS': 30, 'VOTE': 30}
+REAPER_INTERVAL = 300
+# Directory where closed idle games are saved, or None to discard them
+SPILL_DIR = 'tmp/spilled'
+
+# SQLite database of the rounds played and the players' statistics (see
+# stats.py), shared by the workers of a supervisor
+STATS_DB = 'tmp/stats.sqlite3'
+
+# Seconds each player has to play in each stage, before a random card is
+# played for them. Stages missing here have no time limit
+TURN_TIMEOUTS = {'STORYTELLER': 180, 'PLAYERS': 120, 'VOTE': 120}
+TURN_TIMER_RESOLUTION = 1  # Seconds
+
+# Feature vectors of the cards, used by the dummies to play like the AI (see
+# ai.py to build it). Without it, dummies play at random
+CARD_INDEX = 'assets/card_index.npy'
+
+# Tournaments: players per table, rounds played, and threads rendering the
+# results boards of the tables at the end of each round
+TOURNAMENT_TABLE_SIZE = 6
+TOURNAMENT_ROUNDS = 3
+RENDER_WORKERS = 4
+
+# Messages sent to the chats watching games (/watch) per batch, and seconds
+# between batches. Telegram allows about 30 messages per second
+BROADCAST_BATCH_SIZE = 25
+BROADCAST_INTERVAL = 1.0
+BROADCAST_MAX_QUEUE = 1000  # Older messages are dropped beyond it
+
+# Admission control of the results boards (see admission.py). Chats get the
+# results as text while ADMISSION_MAX_RENDERS boards are being rendered, more
+# than ADMISSION_MAX_BACKLOG updates are waiting, or boards took more than
+# ADMISSION_MAX_LATENCY seconds on average in the last ADMISSION_WINDOW
+# seconds, or the messages to the games' chats took more than
+# ADMISSION_MAX_SEND_LATENCY seconds on average, or more than
+# ADMISSION_MAX_SEND_RATE were sent per second. Under pressure, chats that got
+# a board in the last ADMISSION_FAIR_INTERVAL seconds get text first
+ADMISSION_MAX_RENDERS = 4
+ADMISSION_MAX_BACKLOG = 50
+ADMISSION_MAX_LATENCY = 5.0
+ADMISSION_WINDOW = 60
+ADMISSION_FAIR_INTERVAL = 30
+ADMISSION_MAX_SEND_LATENCY = 2.0
+ADMISSION_MAX_SEND_RATE = 20
+LOAD_LOG_INTERVAL = 300  # Seconds between logs of the load metrics
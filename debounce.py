@@ -0,0 +1,64 @@
+from telegram.error import TelegramError
+import logging
+import threading
+
+
+class InlineDebouncer:
+    '''Coalesces the inline queries of each user, so that only the latest one
+    is answered after `quiet_period` seconds without new queries.
+
+    Telegram sends a new inline query for every character the storyteller
+    types in the clue, and each answer is a round-trip to the API. Queries
+    are ordered by their arrival in the dispatcher (inline query ids are
+    opaque strings), and a query superseded by a newer one from the same
+    user is simply dropped: Telegram discards unanswered queries by itself.
+    '''
+    def __init__(self, job_queue, quiet_period=0.4):
+        self.job_queue = job_queue
+        self.quiet_period = quiet_period
+        self._pending = {}  # {user_id: (seq, inline_query, results, kwargs)}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.received = 0
+        self.answered = 0
+
+    @property
+    def saved(self):
+        '''Number of answers that were not sent because of debouncing'''
+        with self._lock:
+            return self.received - self.answered - len(self._pending)
+
+    def submit(self, inline_query, results, **kwargs):
+        '''Schedules `inline_query.answer(results, **kwargs)`, superseding any
+        query of the same user that is still waiting to be answered'''
+        user_id = inline_query.from_user.id
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self.received += 1
+            self._pending[user_id] = (seq, inline_query, results, kwargs)
+        self.job_queue.run_once(self._flush, self.quiet_period,
+                                context=(user_id, seq))
+
+    def _flush(self, context):
+        user_id, seq = context.job.context
+        with self._lock:
+            pending = self._pending.get(user_id)
+            if pending is None or pending[0] != seq:
+                return  # superseded by a newer query
+            del self._pending[user_id]
+            self.answered += 1
+        _, inline_query, results, kwargs = pending
+        try:
+            inline_query.answer(results, **kwargs)
+        except TelegramError as e:
+            logging.warning(f'Could not answer inline query of user {user_id}.'
+                            f' TelegramError raised with message: {str(e)}')
+        logging.debug('Inline debouncer - %d queries received, %d answered, '
+                      '%d saved', self.received, self.answered, self.saved)
+
+    def stats(self):
+        '''Returns the debouncing metrics as a dict'''
+        return {'received': self.received,
+                'answered': self.answered,
+                'saved': self.saved}
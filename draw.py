@@ -1,10 +1,16 @@
 from game import *
 from utils import *
 from telegram import User
-from urllib.request import urlopen
 from PIL import Image
-from cairo import Context, SVGSurface, ImageSurface, Surface, Error, FONT_SLANT_NORMAL, FONT_WEIGHT_NORMAL, FORMAT_ARGB32, RadialGradient
+from cairo import Context, SVGSurface, ImageSurface, Surface, Error, FONT_SLANT_NORMAL, FONT_WEIGHT_NORMAL, FORMAT_ARGB32, FORMAT_RGB24, FORMAT_A8, RadialGradient
+from cairo import ToyFontFace, ScaledFont, FontOptions, Matrix, TextExtents, HINT_METRICS_OFF
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Tuple
+import threading
 import math
+import io
 
 '''
 TODO
@@ -15,22 +21,31 @@ TODO
     [X] Highlight storyteller better
 '''
 
-def draw_card(ctx, card, from_memory=True, card_images={}):
-    if from_memory:
-        image = card_images[card.image_id]
+_card_images_lock = threading.Lock()
+
+def card_data(image_id, card_images):
+    '''Returns the PNG of the card. The image files are shared by the
+    rendering threads, so they are read under a lock'''
+    image = card_images[image_id]
+    with _card_images_lock:
         image.seek(0)
-        card_surface = ImageSurface.create_from_png(image)
-    else:
-        file_jpeg = urlopen(card.url)
-        pil_file_jpeg = Image.open(file_jpeg)
-        filename = f'tmp/card_{card.image_id:0>5}.png'
-        pil_file_jpeg.save(filename)
-        card_surface = ImageSurface.create_from_png(filename)
-    
+        return image.read()
+
+def card_surface_from_memory(image_id, card_images):
+    '''Decodes the image of the card'''
+    return ImageSurface.create_from_png(io.BytesIO(card_data(image_id,
+                                                            card_images)))
+
+def draw_card(ctx, image_id, card_images):
+    '''Draws the card in the unit square. The image comes from card_images,
+    which are in memory or in the card cache: rendering never fetches cards
+    (see cards.py)'''
+    card_surface = card_surface_from_memory(image_id, card_images)
+    ctx.save()
     ctx.scale(1/card_surface.get_width(), 1/card_surface.get_height())
     ctx.set_source_surface(card_surface, 0, 0)
     ctx.paint()
-    ctx.scale(card_surface.get_width(), card_surface.get_height())
+    ctx.restore()
 
 def draw_profile_pic(ctx,
                      pic_filename,
@@ -121,126 +136,481 @@ clue_color = (0.0, 0.0, 0.0)
 delta_score_color = (0.0, 0.6, 0.0)
 
 card_width=236/2
-def draw_results(ctx, results, card_images):
-    total_width = (1 + 2*card_hor_border)*len(results.players) + 2*results_border
+def results_size(n_players):
+    '''Returns the (total_width, total_height) of the results board, in units
+    of the width of a card'''
+    total_width = (1 + 2*card_hor_border)*n_players + 2*results_border
     total_height = voted_pic_diam + score_height + card_aspect_ratio + voter_pic_diam + clue_height + 2*results_border
+    return total_width, total_height
+
+@dataclass(frozen=True)
+class BoardLayout:
+    '''Positions on the results board, in units of the width of a card from
+    its top left corner. Text positions are the centre of the line'''
+    total_width: float
+    total_height: float
+    avatars: Tuple[Tuple[float, float], ...]  # Top left, by seat
+    scores: Tuple[Tuple[float, float], ...]
+    cards: Tuple[Tuple[float, float], ...]  # Top left, by seat
+    voters: Tuple[Tuple[float, float], ...]  # Top left of the first voter
+    voter_steps: Tuple[float, ...]  # Between voter pics, by number of voters
+    clue: Tuple[float, float]
+
+@lru_cache(maxsize=256)
+def board_layout(n_players, max_voters=0):
+    '''Returns the BoardLayout of a board of n_players where no card got more
+    than max_voters votes'''
+    total_width, total_height = results_size(n_players)
+    columns = [results_border + card_hor_border + seat*(1 + 2*card_hor_border)
+               for seat in range(n_players)]
+    score_y = results_border + voted_pic_diam + score_height
+    voters_y = score_y + card_aspect_ratio
+    # Stacks of voter pics that would exceed the card width overlap
+    voter_steps = [voter_pic_diam if n_voters < 2 else
+                   min(voter_pic_diam, (1 - voter_pic_diam)/(n_voters - 1))
+                   for n_voters in range(max_voters + 1)]
+    return BoardLayout(
+            total_width=total_width,
+            total_height=total_height,
+            avatars=tuple((x + 1/2 - voted_pic_diam/2, results_border)
+                          for x in columns),
+            scores=tuple((x + 1/2, score_y) for x in columns),
+            cards=tuple((x, score_y) for x in columns),
+            voters=tuple((x, voters_y) for x in columns),
+            voter_steps=tuple(voter_steps),
+            clue=(total_width/2, total_height - results_border))
+
+def board_size(n_players, card_width):
+    '''Size in pixels of the results board, with cards card_width wide'''
+    layout = board_layout(n_players)
+    return (int(card_width*layout.total_width),
+            int(card_width*layout.total_height))
+
+# The font of the results text, looked up once instead of on every render
+font_face = ToyFontFace("Arial", FONT_SLANT_NORMAL, FONT_WEIGHT_NORMAL)
+_extents_size = 100  # Font size at which extents are measured
+
+@lru_cache(maxsize=64)
+def scaled_font(font_size, hint_metrics=True):
+    '''Returns the cached ScaledFont of font_face at font_size (in device
+    units, with an identity CTM)'''
+    options = FontOptions()
+    if not hint_metrics:
+        options.set_hint_metrics(HINT_METRICS_OFF)
+    return ScaledFont(font_face, Matrix(xx=font_size, yy=font_size), Matrix(),
+                      options)
+
+@lru_cache(maxsize=1024)
+def _unit_extents(text):
+    extents = scaled_font(_extents_size, hint_metrics=False).text_extents(text)
+    return TextExtents(*(value/_extents_size for value in extents))
+
+def text_extents(text, font_size):
+    '''Extents of text in font_face at font_size, in user units. Cached, as
+    scores and deltas are drawn from a small alphabet'''
+    return TextExtents(*(value*font_size for value in _unit_extents(text)))
+
+class DigitSprites:
+    '''The score alphabet pre-rendered at one pixel size, as A8 masks. Showing
+    a score is then a few `mask_surface` calls, without text layout'''
+    alphabet = '0123456789+'
+
+    def __init__(self, pixel_size):
+        font = scaled_font(pixel_size)
+        self.glyphs = {}  # {char: (mask, x offset, y offset, x advance)}
+        for char in self.alphabet:
+            extents = font.text_extents(char)
+            mask = ImageSurface(FORMAT_A8, math.ceil(extents.width) + 2,
+                                math.ceil(extents.height) + 2)
+            ctx = Context(mask)
+            ctx.set_scaled_font(font)
+            ctx.move_to(1 - extents.x_bearing, 1 - extents.y_bearing)
+            ctx.show_text(char)
+            mask.flush()
+            self.glyphs[char] = (mask, extents.x_bearing - 1,
+                                 extents.y_bearing - 1, extents.x_advance)
+
+    def advance(self, text):
+        return sum(self.glyphs[char][3] for char in text)
+
+    def show(self, ctx, text, x, y):
+        '''Shows text from the point (x, y) of the baseline, in device units,
+        with the current source'''
+        for char in text:
+            mask, x_offset, y_offset, advance = self.glyphs[char]
+            ctx.mask_surface(mask, round(x + x_offset), round(y + y_offset))
+            x += advance
+
+@lru_cache(maxsize=32)
+def digit_sprites(pixel_size):
+    return DigitSprites(pixel_size)
+
+def show_centered_text(ctx, text, x, y, line_height, extents=None):
+    '''Shows text with the current font, centred on (x, y)'''
+    extents = extents or ctx.text_extents(text)
+    ctx.move_to(x - extents.width/2 - extents.x_bearing,
+                y + (extents.height - line_height)/2)
+    ctx.show_text(text)
+
+def show_score(ctx, score, delta_score, x, y, sprites=False):
+    '''Shows the total score centred on (x, y), followed by the smaller delta
+    score. With `sprites`, they are drawn from pre-rendered digits'''
+    score_text = str(score)
+    delta_text = f'+{delta_score}'
+    extents = text_extents(score_text, score_height)
+    if not sprites:
+        ctx.set_source_rgb(*score_color)
+        ctx.set_font_size(score_height)
+        show_centered_text(ctx, score_text, x, y, score_height, extents)
+        ctx.set_source_rgb(*delta_score_color)
+        ctx.set_font_size(delta_score_height)
+        ctx.show_text(delta_text)
+        return
+
+    # Sprites are drawn in device space, where the board is scaled uniformly
+    scale, _ = ctx.user_to_device_distance(1, 0)
+    x, y = ctx.user_to_device(x - extents.width/2 - extents.x_bearing,
+                              y + (extents.height - score_height)/2)
+    score_sprites = digit_sprites(round(score_height*scale))
+    ctx.save()
+    ctx.identity_matrix()
+    ctx.set_source_rgb(*score_color)
+    score_sprites.show(ctx, score_text, x, y)
+    ctx.set_source_rgb(*delta_score_color)
+    digit_sprites(round(delta_score_height*scale)).show(
+            ctx, delta_text, x + score_sprites.advance(score_text), y)
+    ctx.restore()
 
-    # Draw background
-    draw_background(ctx, int(card_width*total_width), int(card_width*total_height))
-
-    ctx.scale(1/total_width,
-              1/total_height)
-    ctx.select_font_face("Arial",
-                         FONT_SLANT_NORMAL,
-                         FONT_WEIGHT_NORMAL)
-    # Write clue
-    ctx.translate(0, total_height - results_border)
-
-    ctx.set_source_rgb(*clue_color)
-    ctx.set_font_size(clue_height)
-    clue_extents = ctx.text_extents(results.clue)
-    ctx.translate(total_width/2 - clue_extents.width / 2 - clue_extents.x_bearing,
-                  (clue_extents.height-clue_height)/2)
-
-    ctx.show_text(results.clue)
-
-    ctx.translate(-(total_width/2 - clue_extents.width / 2 - clue_extents.x_bearing),
-                  -(clue_extents.height-clue_height)/2)
-    ctx.translate(0, -(total_height - results_border))
-
-    ctx.translate(results_border, results_border)
-    for player in results.players:
-        ctx.translate(card_hor_border, 0)
-
-        # Draw star in storyteller
-        if player == results.storyteller:
-            border_color = storyteller_border_color
-            glow_color = storyteller_glow_color
-            glow_excess = storyteller_glow_excess
-        else:
-            border_color = player_border_color
-            glow_color = None
-            glow_excess = None
-
-        # Draw profile pic above card
-        ctx.translate(1/2 - voted_pic_diam/2, 0)
-        ctx.scale(voted_pic_diam, voted_pic_diam)
-
-        draw_profile_pic(ctx, f'tmp/pic_{player.id}.png',
-                         border_color,
-                         glow_color,
-                         glow_excess)
+def draw_pic(ctx, x, y, diameter, player_id, **kwargs):
+    '''Draws the profile pic of the player with its top left corner at (x, y).
+    The keyword arguments go to draw_profile_pic'''
+    ctx.save()
+    ctx.translate(x, y)
+    ctx.scale(diameter, diameter)
+    draw_profile_pic(ctx, f'tmp/pic_{player_id}.png', **kwargs)
+    ctx.restore()
 
-        ctx.scale(1/voted_pic_diam, 1/voted_pic_diam)
-        ctx.translate(-(1/2 - voted_pic_diam/2), 0)
+def draw_avatar(ctx, x, y, player_id, storyteller=False):
+    '''Draws the profile pic above the card of the player'''
+    if storyteller:
+        draw_pic(ctx, x, y, voted_pic_diam, player_id,
+                 border_color=storyteller_border_color,
+                 glow_color=storyteller_glow_color,
+                 glow_excess=storyteller_glow_excess)
+    else:
+        draw_pic(ctx, x, y, voted_pic_diam, player_id,
+                 border_color=player_border_color)
 
-        # Draw total and delta scores
-        ctx.translate(0, voted_pic_diam + score_height)
+def draw_base(ctx, player_ids):
+    '''Draws the layer of the results board which doesn't change between
+    rounds: the background and the players' profile pics'''
+    layout = board_layout(len(player_ids))
 
-        ctx.set_source_rgb(*score_color)
-        score_text = str(results.score[player])
-        ctx.set_font_size(score_height)
-        score_extents = ctx.text_extents(score_text)
-        ctx.translate(1/2 - score_extents.width / 2 - score_extents.x_bearing,
-                      (score_extents.height-score_height)/2)
+    # Draw background
+    draw_background(ctx, int(card_width*layout.total_width),
+                    int(card_width*layout.total_height))
 
-        ctx.show_text(score_text)
+    ctx.save()
+    ctx.scale(1/layout.total_width, 1/layout.total_height)
+    for (x, y), player_id in zip(layout.avatars, player_ids):
+        draw_avatar(ctx, x, y, player_id)
+    ctx.restore()
 
-        ctx.set_source_rgb(*delta_score_color)
-        delta_score_text = f'+{results.delta_score[player]}'
-        ctx.set_font_size(delta_score_height)
-        ctx.show_text(delta_score_text)
+def round_voters(results):
+    '''Returns the seats that voted for the card of each seat'''
+    voters = [[] for _ in results.player_ids]
+    for voter, voted in enumerate(results.votes):
+        if voted >= 0:
+            voters[voted].append(voter)
+    return voters
 
-        ctx.translate(-(1/2 - score_extents.width / 2 - score_extents.x_bearing),
-                      -(score_extents.height-score_height)/2)
+def draw_table(ctx, results, card_images):
+    '''Draws the parts of the results board that change every round but
+    don't move in its animation: clue, storyteller highlight and cards'''
+    layout = board_layout(results.n_players)
 
+    ctx.save()
+    ctx.scale(1/layout.total_width, 1/layout.total_height)
+    ctx.set_font_face(font_face)
+    # Write clue
+    ctx.set_source_rgb(*clue_color)
+    ctx.set_font_size(clue_height)
+    show_centered_text(ctx, results.clue, *layout.clue, clue_height)
 
-        ctx.translate(0, -(voted_pic_diam + score_height))
+    for seat, player_id in enumerate(results.player_ids):
+        # Draw star in storyteller, over the profile pic in the base layer
+        if seat == results.storyteller:
+            draw_avatar(ctx, *layout.avatars[seat], player_id,
+                        storyteller=True)
 
         # Draw card
-
-        ctx.translate(0, score_height + voted_pic_diam)
+        ctx.save()
+        ctx.translate(*layout.cards[seat])
         ctx.scale(1, card_aspect_ratio)
+        draw_card(ctx, results.cards[seat], card_images)
+        ctx.restore()
+    ctx.restore()
 
-        draw_card(ctx, results.table[player], from_memory=True, card_images=card_images)
-
-        ctx.scale(1, 1/card_aspect_ratio)
-        ctx.translate(0, - (score_height + voted_pic_diam))
-
-        player_voters = [voter for voter, voted in results.votes.items() if voted == player]
-        # Account for when stack of voter pictures would exceed card width
-        voter_translation = min(voter_pic_diam, (1-voter_pic_diam)/(len(player_voters)-1)) \
-                            if len(player_voters) > 1 else voter_pic_diam
-        for voter_n, voter in enumerate(player_voters):
-            ctx.translate(voter_n*(voter_translation),
-                          voted_pic_diam + score_height + card_aspect_ratio)
+# Share of the animation in which the voters move, before the scores tick up
+votes_share = 0.6
 
-            ctx.scale(voter_pic_diam, voter_pic_diam)
-            draw_profile_pic(ctx, f'tmp/pic_{voter.id}.png')
-            ctx.scale(1/voter_pic_diam, 1/voter_pic_diam)
+def ease(t):
+    '''Smoothstep: starts and ends slowly'''
+    return t*t*(3 - 2*t)
 
-            ctx.translate(-voter_n*(voter_translation),
-                          -(voted_pic_diam + score_height + card_aspect_ratio))
+def draw_votes(ctx, results, text_sprites=False, progress=1):
+    '''Draws the scores and the voters below the cards. At `progress` < 1
+    (see animation.py), the voters are on their way from their avatars to
+    the cards and the scores are ticking up'''
+    voters = round_voters(results)
+    layout = board_layout(results.n_players, max(map(len, voters)))
+    votes_progress = ease(min(1, progress/votes_share))
+    score_progress = max(0, (progress - votes_share)/(1 - votes_share))
+    # Voters start centred on their avatars
+    start_offset = (voted_pic_diam - voter_pic_diam)/2
 
-        # Translate to next card
-        ctx.translate(1 + card_hor_border, 0)
-    ctx.translate(-results_border, -results_border)
+    ctx.save()
+    ctx.scale(1/layout.total_width, 1/layout.total_height)
+    ctx.set_font_face(font_face)
+    for seat in range(results.n_players):
+        # Draw total score, followed by the delta score
+        delta_score = round(results.delta_score[seat]*score_progress)
+        show_score(ctx,
+                   results.score[seat] - results.delta_score[seat] + delta_score,
+                   delta_score, *layout.scores[seat], sprites=text_sprites)
+
+        # Draw voters below the card
+        x, y = layout.voters[seat]
+        step = layout.voter_steps[len(voters[seat])]
+        for n, voter in enumerate(voters[seat]):
+            start_x, start_y = layout.avatars[voter]
+            start_x, start_y = start_x + start_offset, start_y + start_offset
+            draw_pic(ctx,
+                     start_x + (x + n*step - start_x)*votes_progress,
+                     start_y + (y - start_y)*votes_progress,
+                     voter_pic_diam, results.player_ids[voter])
+    ctx.restore()
 
-def save_results_pic(results, file, card_images, n=0, card_width=236):
-    '''Saves results picture to file'''
+def draw_round(ctx, results, card_images, text_sprites=False):
+    '''Draws the parts of the results board that change every round: clue,
+    storyteller highlight, scores, cards and voters. With `text_sprites`, the
+    scores are drawn from pre-rendered digits'''
+    draw_table(ctx, results, card_images)
+    draw_votes(ctx, results, text_sprites)
+
+def draw_results(ctx, results, card_images, text_sprites=False):
+    draw_base(ctx, results.player_ids)
+    draw_round(ctx, results, card_images, text_sprites)
+
+
+class RenderContext:
+    '''Per-game cache of the layers of the results board:
+    - The base layer (background and profile pics), which is identical
+      between rounds as long as the players don't change. Players joining
+      from the lobby change the key of the cache, which invalidates it.
+    - The table layer (the base layer, clue, storyteller and cards), which is
+      known once the vote starts. It is drawn during the vote (see
+      `prerender`), so only the votes and scores are left to draw when the
+      round ends.
+    Pre-renders run in a render thread, so the layers are drawn under a
+    lock.'''
+    def __init__(self):
+        self._base = None
+        self._key = None
+        self._table = None
+        self._table_key = None
+        self._lock = threading.RLock()
+
+    def invalidate(self):
+        with self._lock:
+            self._base = None
+            self._key = None
+            self._table = None
+            self._table_key = None
+
+    def base_layer(self, player_ids, width, height):
+        '''Returns the base layer surface, drawing it if needed'''
+        key = (tuple(player_ids), width, height)
+        with self._lock:
+            if key != self._key:
+                surface = ImageSurface(FORMAT_ARGB32, width, height)
+                ctx = Context(surface)
+                ctx.scale(width, height)
+                draw_base(ctx, player_ids)
+                surface.flush()
+                self._base, self._key = surface, key
+            return self._base
+
+    def table_layer(self, results, card_images, width, height):
+        '''Returns the table layer surface of the round, drawing it if
+        needed'''
+        key = (results.player_ids, results.storyteller, results.cards,
+               results.clue, width, height)
+        with self._lock:
+            if key != self._table_key:
+                surface = ImageSurface(FORMAT_ARGB32, width, height)
+                ctx = Context(surface)
+                ctx.set_source_surface(self.base_layer(results.player_ids,
+                                                       width, height))
+                ctx.paint()
+                ctx.scale(width, height)
+                draw_table(ctx, results, card_images)
+                surface.flush()
+                self._table, self._table_key = surface, key
+            return self._table
+
+    def prerender(self, results, card_images, card_width=236):
+        '''Draws the table layer of the board of `save_results_pic`, before
+        the round ends. Of `results`, only the players, storyteller, cards
+        and clue are used, so the results of the round so far will do'''
+        self.table_layer(results, card_images,
+                         *board_size(results.n_players, card_width))
+
+
+# Formats of the encoders that can't store transparency
+opaque_encoders = {'jpeg': 'JPEG'}
+encoders = {'png-fast': 'PNG', 'webp': 'WEBP', **opaque_encoders}
+
+def surface_to_image(surface):
+    '''Wraps the buffer of a cairo ImageSurface in a PIL Image, without an
+    intermediate file. Assumes a little-endian machine, where cairo stores
+    pixels as (premultiplied) BGRA'''
+    surface.flush()
+    size = (surface.get_width(), surface.get_height())
+    stride = surface.get_stride()
+    if surface.get_format() == FORMAT_RGB24:
+        return Image.frombuffer('RGB', size, surface.get_data(), 'raw', 'BGRX',
+                                stride, 1)
+    return Image.frombuffer('RGBA', size, surface.get_data(), 'raw', 'BGRa',
+                            stride, 1)
+
+def encode_surface(surface, file, encoder='png', quality=85):
+    '''Writes surface to file with one of the encoders described in
+    config.py'''
+    if encoder == 'png':
+        surface.write_to_png(file)
+        return
+    if encoder not in encoders:
+        raise ValueError(f'Unsupported encoder: {encoder!r}')
+    image = surface_to_image(surface)
+    if encoder in opaque_encoders:
+        image = image.convert('RGB')
+    if encoder == 'png-fast':
+        image.save(file, 'PNG', compress_level=1)
+    else:
+        image.save(file, encoders[encoder], quality=quality)
+
+def save_results_pic(results, file, card_images, n=0, card_width=236,
+                     render_context=None, encoder='png', quality=85,
+                     text_sprites=False):
+    '''Saves results picture to file, encoded by `encoder` (see config.py).
+    If a RenderContext is given, its cached (or pre-rendered) layers are
+    reused'''
     filename = f'tmp/results_pic_{n}.png'
-    total_width = (1 + 2*card_hor_border)*len(results.players) + 2*results_border
-    total_height = voted_pic_diam + score_height + card_aspect_ratio + voter_pic_diam + clue_height + 2*results_border
+    width, height = board_size(results.n_players, card_width)
 
-    width = int(card_width*total_width)
-    height = int(card_width*total_height)
+    # The board is opaque, so the alpha channel is only kept for PNGs
+    surface_format = FORMAT_RGB24 if encoder in opaque_encoders else FORMAT_ARGB32
+    surface = ImageSurface(surface_format, width, height)
+    ctx = Context(surface)
 
-    surface = ImageSurface(FORMAT_ARGB32, width, height)
+    if render_context is None:
+        ctx.scale(width, height)
+        draw_results(ctx, results, card_images, text_sprites)
+    else:
+        ctx.set_source_surface(render_context.table_layer(
+                results, card_images, width, height))
+        ctx.paint()
+        ctx.scale(width, height)
+        draw_votes(ctx, results, text_sprites)
+
+    encode_surface(surface, file, encoder, quality)
+
+def render_boards(results_list, card_images, pool, render_contexts=None,
+                  encoder='png', quality=85, text_sprites=False):
+    '''Renders the results boards of several tables at once, in `pool` (a
+    concurrent.futures executor). cairo and Pillow release the GIL while
+    drawing and encoding, so threads render in parallel. Returns the encoded
+    boards, in order'''
+    render_contexts = render_contexts or [None]*len(results_list)
+
+    def render(results, render_context):
+        with io.BytesIO() as file:
+            save_results_pic(results, file, card_images,
+                             render_context=render_context, encoder=encoder,
+                             quality=quality, text_sprites=text_sprites)
+            return file.getvalue()
+
+    futures = [pool.submit(render, results, render_context)
+               for results, render_context in zip(results_list,
+                                                  render_contexts)]
+    return [future.result() for future in futures]
+
+# Layout of the compact results picture, in pixels
+compact_card_width = 160
+compact_card_height = round(compact_card_width*card_aspect_ratio)
+compact_width = 520
+compact_margin = 16
+compact_font_size = 18
+compact_line_height = 26
+compact_text_x = 2*compact_margin + compact_card_width
+
+thumbnail_cache_size = 64
+_thumbnails = OrderedDict()  # {image_id: surface}, least recently used first
+
+def card_thumbnail(image_id, card_images):
+    '''Returns the card scaled to the compact layout, caching the most
+    recently used thumbnails'''
+    try:
+        _thumbnails.move_to_end(image_id)
+        return _thumbnails[image_id]
+    except KeyError:
+        pass
+    card_surface = card_surface_from_memory(image_id, card_images)
+    thumbnail = ImageSurface(FORMAT_ARGB32, compact_card_width,
+                             compact_card_height)
+    ctx = Context(thumbnail)
+    ctx.scale(compact_card_width/card_surface.get_width(),
+              compact_card_height/card_surface.get_height())
+    ctx.set_source_surface(card_surface, 0, 0)
+    ctx.paint()
+
+    _thumbnails[image_id] = thumbnail
+    if len(_thumbnails) > thumbnail_cache_size:
+        _thumbnails.popitem(last=False)
+    return thumbnail
+
+def save_compact_pic(results, file, card_images, encoder='png', quality=85):
+    '''Saves a compact results picture to file: the storyteller's card, the
+    clue and the scoreboard'''
+    n_lines = 1 + results.n_players
+    height = 2*compact_margin + max(compact_card_height,
+                                    compact_line_height*n_lines)
+    surface_format = FORMAT_RGB24 if encoder in opaque_encoders else FORMAT_ARGB32
+    surface = ImageSurface(surface_format, compact_width, height)
     ctx = Context(surface)
 
-    ctx.scale(width, height)
+    ctx.scale(compact_width, height)
+    draw_background(ctx, compact_width, height)
+    ctx.identity_matrix()
 
-    draw_results(ctx, results, card_images)
+    thumbnail = card_thumbnail(results.cards[results.storyteller], card_images)
+    ctx.set_source_surface(thumbnail, compact_margin, compact_margin)
+    ctx.paint()
 
-    surface.write_to_png(file)
+    ctx.set_font_face(font_face)
+    ctx.set_font_size(compact_font_size)
+    y = compact_margin + compact_line_height
+    ctx.set_source_rgb(*clue_color)
+    ctx.move_to(compact_text_x, y)
+    ctx.show_text(results.clue)
+    for seat in results.ranking:
+        y += compact_line_height
+        ctx.move_to(compact_text_x, y)
+        ctx.set_source_rgb(*score_color)
+        ctx.show_text(f'{results.score[seat]}  {results.player_names[seat]}')
+        if results.delta_score[seat]:
+            ctx.set_source_rgb(*delta_score_color)
+            ctx.show_text(f'  +{results.delta_score[seat]}')
 
+    encode_surface(surface, file, encoder, quality)
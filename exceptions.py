@@ -39,3 +39,6 @@ class CardHasNoSenderError(GameException):
 
 class VotingError(GameException):
     pass
+
+class TooFewPlayersError(GameException):
+    pass
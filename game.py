@@ -17,12 +17,14 @@
 
 from typing import Optional, List, Mapping, Tuple
 from telegram import User
-from collections import Counter
 from random import shuffle, choice, sample
 from enum import Enum, IntEnum
 from exceptions import *
+from scoring import CompiledRules, TRADITIONAL
 from dataclasses import dataclass
+from contextlib import contextmanager
 from uuid import uuid4, UUID
+from time import time
 import copy
 
 
@@ -57,7 +59,11 @@ class Card:
 
     @property
     def url(self):
-        return f'https://play-dixit.online/cards/card_{self.image_id}.jpg'
+        return card_url(self.image_id)
+
+
+def card_url(image_id):
+    return f'https://play-dixit.online/cards/card_{image_id}.jpg'
 
 
 class Player:
@@ -65,6 +71,7 @@ class Player:
         '''Represents a player taking part in the game'''
         self.user = user
         self.hand = hand or []
+        self._names = {}  # Cache of formatted names, by format spec
         self.first_name = user.first_name
         self.last_name = user.last_name
         self.username = user.username
@@ -86,18 +93,45 @@ class Player:
     def __hash__(self):
         return self.id
 
+    @property
+    def first_name(self):
+        return self._first_name
+
+    @first_name.setter
+    def first_name(self, val):
+        self._first_name = val
+        self._names.clear()
+
+    @property
+    def last_name(self):
+        return self._last_name
+
+    @last_name.setter
+    def last_name(self, val):
+        self._last_name = val
+        self._names.clear()
+
     def __format__(self, spec='full'):
         '''spec has the general form [@][format]['s], meaning:
         @      - Mention the user by id, (off by default)
         format - The name format. One of [full (default), formal, first]
         's     - Use the possessive form of the name (off by default)
+        The formatted names are cached until the player's name changes.
         '''
+        try:
+            return self._names[spec]
+        except KeyError:
+            name = self._names[spec] = self._format_name(spec)
+            return name
+
+    def _format_name(self, spec):
+        '''Builds the name given by `spec`. See `__format__`'''
         # if the spec gets more complex, consider using regex
         form = spec.removeprefix('@').removesuffix("'s")
         mention = spec.startswith('@')
         possessive = spec.endswith("'s")
 
-        if form == 'full':
+        if form == 'full' or form == '':
             name = ' '.join(filter(bool, [self.first_name, self.last_name]))
         elif form == 'formal':
             if self.last_name:
@@ -106,8 +140,6 @@ class Player:
                 name = self.first_name
         elif form == 'first':
             name = self.first_name
-        elif form == '':
-            name = self.__format__()
         else:
             raise ValueError(f'Unsupported format spec: {spec!r}')
 
@@ -125,25 +157,38 @@ class Player:
 
 @dataclass(frozen=True)
 class DixitResults:
-    '''Represent results of a round of Dixit.
-    It has:
-    - List with all players;
-    - Who is the storyteller;
-    - Who voted whom;
-    - Who player which card;
+    '''Immutable snapshot of the results of a round of Dixit, safe to render
+    or store while the game goes on. Players are referred to by their seat,
+    the index in `player_ids`. It has:
+    - Ids and (full) names of the players;
+    - The seat of the storyteller;
+    - The seat each player voted for (-1 for the storyteller);
+    - The image id of the card each player played;
     - What was the clue;
-    - Total points after the round and new points compared to the previous.
+    - Total points after the round and new points compared to the previous;
+    - The seats sorted by total points.
     '''
     game_id: UUID
     game_number: int
     round_number: int
-    players: List[Player]
-    storyteller: Player
-    votes: Mapping[Player, Player]
-    table: Mapping[Player, Card]
+    player_ids: Tuple[int, ...]
+    player_names: Tuple[str, ...]
+    storyteller: int
+    votes: Tuple[int, ...]
+    cards: Tuple[int, ...]
     clue: str
-    score: Mapping[Player, int]
-    delta_score: Mapping[Player, int]
+    score: Tuple[int, ...]
+    delta_score: Tuple[int, ...]
+    ranking: Tuple[int, ...]
+
+    @property
+    def n_players(self):
+        return len(self.player_ids)
+
+    def voters(self, seat):
+        '''Returns the seats of the players who voted for the card of seat'''
+        return [voter for voter, voted in enumerate(self.votes)
+                if voted == seat]
 
 
 class DixitGame:
@@ -159,7 +204,8 @@ class DixitGame:
                  votes: Mapping[Player, Player] = None, # Players' voted storytll
                  end_criterion = EndCriterion.LAST_CARD,
                  end_criterion_number = None,
-                 game_id = None
+                 game_id = None,
+                 scoring_rules = TRADITIONAL
                  ):
         self._stage = stage
         self.players = players or []
@@ -175,10 +221,16 @@ class DixitGame:
         self.discard_pile = []
         self.score = dict.fromkeys(self.players, 0)
         self.delta_score = dict.fromkeys(self.players, 0)
+        self.max_score = 0
+        self.scoring_rules = scoring_rules
         self.lobby = []
         self.round_number = 1
         self.game_number = 1
         self.game_id = game_id or uuid4()
+        self.last_activity = time()  # Updated by `touch`
+        # Updated by `touch`, except in `automatic` plays
+        self.last_human_action = self.last_activity
+        self._automatic = False
 
         if cards is None:
             game_ids = list(range(1, 373))
@@ -205,6 +257,25 @@ class DixitGame:
         if val not in Stage:
             raise ValueError(f'Valid stages are given by the Stage enum class')
         self._stage = val
+        self.touch()
+
+    def touch(self):
+        '''Records that the game had some activity now, and that its players
+        had, unless it was an `automatic` play'''
+        self.last_activity = time()
+        if not self._automatic:
+            self.last_human_action = self.last_activity
+
+    @contextmanager
+    def automatic(self):
+        '''Context of the plays made for the players, when their turn times
+        out. They don't count as an action of the players, so a game everyone
+        left doesn't keep playing itself'''
+        self._automatic = True
+        try:
+            yield
+        finally:
+            self._automatic = False
 
     @property
     def storyteller(self):
@@ -230,13 +301,16 @@ class DixitGame:
     def users(self):
         return [player.user for player in self.players]
 
+    @property
+    def scoring_rules(self):
+        return self._round_delta.rules
+
+    @scoring_rules.setter
+    def scoring_rules(self, rules):
+        self._round_delta = CompiledRules(rules)
+
     def has_ended(self):
-        if self.end_criterion == EndCriterion.LAST_CARD:
-            return len(self.cards) < len(self.players) * self.cards_per_player
-        elif self.end_criterion == EndCriterion.POINTS:
-            return max(self.score.values()) >= self.end_criterion_number
-        elif self.end_criterion == EndCriterion.ROUNDS:
-            return self.round_number >= self.end_criterion_number
+        return end_checks[self.end_criterion](self)
 
     def add_player(self, player):
         '''Adds player to game. Makes it master if there wasn't one.
@@ -245,6 +319,7 @@ class DixitGame:
             2 if the player was added to the lobby because of not enough cards
             3 if the player was added to the players list'''
         player = Player(player) if isinstance(player, User) else player
+        self.touch()
 
         if player in self.players:
             raise UserAlreadyInGameError("Damn you, {user.first_name}! You have "
@@ -330,12 +405,14 @@ class DixitGame:
         if player == self.storyteller:
             raise PlayerIsStorytellerError("As the Storyteller, you have already "
                                            "chosen your card and clue, {player}!")
+        self.touch()
         self.table[player] = card
         if len(self.table) == len(self.players):
             for player, card in self.table.items():
                 player.hand.remove(card)
             # shuffling the table (using shuffle() is more complicated)
-            self.table = dict(sample(self.table.items(), k=len(self.table)))
+            self.table = dict(sample(list(self.table.items()),
+                                     k=len(self.table)))
             self.stage = Stage.VOTE
 
     def voting_turns(self, player, card):
@@ -351,6 +428,7 @@ class DixitGame:
         if player == self.storyteller:
             raise PlayerIsStorytellerError("The Storyteller can't vote, "
                                            "{player}!")
+        self.touch()
         self.votes[player] = sender
         if len(self.votes) == len(self.players)-1:
             self.end_of_round()
@@ -362,36 +440,42 @@ class DixitGame:
         self.count_points()
 
     def get_results(self) -> DixitResults:
-        '''Returns (a deepcopy of) the results in an instance of DixitResults'''
+        '''Returns a snapshot of the results of the round, which doesn't
+        change with the game'''
+        seat_of = {player: seat for seat, player in enumerate(self.players)}
         results = DixitResults(game_id = self.game_id,
                                game_number = self.game_number,
                                round_number = self.round_number,
-                               players = self.players,
-                               storyteller = self.storyteller,
-                               votes = self.votes,
-                               table = self.table,
+                               player_ids = tuple(p.id for p in self.players),
+                               player_names = tuple(p.name
+                                                    for p in self.players),
+                               storyteller = seat_of[self.storyteller],
+                               votes = tuple(seat_of[self.votes[p]]
+                                             if p in self.votes else -1
+                                             for p in self.players),
+                               cards = tuple(self.table[p].image_id
+                                             for p in self.players),
                                clue = self.clue,
-                               score = self.score,
-                               delta_score = self.delta_score
+                               score = tuple(self.score.get(p, 0)
+                                             for p in self.players),
+                               delta_score = tuple(self.delta_score.get(p, 0)
+                                                   for p in self.players),
+                               ranking = tuple(seat_of[p] for p in self.score
+                                               if p in seat_of)
                                )
         return results
 
     def point_counter(self):
-        '''Implements traditional Dixit point-counting'''
-        player_points = Counter(self.votes.values())
-        storyteller = self.storyteller
-        good_hint = len(self.votes) > player_points[storyteller] > 0
-        player_points[storyteller] = 3 if good_hint else 0
-        for player, vote in self.votes.items():
-            player_points[player] += 3*(vote==storyteller) if good_hint else 2
-        for player in self.players:
-            self.delta_score[player] = player_points.get(player, 0)
+        '''Counts the points of the round with the game's scoring rules'''
+        self.delta_score.update(self._round_delta(self.votes, self.storyteller,
+                                                  self.players))
 
     def count_points(self):
         '''Adds delta_score to score, sorts it and goes to LOBBY phase'''
         for player in self.players:
             self.score.setdefault(player, 0)
             self.score[player] += self.delta_score.get(player, 0)
+            self.max_score = max(self.max_score, self.score[player])
         # sort players by score
         self.score = dict(sorted(self.score.items(), key=lambda x: x[1],
                                  reverse=True))
@@ -438,6 +522,7 @@ class DixitGame:
         self.cards = cards
         self._draw_pile = self.cards.copy()
         self.score = dict.fromkeys(self.players, 0)
+        self.max_score = 0
         self.round_number = 1
         self.game_number += 1
         self.discard_pile.clear()
@@ -445,3 +530,15 @@ class DixitGame:
             player.hand.clear()
             self.refill_hand(player)
 
+
+# End criteria checks, by criterion
+end_checks = {
+    EndCriterion.LAST_CARD: lambda game: (len(game.cards) <
+                                          len(game.players)
+                                          * game.cards_per_player),
+    EndCriterion.POINTS: lambda game: (game.max_score >=
+                                       game.end_criterion_number),
+    EndCriterion.ROUNDS: lambda game: (game.round_number >=
+                                       game.end_criterion_number),
+    EndCriterion.ENDLESS: lambda game: False,
+    }
@@ -0,0 +1,65 @@
+from logging.handlers import QueueHandler, QueueListener
+from datetime import datetime, timezone
+from queue import SimpleQueue
+import logging
+import json
+import sys
+
+
+class JsonFormatter(logging.Formatter):
+    '''Formats log records as JSON lines'''
+    def format(self, record):
+        entry = {'time': datetime.fromtimestamp(record.created, timezone.utc)
+                                  .isoformat(timespec='milliseconds'),
+                 'level': record.levelname,
+                 'logger': record.name,
+                 'message': record.getMessage()}
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LazyText:
+    '''Defers building a log message until a handler actually formats it.
+    `build` is called with `args` only if the record is emitted, e.g.
+    logging.info('%s', LazyText(expensive_function, arg))'''
+    def __init__(self, build, *args):
+        self.build = build
+        self.args = args
+
+    def __str__(self):
+        return self.build(*self.args)
+
+
+class RecordQueueHandler(QueueHandler):
+    '''Puts the records in the queue as they are. The stdlib QueueHandler
+    formats them first, on the logging thread, which would build the
+    LazyTexts there and drop the exceptions' tracebacks. The listener's
+    handler formats them instead, so the arguments of a record must not
+    change once it is logged'''
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=logging.INFO, json_lines=False, stream=None,
+                  logging_format='%(asctime)s - %(levelname)s - %(message)s'):
+    '''Makes the root logger put records in a queue, which is written to
+    `stream` (stderr by default) by a background thread, so that handlers
+    never block on log I/O. Returns the started QueueListener, which should be
+    stopped before exiting to flush the remaining records.'''
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if json_lines:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(logging_format))
+
+    log_queue = SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+    root.addHandler(RecordQueueHandler(log_queue))
+
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    return listener
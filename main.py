@@ -1,13 +1,61 @@
-from telegram import User, InlineKeyboardMarkup, InlineKeyboardButton
+from time import perf_counter
+_import_times = [('start', perf_counter())]  # For --profile-startup
+from telegram import (User, Update, Chat, InlineKeyboardMarkup,
+                      InlineKeyboardButton)
 from telegram.ext import (Updater, CommandHandler, InlineQueryHandler,
-                          CallbackQueryHandler, ChosenInlineResultHandler)
+                          CallbackQueryHandler, ChosenInlineResultHandler,
+                          TypeHandler)
 from telegram.error import Unauthorized, InvalidToken
+_import_times.append(('import telegram', perf_counter()))
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+import threading
+import argparse
 import logging
 import sys
 import io
-from game import DixitGame
+import os
+from game import DixitGame, Stage, card_url
 from utils import *
-from draw import save_results_pic
+from debounce import InlineDebouncer
+from broadcast import Broadcaster
+from logs import LazyText, setup_logging
+import config
+from supervisor import run_supervisor
+from storage import MemoryStore, SQLiteStore
+from reaper import (ReapIdleGames, queue_reaping, reap_idle_games,
+                    evict_game)
+from timers import TimerWheel
+from stats import StatsStore
+from tournament import Tournament
+from admission import AdmissionControl
+_import_times.append(("import the bot's modules", perf_counter()))
+
+
+# Message templates, escaped once instead of on every round
+STORYTELLER_TEXT = markdown_escape(' is the storyteller!\n'
+                                   'Please write a clue and click on a card.')
+
+# Exceptions raised by invalid plays, whose messages are sent to the chat
+play_exceptions = (UserNotPlayingError, CardDoesntExistError,
+                   ClueNotGivenError, PlayerNotStorytellerError,
+                   PlayerIsStorytellerError, CardHasNoSenderError, VotingError)
+
+
+class TurnTimeout(Update):
+    '''Update put in the dispatcher's queue when a player's turn times out'''
+    __slots__ = ('game_id', 'game_number', 'round_number', 'stage')
+
+    def __init__(self, chat_id, user, dixit_game):
+        super().__init__(update_id=0)
+        self._effective_chat = Chat(chat_id, Chat.GROUP)
+        self._effective_user = user
+        self.game_id = dixit_game.game_id
+        self.game_number = dixit_game.game_number
+        self.round_number = dixit_game.round_number
+        self.stage = dixit_game.stage
 
 
 @ensure_game(exists=False)
@@ -20,17 +68,19 @@ def new_game_callback(update, context):
     get_profile_pic(context.bot, user.id, size=TelegramPhotoSize.SMALL)
 
     chat = update.effective_chat
-    logging.info(f"NEW GAME - name: {chat.title!r}, id: {chat.id}")
-    logging.info(f'Master - first_name: {user.first_name}, id: {user.id}')
-    print(); logging.info("Stage 0: Lobby!")
+    logging.info('NEW GAME - name: %r, id: %s', chat.title, chat.id)
+    logging.info('Master - first_name: %s, id: %s', user.first_name, user.id)
+    logging.info('Stage 0: Lobby!')
 
     dixit_game = DixitGame(master=user)
     context.chat_data['dixit_game'] = dixit_game
-    context.chat_data['results'] = []
+    index_user(context, user)
+    context.chat_data.pop('render_context', None)
 
     send_message(f"Let's play Dixit!\n"
                  f"The master {dixit_game.master} has created a new game. \n"
-                 "Click /join to join and /start to start playing!",
+                 "Click /join to join and /start to start playing!\n"
+                 f"Other chats can follow it with /watch {chat.id}",
                  update, context,)
 
     send_message('Would you like the game to end based on what?',
@@ -46,6 +96,20 @@ def new_game_callback(update, context):
                            "I don't want it to end!"))])
                  )
 
+    send_message('How would you like to see the results of each round?',
+                 update, context,
+                 reply_markup=InlineKeyboardMarkup.from_column(
+                     [InlineKeyboardButton(
+                         text,
+                         callback_data=f'render settings:{enum}')
+                      for enum, text in zip(
+                          [m.name for m in RenderMode],
+                          ('Full board with every card and vote',
+                           'Scoreboard with the right card',
+                           'Just text, please',
+                           'Animated board, votes flying and all'))])
+                 )
+
 
 @ensure_game(exists=True)
 @ensure_user_inactive
@@ -57,9 +121,10 @@ def join_game_callback(update, context):
 
     user = update.message.from_user
     get_profile_pic(context.bot, user.id, size=TelegramPhotoSize.SMALL)
-    logging.info(f'/join - first_name: {user.first_name}, id: {user.id}')
+    logging.info('/join - first_name: %s, id: %s', user.first_name, user.id)
 
     add_code = dixit_game.add_player(user)
+    index_user(context, user)
     if add_code == 1:
         text = f"Welcome {user.first_name}! Current players are voting. "\
                "You may start playing when a new round begins"
@@ -103,23 +168,90 @@ def start_game_callback(update, context):
 
     dixit_game.start_game(user)  # can no longer log the chosen cards!
     send_message("The game has begun!", update, context)
-    storytellers_turn(update, context)
+    run_plays(storytellers_turn(update, context), update, context)
+
+
+def start_turn_timers(context, players):
+    '''Starts the turn timers of the players of the current stage, if the
+    stage has a timeout. Dummies play immediately, so they have none'''
+    dixit_game = get_game(context)
+    timeout = config.TURN_TIMEOUTS.get(dixit_game.stage.name)
+    if timeout is None:
+        return
+    wheel = context.bot_data['timer_wheel']
+    chat_id = get_chat_id(context)
+    timers = context.dispatcher.chat_data[chat_id].setdefault('turn_timers',
+                                                              {})
+    update_queue = context.dispatcher.update_queue
+    for player in players:
+        if player.id < 0:
+            continue
+        timers[player.id] = wheel.schedule(
+                timeout, update_queue.put,
+                TurnTimeout(chat_id, player.user, dixit_game))
+
+
+def cancel_turn_timer(context, player):
+    '''Cancels the turn timer of a player who has played'''
+    chat_data = get_chat_data(context)
+    timer = chat_data.get('turn_timers', {}).pop(player.id, None)
+    if timer is not None:
+        timer.cancel()
+
+
+@handle_exceptions(*play_exceptions)
+def turn_timeout_callback(update, context):
+    '''Plays a random card for a player whose turn timed out'''
+    try:
+        dixit_game = get_game(context)
+    except KeyError:
+        dixit_game = None
+    if (dixit_game is None
+            or (dixit_game.game_id, dixit_game.game_number,
+                dixit_game.round_number, dixit_game.stage)
+            != (update.game_id, update.game_number, update.round_number,
+                update.stage)):
+        return  # The game has moved on
+    context.chat_data.get('turn_timers', {}).pop(update.effective_user.id,
+                                                 None)
+    player = dixit_game.get_player_by_id(update.effective_user.id)
+    clue = ''
+    if dixit_game.stage == Stage.STORYTELLER:
+        card = random_card(player.hand)
+        clue = 'Time is up!'
+    elif dixit_game.stage == Stage.PLAYERS and player not in dixit_game.table:
+        card = random_card(player.hand)
+    elif dixit_game.stage == Stage.VOTE and player not in dixit_game.votes:
+        card = random_card([card for sender, card in dixit_game.table.items()
+                            if sender != player])
+    else:
+        return
+    logging.info('Turn timeout - %s', player)
+    send_message(f"{player}'s time is up! A random card was chosen.",
+                 update, context)
+    with dixit_game.automatic():
+        run_plays([(player, card, clue)], update, context)
 
 
 def storytellers_turn(update, context):
-    '''Instructs the storyteller to choose a clue and a card'''
+    '''Instructs the storyteller to choose a clue and a card. Returns the
+    dummy plays to be run by `run_plays`'''
     dixit_game = get_game(context)
-    print(); logging.info("Stage 1: Storyteller's turn!")
-    text = ' is the storyteller!\n'\
-           'Please write a clue and click on a card.'
-    send_message(f'{dixit_game.storyteller:@}' + markdown_escape(text),
+    logging.info("Stage 1: Storyteller's turn!")
+    send_message(f'{dixit_game.storyteller:@}' + STORYTELLER_TEXT,
                  update, context,
                  button='Click to see your cards!',
                  parse_mode='MarkdownV2')
+    start_turn_timers(context, [dixit_game.storyteller])
     if dixit_game.storyteller.id < 0:  # If it's a dummy
-        card_id = random_card_from_hand(dixit_game.storyteller)
-        simulate_inline(dixit_game.storyteller.user, card_id, 'Beep Boop',
-                        update, context)
+        card_index = context.bot_data.get('card_index')
+        if card_index is None:
+            card, clue = random_card(dixit_game.storyteller.hand), 'Beep Boop'
+        else:
+            card, clue = card_index.storyteller_play(
+                    dixit_game.storyteller.hand)
+        return [(dixit_game.storyteller, card, clue)]
+    return []
 
 
 def query_callback(update, context):
@@ -129,18 +261,22 @@ def query_callback(update, context):
     if update.callback_query.from_user.id != dixit_game.master.id:
         return
 
-    logging.info(f'Query - {query.data!r}')
+    logging.info('Query - %r', query.data)
 
     setting, value = query.data.split(':')
     if setting == 'play again':
         if value == 'True':
             query.edit_message_text(text='A new game of Dixit begins!')
+            broadcast_message('A new game of Dixit begins!', context)
             dixit_game.restart_game()
-            storytellers_turn(update, context)
+            run_plays(storytellers_turn(update, context), update, context)
         else:
+            unindex_game(context, dixit_game)
             context.chat_data.pop('dixit_game')  # frees game data
             del dixit_game
             query.edit_message_text(text='The game has ended.')
+            broadcast_message('The game has ended.', context)
+            context.bot_data['broadcaster'].drop_game(get_chat_id(context))
         return  # return early to avoid the last lines of query_callback
 
     markup = None
@@ -176,6 +312,14 @@ def query_callback(update, context):
         text = f'Alright! The game will last until the number of '\
                f'{dixit_game.end_criterion.name.lower()} is {number}!'
 
+    if setting == 'render settings':
+        context.chat_data['render_mode'] = RenderMode[value]
+        text = {RenderMode.FULL: 'The full board it is!',
+                RenderMode.COMPACT: 'Short and sweet, scoreboard it is!',
+                RenderMode.TEXT: 'Old school, text it is!',
+                RenderMode.ANIMATED: 'Lights, camera, action! Animated board '
+                                     'it is!'}[RenderMode[value]]
+
     if setting == 'dummy settings':
         dummies_n = int(value)
         for n in range(1, dummies_n+1):
@@ -188,6 +332,7 @@ def query_callback(update, context):
         text = f'{dummies_n} dummies added to the game!\n'\
                 'Please click on /start again'
 
+    dixit_game.touch()  # The settings are stored with the game
     query.answer(text='Settings saved!')
     query.edit_message_text(text=text, reply_markup=markup)
 
@@ -217,12 +362,15 @@ def inline_callback(update, context):
         text = f'{player} is impatient...'
 
     results = [menu_card(card, player, text, clue) for card in cards]
-    update.inline_query.answer(results, cache_time=0)
+    if stage == 1 and player == storyteller:
+        # The storyteller sends a query for every character of the clue
+        debouncer = context.bot_data['inline_debouncer']
+        debouncer.submit(update.inline_query, results, cache_time=0)
+    else:
+        update.inline_query.answer(results, cache_time=0)
 
 
-@handle_exceptions(UserNotPlayingError, CardDoesntExistError,
-        ClueNotGivenError, PlayerNotStorytellerError, PlayerIsStorytellerError,
-        CardHasNoSenderError, VotingError)
+@handle_exceptions(*play_exceptions)
 def inline_choices(update, context):
     '''Processes the cards users choose on inline queries'''
     result = update['chosen_inline_result']
@@ -236,144 +384,407 @@ def inline_choices(update, context):
     player = dixit_game.get_player_by_id(user_id)
     clue = result.query
 
-    logging.info(f'Inline - {user["first_name"]}, card_id: {card_id}' +
-                 f', query: {clue}'*bool(clue))
+    logging.info('Inline - %s, card_id: %s%s', user['first_name'], card_id,
+                 f', query: {clue}' if clue else '')
+    run_plays([(player, card, clue)], update, context)
+
+
+def run_plays(plays, update, context):
+    '''Runs the given (player, card, clue) plays and, iteratively, the dummy
+    plays that follow from them, until a human has to play. In a tournament,
+    each play is made at the table of its player. The messages of invalid
+    plays are sent to the chat'''
+    pending = deque(plays)
+    tournament = get_chat_data(context).get('tournament')
+    n_dummy_plays = 0
+    while pending:
+        player, card, clue = pending.popleft()
+        n_dummy_plays += player.id < 0
+        with (nullcontext() if tournament is None
+              else tournament.seated_at(tournament.seat_of(player.id))):
+            try:
+                pending.extend(play(player, card, clue, update, context))
+            except play_exceptions as e:
+                send_message(exception_text(e, update, context), update,
+                             context)
+    if n_dummy_plays:
+        logging.info('Dummies - %d plays', n_dummy_plays)
+
+
+def dummy_plays(dixit_game, card_index=None):
+    '''Returns the plays of the dummies other than the storyteller in the
+    current stage. They are made by the AI if there is a card index, and at
+    random otherwise'''
+    dummies = [player for player in dixit_game.players
+               if player.id < 0 and player != dixit_game.storyteller]
+    plays = []
+    for dummy in dummies:
+        if dixit_game.stage == Stage.PLAYERS:
+            cards = dummy.hand
+        elif dixit_game.stage == Stage.VOTE:
+            cards = [card for player, card in dixit_game.table.items()
+                     if player != dummy]
+        else:
+            return []
+        if card_index is None:
+            card = random_card(cards)
+        elif dixit_game.stage == Stage.PLAYERS:
+            card = card_index.player_play(cards, dixit_game.clue)
+        else:
+            card = card_index.vote(cards, dixit_game.clue)
+        plays.append((dummy, card, ''))
+    return plays
+
+
+def play(player, card, clue, update, context):
+    '''Plays the card (and clue) of player in the current stage. Returns the
+    dummy plays that follow'''
+    dixit_game = get_game(context)
 
     if dixit_game.stage == 1:
         dixit_game.storyteller_turn(player=player, card=card, clue=clue)
+        cancel_turn_timer(context, player)
 
-        print(); logging.info("Stage 2: Others' turn!")
+        logging.info("Stage 2: Others' turn!")
 
         send_message(f"Now, let the others send their cards!\n"
                      f"{player:full's} clue: *{dixit_game.clue}*",
                      update, context, button='Click to see your cards!',
                      parse_mode='Markdown')
+        start_turn_timers(context, [p for p in dixit_game.players
+                                    if p != dixit_game.storyteller])
 
-        # The dummies among the other players choose random cards from hand
-        other_dummy_players = (player for player in dixit_game.players
-                               if player.id < 0
-                               and player != dixit_game.storyteller)
-        for dummy in other_dummy_players:
-            card_id = random_card_from_hand(dummy)
-            simulate_inline(dummy.user, card_id, '', update, context)
+        # The dummies among the other players choose cards from hand
+        return dummy_plays(dixit_game, context.bot_data.get('card_index'))
 
     elif dixit_game.stage == 2:
         dixit_game.player_turns(player=player, card=card)
+        cancel_turn_timer(context, player)
 
-        logging.info(f"Table - ({len(dixit_game.table)}/"
-                     f"{len(dixit_game.players)}) cards")
+        logging.debug('Table - (%d/%d) cards', len(dixit_game.table),
+                      len(dixit_game.players))
         if dixit_game.stage == 3:
-            print(); logging.info("Stage 3: Vote!")
+            logging.info('Stage 3: Vote!')
             send_message(f"Hear ye, hear ye! Time to vote!\n"
                          f"{dixit_game.storyteller:full's}"
                          f" clue: *{dixit_game.clue}*",
                          update, context, button='Click to see the table!',
                          parse_mode='Markdown')
+            broadcast_message(f"{dixit_game.storyteller:full's} clue: "
+                              f"*{dixit_game.clue}*", context,
+                              parse_mode='Markdown')
+            start_turn_timers(context, [p for p in dixit_game.players
+                                        if p != dixit_game.storyteller])
+            prefetch_cards(dixit_game, context)
+            prerender_board(dixit_game, context)
 
-            # The dummies among the other players choose random cards from table
-            other_dummy_players = (player for player in dixit_game.players
-                                   if player.id < 0
-                                   and player != dixit_game.storyteller)
-            for dummy in other_dummy_players:
-                others_cards = [card for player, card in dixit_game.table.items()
-                                if player != dummy]
-                card_id = random_card_id(dummy, others_cards)
-                simulate_inline(dummy.user, card_id, '', update, context)
+            # The dummies among the other players choose cards from table
+            return dummy_plays(dixit_game, context.bot_data.get('card_index'))
 
     elif dixit_game.stage == 3:
         dixit_game.voting_turns(player=player, card=card)
+        cancel_turn_timer(context, player)
 
-        logging.info(f"Table - ({len(dixit_game.votes)}/"
-                     f"{len(dixit_game.players) - 1}) votes")
+        logging.debug('Table - (%d/%d) votes', len(dixit_game.votes),
+                      len(dixit_game.players) - 1)
         if dixit_game.stage == 0:
-            end_of_round(update, context)
-
-
-def simulate_inline(user, result_id, query, update, context):
-    '''Simulates the choice of an inline option by calling inline_choices'''
-    fake_result = type('Result', (object,), {'from_user': user,
-                       'result_id': result_id, 'query': query})
-    update.chosen_inline_result = fake_result
-    inline_choices(update, context)
+            return end_of_round(update, context)
+    return []
 
 
 def show_results_text(results, update, context):
     '''Sends the image of the correct answer and send a message with
     who voted for whom.'''
-    storyteller_card = results.table[results.storyteller]
+    names = results.player_names
     score = results.score
     delta_score = results.delta_score
 
     send_message('The correct answer was...', update, context)
-    send_photo(storyteller_card.url, update, context)
+    message = send_photo(card_url(results.cards[results.storyteller]),
+                         update, context)
+    broadcast_photo(message, context, caption='The correct answer was...')
 
-    results_text = '\n'.join([f'{player}:  {total_pts} ' +
-                              f'(+{delta_pts})' if delta_pts else ''
-                              for (player, total_pts), delta_pts
-                              in zip(score.items(), delta_score.values())])
+    results_text = '\n'.join([f'{names[seat]}:  {score[seat]}' +
+                              (f' (+{delta_score[seat]})'
+                               if delta_score[seat] else '')
+                              for seat in results.ranking])
     vote_list = []
     grouped_votes = {}
-    for voter, voted in results.votes.items():
-        grouped_votes.setdefault(voted, []).append(voter)
+    for voter, voted in enumerate(results.votes):
+        if voted >= 0:
+            grouped_votes.setdefault(voted, []).append(voter)
     for voted, voters in grouped_votes.items():
-        vote_list.append(f'{voters[0]} \u27f6 {voted}') # bash can't handle char
+        vote_list.append(f'{names[voters[0]]} \u27f6 {names[voted]}') # bash can't handle char
         for voter in voters[1:]:
-            vote_list.append(str(voter))
+            vote_list.append(names[voter])
         vote_list.append('')
     votes_text = '\n'.join(vote_list)
 
     send_message(results_text, update, context)
     send_message(votes_text, update, context)
-
-
-def show_results_pic(results, update, context):
-    '''Sends results pic'''
-    card_images = context.bot_data["card_images"]
+    broadcast_message(results_text, context)
+    broadcast_message(votes_text, context)
+
+
+def show_results_pic(results, update, context, compact=False, animated=False):
+    '''Sends results pic. If `compact`, sends just the storyteller's card and
+    the scoreboard. If `animated`, sends the animated board instead, unless
+    it takes longer than config.ANIMATION_BUDGET seconds (see animation.py)'''
+    # Imported on first render, to start up faster
+    from draw import save_results_pic, save_compact_pic
+    from animation import show_animation
+    card_images = get_card_images(context)
     dixit_game = get_game(context)
     n = f'{dixit_game.game_number}.{dixit_game.round_number}'
+    render_context = get_render_context(dixit_game, context)
+    if animated:
+        wait_for_animation = show_animation(
+                results, card_images, context.bot_data['animation_pool'],
+                config.ANIMATION_BUDGET, n_frames=config.ANIMATION_FRAMES,
+                frame_duration=config.ANIMATION_FRAME_DURATION,
+                hold=config.ANIMATION_HOLD)
+    # The static board is rendered meanwhile, in case the animation is late
     with io.BytesIO() as file:
-        save_results_pic(results, file, card_images, n=n) 
+        if compact:
+            save_compact_pic(results, file, card_images,
+                             encoder=config.RESULTS_ENCODER,
+                             quality=config.RESULTS_QUALITY)
+        else:
+            save_results_pic(results, file, card_images, n=n,
+                             render_context=render_context,
+                             encoder=config.RESULTS_ENCODER,
+                             quality=config.RESULTS_QUALITY,
+                             text_sprites=config.TEXT_SPRITES)
+        animation = wait_for_animation() if animated else None
+        if animation is not None:
+            message = send_animation(animation, update, context)
+            broadcast_animation(message, context)
+            return
+        if animated:
+            logging.info('Results - No animation in time, sending the board')
         file.seek(0) # Rewind file pointer to beginning
-        send_photo(file, update, context)
+        message = send_photo(file, update, context)
+    broadcast_photo(message, context)
+
+
+def prefetch_cards(dixit_game, context):
+    '''Starts fetching the cards on the table into the card cache, if the
+    cards come from the card host (see cards.py)'''
+    card_images = context.bot_data.get('card_images')
+    if config.CARD_SOURCE == 'web' and card_images is not None:
+        card_images.prefetch(card.image_id
+                             for card in dixit_game.table.values())
+
+
+def cards_ready(results_list, context):
+    '''Whether the cards of the rounds can be drawn. Waits for them if they
+    are still being fetched, at most config.CARD_FETCH_TIMEOUT seconds'''
+    if config.CARD_SOURCE != 'web':
+        return True
+    card_images = get_card_images(context)
+    image_ids = [image_id for results in results_list
+                 for image_id in results.cards]
+    if card_images.wait(image_ids, config.CARD_FETCH_TIMEOUT):
+        return True
+    logging.warning('Cards - Missing cards of %s', image_ids)
+    return False
+
+
+def get_render_context(dixit_game, context):
+    '''Returns the RenderContext of the game, or of the tournament table'''
+    from draw import RenderContext
+    chat_data = get_chat_data(context)
+    tournament = chat_data.get('tournament')
+    if tournament is None:
+        return chat_data.setdefault('render_context', RenderContext())
+    render_contexts = chat_data.setdefault(
+            'render_contexts', [RenderContext() for _ in tournament.tables])
+    return render_contexts[tournament.table_number(dixit_game) - 1]
+
+
+def prerender_board(dixit_game, context):
+    '''Starts drawing, in a render thread, the parts of the results board
+    known once the vote starts (see `draw.RenderContext.prerender`), so that
+    only the votes and scores are left when the round ends'''
+    render_mode = get_chat_data(context).get('render_mode', RenderMode.FULL)
+    if render_mode not in (RenderMode.FULL, RenderMode.ANIMATED):
+        return
+    results = dixit_game.get_results()  # The votes and scores are missing
+    render_context = get_render_context(dixit_game, context)
+
+    def prerender():
+        try:
+            if cards_ready([results], context):
+                render_context.prerender(results, get_card_images(context))
+        except Exception:
+            # The board is drawn in full at the end of the round instead
+            logging.exception('Results - Could not pre-render the board')
+    context.bot_data['render_pool'].submit(prerender)
+
+
+def admit_boards(context, boards=1):
+    '''Whether the chat may have its results boards now, or should get the
+    results as text because the bot is overloaded (see admission.py)'''
+    admission = context.bot_data['admission']
+    chat_id = get_chat_id(context)
+    if admission.admit(chat_id, context.dispatcher.update_queue.qsize(),
+                       boards):
+        return True
+    logging.warning('Results - Overloaded, sending text to chat %s: %s',
+                    chat_id, admission.stats())
+    return False
+
+
+@contextmanager
+def admitted_boards(context, boards=1):
+    '''Renders and sends the boards admitted by admit_boards, timing them'''
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        context.bot_data['admission'].done(get_chat_id(context),
+                                           perf_counter() - start, boards)
+
+
+def log_load(context):
+    '''Logs the metrics of the admission control and the broadcaster'''
+    logging.info('Load - admission: %s, broadcaster: %s',
+                 context.bot_data['admission'].stats(),
+                 context.bot_data['broadcaster'].stats())
+
+
+def results_log(results):
+    '''Describes the results of the round, one player per line'''
+    lines = []
+    names = results.player_names
+    for seat, name in enumerate(names):
+        score = results.score[seat]
+        delta = results.delta_score[seat]
+        if seat == results.storyteller:
+            lines.append(f'\t{name:<20} - {score} (+{delta}), '
+                         'was the Storyteller')
+        else:
+            lines.append(f'\t{name:<20} - {score} (+{delta}), '
+                         f'(voted for {names[results.votes[seat]]})')
+    return '\n'.join(lines)
 
 
 def end_of_round(update, context):
-    '''Counts points, resets the appropriate variables for the next round'''
-    print(); logging.info('Stage 0: Lobby!')
+    '''Counts points, resets the appropriate variables for the next round.
+    Returns the dummy plays of the next round'''
+    logging.info('Stage 0: Lobby!')
 
     dixit_game = get_game(context)
     results = dixit_game.get_results()
-    log = 'Results -\n'
-    for player in results.players:
-        score = results.score[player]
-        delta = results.delta_score[player]
-        is_st = player==results.storyteller
-        vote = results.votes[player] if not is_st else None
-        log += f'\t{player.name:<20} - {score} (+{delta}), ' \
-               + (f'(voted for {vote})' if not is_st else 'was the Storyteller')\
-               + '\n'
-    logging.info(log.strip())
-
-    show_results_pic(results, update, context)
-    logging.info('Results - Sent image')
+    logging.info('Results -\n%s', LazyText(results_log, results))
+    chat_id = get_chat_id(context)
+    stats = context.bot_data['stats']
+    stats.record_round(chat_id, results)
+
+    tournament = get_chat_data(context).get('tournament')
+    if tournament is not None:
+        return end_of_tournament_round(tournament, dixit_game, results,
+                                       update, context)
+
+    render_mode = get_chat_data(context).get('render_mode', RenderMode.FULL)
+    if (render_mode == RenderMode.TEXT or not cards_ready([results], context)
+            or not admit_boards(context)):
+        show_results_text(results, update, context)
+        logging.info('Results - Sent text')
+    else:
+        with admitted_boards(context):
+            show_results_pic(results, update, context,
+                             compact=render_mode == RenderMode.COMPACT,
+                             animated=render_mode == RenderMode.ANIMATED)
+        logging.info('Results - Sent image')
 
     if dixit_game.has_ended():
+        stats.record_game_end(chat_id, results)
         end_game(results, update, context)
+        return []
 
     else:
         dixit_game.new_round()
-        storytellers_turn(update, context)
+        return storytellers_turn(update, context)
+
+
+def end_of_tournament_round(tournament, dixit_game, results, update,
+                            context):
+    '''Waits for every table to finish the round, then shows the results of
+    all tables and starts their next round (or ends the tournament). Returns
+    the dummy plays of the next round of every table'''
+    table_number = tournament.table_number(dixit_game)
+    if not tournament.finish_round(dixit_game, results):
+        send_message(f'Table {table_number} has finished the round! Waiting '
+                     'for the other tables...', update, context)
+        return []
+
+    results_list = tournament.next_round()
+    boards = len(results_list)
+    if cards_ready(results_list, context) and admit_boards(context, boards):
+        with admitted_boards(context, boards):
+            show_tournament_boards(results_list, tournament, update, context)
+    else:
+        for results in results_list:
+            show_results_text(results, update, context)
+
+    if tournament.has_ended():
+        end_tournament(tournament, results_list, update, context)
+        return []
+
+    plays = []
+    for table in tournament.tables:
+        with tournament.seated_at(table):
+            table.new_round()
+            plays.extend(storytellers_turn(update, context))
+    return plays
+
+
+def show_tournament_boards(results_list, tournament, update, context):
+    '''Renders the results boards of every table at once and sends them'''
+    logging.info('Tournament - rendering %d boards', len(results_list))
+    from draw import render_boards
+    render_contexts = [get_render_context(table, context)
+                       for table in tournament.tables]
+    boards = render_boards(results_list, get_card_images(context),
+                           context.bot_data['render_pool'], render_contexts,
+                           encoder=config.RESULTS_ENCODER,
+                           quality=config.RESULTS_QUALITY,
+                           text_sprites=config.TEXT_SPRITES)
+    for n, board in enumerate(boards, 1):
+        message = send_photo(board, update, context, caption=f'Table {n}')
+        broadcast_photo(message, context, caption=f'Table {n}')
+
+
+def end_tournament(tournament, results_list, update, context):
+    '''Shows the final standings and frees the tournament'''
+    chat_id = get_chat_id(context)
+    stats = context.bot_data['stats']
+    for table, results in zip(tournament.tables, results_list):
+        stats.record_game_end(chat_id, results)
+        unindex_game(context, table)
+    lines = [f'{n}. {player} - {score}' for n, (player, score)
+             in enumerate(tournament.standings(), 1)]
+    text = 'The tournament has ended! 🏆\n' + '\n'.join(lines)
+    send_message(text, update, context)
+    broadcast_message(text, context)
+    context.bot_data['broadcaster'].drop_game(chat_id)
+    chat_data = get_chat_data(context)
+    chat_data.pop('tournament')
+    chat_data.pop('render_contexts', None)
 
 
 def end_game(results, update, context):
-    max_score = max(results.score.values())
-    winners = [p.name for p in results.score if results.score[p]==max_score]
+    max_score = max(results.score)
+    winners = [results.player_names[seat] for seat in results.ranking
+               if results.score[seat]==max_score]
     if len(winners) == 1:
         text = f'{winners[0]} has won the game! 🎉'
     else:
         text = ', '.join(winners[:-1]) + ' and ' + winners[-1]\
                + ' have won the game! 🎉'
     send_message(text, update, context)
+    broadcast_message(text, context)
     send_message('Shall we play another match?', update, context,
                  reply_markup=InlineKeyboardMarkup.from_column(
                      [InlineKeyboardButton(
@@ -383,15 +794,189 @@ def end_game(results, update, context):
                  )
 
 
-def run_bot(token):
-    '''Tells the bot to use the functions we've defined, starts the main loop'''
-    updater = Updater(token, use_context=True)
-    dispatcher = updater.dispatcher 
+@ensure_game(exists=False)
+@ensure_user_inactive
+def new_tournament_callback(update, context):
+    '''Runs when /tournament is called. Creates a tournament with the master'''
+    user = update.message.from_user
+    if 'tournament' in context.chat_data:
+        send_message(f"Damn you, {user.first_name}! There's a tournament in "
+                     "progress already!", update, context)
+        return
+    set_game(context)
+    get_profile_pic(context.bot, user.id, size=TelegramPhotoSize.SMALL)
+    logging.info('NEW TOURNAMENT - chat id: %s, master id: %s',
+                 update.effective_chat.id, user.id)
+
+    tournament = Tournament(user, table_size=config.TOURNAMENT_TABLE_SIZE,
+                            n_rounds=config.TOURNAMENT_ROUNDS)
+    context.chat_data['tournament'] = tournament
+    index_user(context, user)
+    send_message(f"Let's play a Dixit tournament!\n"
+                 f"The master {tournament.master} has created it. Click "
+                 "/jointournament to take part, and /starttournament to seat "
+                 "the players at tables and start playing! The master can "
+                 "stop it with /canceltournament.\n"
+                 f"Other chats can follow it with /watch "
+                 f"{update.effective_chat.id}",
+                 update, context)
+
+
+@ensure_user_inactive
+def join_tournament_callback(update, context):
+    '''Runs when /jointournament is called. Adds the user to the tournament'''
+    user = update.message.from_user
+    tournament = context.chat_data.get('tournament')
+    if tournament is None:
+        send_message(f"Damn you, {user.first_name}! First, create a "
+                     "tournament with /tournament!", update, context)
+        return
+    try:
+        tournament.add_player(user)
+    except (UserAlreadyInGameError, GameAlreadyStartedError) as e:
+        send_message(str(e).format(user=user), update, context)
+        return
+    set_game(context)
+    get_profile_pic(context.bot, user.id, size=TelegramPhotoSize.SMALL)
+    index_user(context, user)
+    send_message(f"{user.first_name} was added to the tournament!",
+                 update, context)
+
+
+def start_tournament_callback(update, context):
+    '''Runs when /starttournament is called. Seats the players and starts
+    the first round at every table'''
+    user = update.message.from_user
+    tournament = context.chat_data.get('tournament')
+    if tournament is None:
+        send_message(f"Damn you, {user.first_name}! First, create a "
+                     "tournament with /tournament!", update, context)
+        return
+    try:
+        tournament.start(user)
+    except (UserIsNotMasterError, GameAlreadyStartedError,
+            TooFewPlayersError) as e:
+        send_message(str(e).format(user=user, dixit_game=tournament),
+                     update, context)
+        return
+
+    seating = '\n'.join(f'Table {n}: ' + ', '.join(map(str, table.players))
+                        for n, table in enumerate(tournament.tables, 1))
+    send_message(f'The tournament has begun!\n{seating}', update, context)
+    plays = []
+    for table in tournament.tables:
+        with tournament.seated_at(table):
+            plays.extend(storytellers_turn(update, context))
+    run_plays(plays, update, context)
+
+
+def cancel_tournament_callback(update, context):
+    '''Runs when /canceltournament is called by the master. Ends the
+    tournament, started or not, and frees its players'''
+    user = update.message.from_user
+    tournament = context.chat_data.get('tournament')
+    if tournament is None:
+        send_message(f"Damn you, {user.first_name}! There's no tournament "
+                     "to cancel!", update, context)
+        return
+    if user.id != tournament.master.id:
+        send_message(f"Damn you, {user.first_name}! You are not the master "
+                     f"{tournament.master}!", update, context)
+        return
+    logging.info('Tournament - cancelled in chat %s', update.effective_chat.id)
+    text = 'The tournament was cancelled.'
+    send_message(text, update, context)
+    broadcast_message(text, context)
+    evict_game(context.dispatcher, update.effective_chat.id)
+
+
+def watch_callback(update, context):
+    '''Runs when /watch <chat id> is called. Makes the chat a spectator of
+    the game of another chat'''
+    chat_id = update.effective_chat.id
+    try:
+        [game_chat_id] = map(int, context.args)
+    except ValueError:
+        update.message.reply_text('Which game? Use /watch followed by the '
+                                  'number given when the game was created')
+        return
+    game_data = context.dispatcher.chat_data.get(game_chat_id, {})
+    if game_chat_id == chat_id or not ('dixit_game' in game_data
+                                       or 'tournament' in game_data):
+        update.message.reply_text("There's no game to watch there!")
+        return
+    context.bot_data['broadcaster'].subscribe(game_chat_id, chat_id)
+    logging.info('Watch - chat %s watches chat %s', chat_id, game_chat_id)
+    update.message.reply_text("You're watching the game! The results of each "
+                              "round will be shown here. /unwatch to stop")
+
+
+def unwatch_callback(update, context):
+    '''Runs when /unwatch is called. Stops watching a game'''
+    broadcaster = context.bot_data['broadcaster']
+    if broadcaster.unsubscribe(update.effective_chat.id) is None:
+        update.message.reply_text("You aren't watching any game!")
+    else:
+        update.message.reply_text('You stopped watching the game')
+
+
+def stats_callback(update, context):
+    '''Runs when /stats is called. Shows the user's statistics, overall and
+    in this chat'''
+    stats = context.bot_data['stats']
+    user = update.effective_user
+    lines = []
+    for title, player_stats in (
+            ('Overall', stats.get_player(user.id)),
+            ('In this chat', stats.get_player(user.id,
+                                              update.effective_chat.id))):
+        if player_stats is None:
+            continue
+        lines.append(f'{title}:\n'
+                     f'  Games won: {player_stats.wins}/{player_stats.games} '
+                     f'({player_stats.win_rate:.0%})\n'
+                     f'  Rounds: {player_stats.rounds}, '
+                     f'points: {player_stats.points}\n'
+                     f'  Storyteller successes: '
+                     f'{player_stats.storyteller_successes}/'
+                     f'{player_stats.storyteller_rounds} '
+                     f'({player_stats.storyteller_success_rate:.0%})')
+    if not lines:
+        update.message.reply_text(f"{user.first_name} hasn't played yet!")
+        return
+    update.message.reply_text(f'Statistics of {user.first_name}\n'
+                              + '\n'.join(lines))
 
+
+def leaderboard_callback(update, context):
+    '''Runs when /leaderboard is called. Shows the best players of the chat'''
+    stats = context.bot_data['stats']
+    leaderboard = stats.leaderboard(update.effective_chat.id)
+    if not leaderboard:
+        update.message.reply_text('No games have been played here yet!')
+        return
+    lines = [f'{n}. {player_stats.name} - {player_stats.wins} wins, '
+             f'{player_stats.points} points'
+             for n, (_, player_stats) in enumerate(leaderboard, 1)]
+    update.message.reply_text('Leaderboard\n' + '\n'.join(lines))
+
+
+def setup_dispatcher(dispatcher, job_queue, user_index=None,
+                     watch_index=None):
+    '''Tells the dispatcher to use the functions we've defined. The user and
+    watch indices are shared by the workers when running under a supervisor'''
     # Add commands handlers
     command_callbacks = {'newgame': new_game_callback,
                          'join': join_game_callback,
-                         'start': start_game_callback}
+                         'start': start_game_callback,
+                         'tournament': new_tournament_callback,
+                         'jointournament': join_tournament_callback,
+                         'starttournament': start_tournament_callback,
+                         'canceltournament': cancel_tournament_callback,
+                         'watch': watch_callback,
+                         'unwatch': unwatch_callback,
+                         'stats': stats_callback,
+                         'leaderboard': leaderboard_callback}
     for name, callback in command_callbacks.items():
         dispatcher.add_handler(CommandHandler(name, callback))
 
@@ -405,28 +990,185 @@ def run_bot(token):
     # Add ChosenInlineResultHandler, to get the user choices made inline
     dispatcher.add_handler(ChosenInlineResultHandler(inline_choices))
 
-    # Load card images into memory
-    dispatcher.bot_data["card_images"] = load_cards()
+    # Coalesce the storyteller's inline queries while the clue is typed
+    dispatcher.bot_data['inline_debouncer'] = InlineDebouncer(job_queue)
+
+    # Fan-out of the games' updates to the chats watching them
+    dispatcher.bot_data['broadcaster'] = Broadcaster(
+            job_queue, config.BROADCAST_BATCH_SIZE, config.BROADCAST_INTERVAL,
+            config.BROADCAST_MAX_QUEUE, watch_index)
+
+    # Results boards are only rendered while the bot isn't overloaded
+    dispatcher.bot_data['admission'] = AdmissionControl(
+            config.ADMISSION_MAX_RENDERS, config.ADMISSION_MAX_BACKLOG,
+            config.ADMISSION_MAX_LATENCY, config.ADMISSION_WINDOW,
+            config.ADMISSION_FAIR_INTERVAL, config.ADMISSION_MAX_SEND_LATENCY,
+            config.ADMISSION_MAX_SEND_RATE)
+    job_queue.run_repeating(log_load, config.LOAD_LOG_INTERVAL)
+
+    # Index of the chat of the game each user is playing
+    dispatcher.bot_data['user_index'] = {} if user_index is None else user_index
+
+    # Load games from the game store before the handlers, save them after
+    if config.GAME_STORE is not None:
+        if config.GAME_STORE == 'memory':
+            store = MemoryStore()
+        elif config.GAME_STORE.startswith('sqlite:'):
+            store = SQLiteStore(config.GAME_STORE.removeprefix('sqlite:'),
+                                bot=dispatcher.bot)
+            job_queue.run_repeating(lambda context: store.flush(), 1)
+        else:
+            raise ValueError(f'Invalid GAME_STORE: {config.GAME_STORE!r}')
+        dispatcher.bot_data['game_store'] = store
+        dispatcher.add_handler(TypeHandler(Update, load_game_callback),
+                               group=-1)
+        dispatcher.add_handler(TypeHandler(Update, save_game_callback),
+                               group=1)
+
+    # Turn timers of every game, on a single timer wheel
+    wheel = TimerWheel(config.TURN_TIMER_RESOLUTION)
+    dispatcher.bot_data['timer_wheel'] = wheel
+    job_queue.run_repeating(lambda context: wheel.advance(), wheel.resolution)
+    dispatcher.add_handler(TypeHandler(TurnTimeout, turn_timeout_callback,
+                                       strict=True))
+
+    # Close idle games periodically
+    timeouts = {Stage[stage]: 60*minutes
+                for stage, minutes in config.IDLE_TIMEOUTS.items()}
+    job_queue.run_repeating(queue_reaping, config.REAPER_INTERVAL,
+                            context=(timeouts, config.SPILL_DIR))
+    dispatcher.add_handler(TypeHandler(ReapIdleGames, reap_idle_games,
+                                       strict=True))
+
+    # Let the dummies play with the AI, if the card index was built
+    if config.CARD_INDEX is not None and os.path.exists(config.CARD_INDEX):
+        from ai import CardIndex  # Needs numpy
+        dispatcher.bot_data['card_index'] = CardIndex(config.CARD_INDEX)
+
+    # Statistics of the rounds played, in a database shared by the workers
+    dispatcher.bot_data['stats'] = StatsStore(config.STATS_DB)
+
+    # Threads rendering the results boards of the tables of tournaments, and
+    # pre-rendering the boards (see prerender_board). They aren't metered by
+    # the admission control, which counts the tournament boards it admits
+    dispatcher.bot_data['render_pool'] = ThreadPoolExecutor(
+            config.RENDER_WORKERS, thread_name_prefix='render')
+
+    # Processes rendering the animated results boards (see animation.py),
+    # spawned rather than forked, as this process runs threads. Their jobs
+    # count in the admission control
+    spawn = multiprocessing.get_context('spawn')
+    admission = dispatcher.bot_data['admission']
+    dispatcher.bot_data['animation_pool'] = admission.meter(
+            ProcessPoolExecutor(config.ANIMATION_WORKERS, mp_context=spawn))
+
+    # The card images are loaded by warm_up, once the bot is running
+    dispatcher.bot_data['cards_loaded'] = threading.Event()
+
+
+def warm_up(bot_data):
+    '''Imports the drawing modules (cairo and Pillow) and loads the card
+    images into memory (or opens the card cache, see config.CARD_SOURCE),
+    which the first results board needs. Returns the time each step took'''
+    timings = {}
+    start = perf_counter()
+    import draw, animation
+    timings['import draw, animation'] = perf_counter() - start
+
+    start = perf_counter()
+    try:
+        if config.CARD_SOURCE == 'web':
+            from cards import CardCache  # Imports urllib, only needed here
+            bot_data['card_images'] = CardCache(config.CARD_CACHE_DIR,
+                                                config.CARD_FETCH_WORKERS,
+                                                config.CARD_FETCH_TIMEOUT)
+        else:
+            bot_data['card_images'] = load_cards()
+    finally:
+        # Renders waiting for the cards fail instead of hanging if they
+        # couldn't be loaded
+        bot_data['cards_loaded'].set()
+    timings['load cards'] = perf_counter() - start
+    logging.info('Warm-up - %s', ', '.join(f'{step}: {1000*seconds:.0f} ms'
+                                           for step, seconds in timings.items()))
+    return timings
+
+
+def start_warm_up(bot_data):
+    '''Runs warm_up in the background, while the bot handles updates'''
+    threading.Thread(target=warm_up, args=(bot_data,), name='warm-up',
+                     daemon=True).start()
+
+
+def run_bot(token):
+    '''Sets up the bot in this process, starts the main loop'''
+    updater = Updater(token, use_context=True)
+    setup_dispatcher(updater.dispatcher, updater.job_queue)
 
     # Start the bot
     updater.start_polling()
+    start_warm_up(updater.dispatcher.bot_data)
     updater.idle()
 
+    updater.dispatcher.bot_data['render_pool'].shutdown()
+    updater.dispatcher.bot_data['animation_pool'].shutdown()
+    updater.dispatcher.bot_data['stats'].close()
+    store = updater.dispatcher.bot_data.get('game_store')
+    if store is not None:
+        store.close()
+
+
+def profile_startup(token):
+    '''Prints how long each step of the startup takes, up to polling, and
+    then the warm-up, without polling. For a breakdown of the imports by
+    module, run `python -X importtime main.py --profile-startup`'''
+    timings = {step: end - start for (_, start), (step, end)
+               in zip(_import_times, _import_times[1:])}
+    start = perf_counter()
+    updater = Updater(token, use_context=True)
+    timings['Updater'] = perf_counter() - start
+    start = perf_counter()
+    setup_dispatcher(updater.dispatcher, updater.job_queue)
+    timings['setup_dispatcher'] = perf_counter() - start
+    ready = sum(timings.values())
+    warm_up_timings = warm_up(updater.dispatcher.bot_data)
+    updater.dispatcher.bot_data['render_pool'].shutdown()
+    updater.dispatcher.bot_data['animation_pool'].shutdown()
+
+    for step, seconds in timings.items():
+        print(f'{step:<32} {1000*seconds:>8.1f} ms')
+    print(f'{"Ready to poll":<32} {1000*ready:>8.1f} ms')
+    for step, seconds in warm_up_timings.items():
+        print(f'{"Warm-up: " + step:<32} {1000*seconds:>8.1f} ms')
+
 
 if __name__ == '__main__':
-    # logging_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    logging_format = '%(asctime)s - %(levelname)s - %(message)s'
-    logging.basicConfig(format=logging_format, level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Runs the Dixit bot')
+    parser.add_argument('token_number', nargs='?', type=int, default=0,
+                        help='line of token.txt with the token (default: 0)')
+    parser.add_argument('--json-logs', action='store_true',
+                        help='write logs as JSON lines')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes, between which the '
+                             'chats are split (default: 1)')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='print the time each step of the startup takes, '
+                             'and exit')
+    args = parser.parse_args()
+
+    log_listener = setup_logging(logging.INFO, json_lines=args.json_logs)
     tokenpath = 'token.txt'
     with open(tokenpath, 'r') as token_file:
-        try:
-            n = int(sys.argv[1])  # Token number in token.txt
-        except (ValueError, IndexError):
-            n = 0  # Default to first token
+        n = args.token_number  # Token number in token.txt
 
         try:
             token = token_file.readlines()[n].strip()  # Remove \n at the end
-            run_bot(token)
+            if args.profile_startup:
+                profile_startup(token)
+            elif args.workers > 1:
+                run_supervisor(token, args.workers, json_logs=args.json_logs)
+            else:
+                run_bot(token)
         except IndexError:
             logging.error(f'No token number {n} in {tokenpath}')
             sys.exit(2)
@@ -434,3 +1176,5 @@ if __name__ == '__main__':
             logging.error(f'Broken token {token}:')
             logging.error(e)
             sys.exit(2)
+        finally:
+            log_listener.stop()  # Flushes the queued records
@@ -0,0 +1,136 @@
+'''Eviction of idle games.
+
+A game is idle when its players had no activity (see `DixitGame.touch`) for
+longer than the timeout of its current stage: the plays made for them when
+their turn times out don't count. Idle games are removed from memory,
+together with their players' entries in the user index and `user_data`, and
+optionally spilled to disk (pickled with `storage.dumps`) for inspection.
+Tournaments are evicted the same way (see `Tournament.stage`), with the
+tables and turn timers of all their games.
+
+The chat and user data belong to the dispatcher's thread, so the reaper job
+only puts a `ReapIdleGames` update in the dispatcher's queue, and the games
+are found and evicted by `reap_idle_games`, on the dispatcher's thread.
+'''
+from telegram import Update
+from telegram.error import TelegramError
+from time import time
+import logging
+import os
+import storage
+from utils import get_active_games
+
+
+chat_data_keys = ('dixit_game', 'results', 'render_context', 'added_dummies',
+                  'render_mode', 'turn_timers', 'tournament',
+                  'render_contexts', 'stored_activity')
+
+
+class ReapIdleGames(Update):
+    '''Update put in the dispatcher's queue to evict the idle games, given
+    the timeouts of each stage and the spill directory'''
+    __slots__ = ('timeouts', 'spill_dir')
+
+    def __init__(self, timeouts, spill_dir=None):
+        super().__init__(update_id=0)
+        self.timeouts = timeouts
+        self.spill_dir = spill_dir
+
+
+def spill_filename(spill_dir, chat_id):
+    return os.path.join(spill_dir, f'game_{chat_id}.pickle')
+
+
+def evict_game(dispatcher, chat_id, spill_dir=None):
+    '''Removes the game (or tournament) of the chat from memory (and from
+    the game store), spilling it to `spill_dir` if given. Returns the size
+    in bytes of the pickled game, as an estimate of the reclaimed memory'''
+    chat_data = dispatcher.chat_data[chat_id]
+    if 'dixit_game' in chat_data:
+        dixit_game = chat_data['dixit_game']
+        players = dixit_game.players + dixit_game.lobby
+    else:
+        dixit_game = chat_data['tournament']
+        players = dixit_game.players
+    data = storage.dumps(dixit_game)
+    if spill_dir is not None:
+        os.makedirs(spill_dir, exist_ok=True)
+        with open(spill_filename(spill_dir, chat_id), 'wb') as file:
+            file.write(data)
+
+    for timer in chat_data.get('turn_timers', {}).values():
+        timer.cancel()
+    for key in chat_data_keys:
+        chat_data.pop(key, None)
+    store = dispatcher.bot_data.get('game_store')
+    if store is not None:
+        store.delete_game(chat_id)
+    broadcaster = dispatcher.bot_data.get('broadcaster')
+    if broadcaster is not None:
+        broadcaster.drop_game(chat_id)
+
+    user_index = dispatcher.bot_data.get('user_index', {})
+    for player in players:
+        if user_index.get(player.id) == chat_id:
+            user_index.pop(player.id, None)
+        user_data = dispatcher.user_data.get(player.id)
+        if user_data is None:
+            continue
+        if chat_id in user_data.get('games', []):
+            user_data['games'].remove(chat_id)
+        if user_data.get('current chat') == chat_id:
+            del user_data['current chat']
+    return len(data)
+
+
+def get_active_tournaments(context):
+    '''Returns the tournaments in `context.dispatcher.chat_data` as a
+    {chat_id: tournament} dict'''
+    return {chat_id: data['tournament']
+            for chat_id, data in context.dispatcher.chat_data.items()
+            if 'tournament' in data}
+
+
+def find_idle_games(active_games, timeouts, now=None):
+    '''Returns the chat ids of the games (or tournaments) idle for longer
+    than the timeout (in seconds) of their stage, given as a {Stage: timeout}
+    dict'''
+    now = time() if now is None else now
+    return [chat_id for chat_id, dixit_game in active_games.items()
+            if now - dixit_game.last_human_action
+            > timeouts[dixit_game.stage]]
+
+
+def queue_reaping(context):
+    '''Job callback. Queues the eviction of the idle games. The timeouts and
+    the spill directory are given in the job's context'''
+    timeouts, spill_dir = context.job.context
+    context.dispatcher.update_queue.put(ReapIdleGames(timeouts, spill_dir))
+
+
+def reap_idle_games(update, context):
+    '''Handler of ReapIdleGames. Evicts the idle games, warning their
+    chats'''
+    timeouts, spill_dir = update.timeouts, update.spill_dir
+    dispatcher = context.dispatcher
+    tournaments = get_active_tournaments(context)
+    idle_chat_ids = find_idle_games({**get_active_games(context),
+                                     **tournaments}, timeouts)
+
+    reclaimed = 0
+    for chat_id in idle_chat_ids:
+        kind, command = (('tournament', '/tournament')
+                         if chat_id in tournaments else ('game', '/newgame'))
+        reclaimed += evict_game(dispatcher, chat_id, spill_dir)
+        try:
+            context.bot.send_message(chat_id=chat_id,
+                                     text=f'The {kind} was closed for '
+                                          'inactivity. Create a new one with '
+                                          f'{command}!')
+        except TelegramError as e:
+            logging.warning('Could not warn chat %s of the closed game: %s',
+                            chat_id, e)
+
+    if idle_chat_ids:
+        logging.info('Reaper - evicted %d idle games, ~%.1f KiB reclaimed',
+                     len(idle_chat_ids), reclaimed/1024)
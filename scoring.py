@@ -0,0 +1,166 @@
+'''Dixit point-counting, for a single round and in batch.
+
+Traditional rules:
+- If all or none of the players find the storyteller's card, the storyteller
+  scores 0 and everyone else scores 2.
+- Otherwise, the storyteller and whoever found the card score 3.
+- Everyone but the storyteller scores 1 point for each vote their card got.
+
+Other rule sets change these numbers (see `ScoringRules`), and are compiled
+into lookup tables once per game, by `CompiledRules`.
+
+The batch functions need numpy, which is only imported when they are called.
+'''
+from collections import Counter
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ScoringRules:
+    '''Points given in a round of Dixit. A "good hint" is a clue for which
+    some, but not all, players found the storyteller's card'''
+    name: str
+    storyteller_points: int = 3  # Storyteller, on a good hint
+    bad_hint_storyteller_points: int = 0  # Storyteller, otherwise
+    correct_vote_points: int = 3  # Each player who found the card, good hint
+    missed_clue_points: int = 2  # Every other player, when not a good hint
+    received_vote_points: int = 1  # For each vote a player's card received
+    max_received_votes: int = None  # Cap on the votes that give points
+
+
+TRADITIONAL = ScoringRules('Traditional')
+# Dixit Odyssey-like bonus: with many players, the points for the votes one's
+# card receives are capped, and the storyteller gets a bonus on a good hint
+ODYSSEY = ScoringRules('Odyssey', storyteller_points=4, max_received_votes=3)
+# House rule: nobody scores when the clue was too easy or too hard
+NO_CONSOLATION = ScoringRules('No consolation', missed_clue_points=0)
+
+rule_sets = {rules.name: rules for rules in (TRADITIONAL, ODYSSEY,
+                                              NO_CONSOLATION)}
+
+
+class CompiledRules:
+    '''ScoringRules turned into lookup tables, so that scoring a round does
+    not depend on the rule set. Call it as `round_delta`.
+    The tables cover rounds of up to `max_votes` voters: scoring a round with
+    more is a ValueError'''
+    def __init__(self, rules, max_votes=64):
+        self.rules = rules
+        self.max_votes = max_votes
+        cap = rules.max_received_votes
+        # Points for a card that received n votes
+        self.received_points = tuple(
+                rules.received_vote_points*(n if cap is None else min(n, cap))
+                for n in range(max_votes + 1))
+        # Indexed by [good_hint][voted for the storyteller]
+        self.voter_points = ((rules.missed_clue_points,
+                              rules.missed_clue_points),
+                             (0, rules.correct_vote_points))
+        # Indexed by [good_hint]
+        self.storyteller_points = (rules.bad_hint_storyteller_points,
+                                   rules.storyteller_points)
+
+    def __call__(self, votes, storyteller, players):
+        '''Returns the points each player in `players` scored in a round as a
+        {player: points} dict, given the {voter: voted} `votes` dict'''
+        if len(votes) > self.max_votes:
+            raise ValueError(f'These rules score up to {self.max_votes} votes, '
+                             f'not {len(votes)}')
+        received = Counter(votes.values())
+        good_hint = len(votes) > received[storyteller] > 0
+        received_points = self.received_points
+        delta = {player: received_points[received[player]]
+                 for player in players}
+        voter_points = self.voter_points[good_hint]
+        for voter, voted in votes.items():
+            delta[voter] += voter_points[voted == storyteller]
+        delta[storyteller] = self.storyteller_points[good_hint]
+        return delta
+
+
+round_delta = CompiledRules(TRADITIONAL)
+
+
+def batch_scores(votes, storytellers, initial_score=None,
+                 rules=TRADITIONAL):
+    '''Scores many rounds at once.
+    `votes` is a (rounds, seats, seats) array where votes[r, i, j] is 1 if
+    seat i voted for seat j in round r, and `storytellers` a (rounds,) array
+    with the storyteller's seat in each round. Seats not taking part in a round
+    simply have no votes.
+    The points are given by the ScoringRules `rules`.
+    Returns (delta, cumulative, rankings) as (rounds, seats) arrays, where
+    rankings[r] lists the seats from highest to lowest score after round r.
+    '''
+    import numpy as np
+
+    votes = np.asarray(votes, dtype=np.int64)
+    storytellers = np.asarray(storytellers, dtype=np.intp)
+    n_rounds, n_seats, _ = votes.shape
+    rounds = np.arange(n_rounds)
+
+    received = votes.sum(axis=1)
+    voted = votes.sum(axis=2) > 0
+    storyteller_votes = received[rounds, storytellers]
+    n_voters = voted.sum(axis=1)
+    good_hint = (storyteller_votes > 0) & (storyteller_votes < n_voters)
+    correct = votes[rounds, :, storytellers]  # (rounds, seats)
+
+    compiled = CompiledRules(rules, max_votes=n_seats)
+    received_points = np.asarray(compiled.received_points)
+    voter_points = np.asarray(compiled.voter_points)
+    storyteller_points = np.asarray(compiled.storyteller_points)
+
+    delta = received_points[received] + np.where(
+            voted, voter_points[good_hint[:, None].astype(np.intp), correct], 0)
+    delta[rounds, storytellers] = storyteller_points[good_hint.astype(np.intp)]
+
+    cumulative = np.cumsum(delta, axis=0)
+    if initial_score is not None:
+        cumulative += np.asarray(initial_score, dtype=np.int64)
+    rankings = np.argsort(-cumulative, axis=1, kind='stable')
+    return delta, cumulative, rankings
+
+
+def vote_matrices(results_list):
+    '''Converts a sequence of DixitResults into the arrays used by
+    `batch_scores`, for offline replay. Seats are given to players by order of
+    appearance. Returns (votes, storytellers, seat_ids).'''
+    import numpy as np
+
+    seat_ids = []
+    for results in results_list:
+        for player_id in results.player_ids:
+            if player_id not in seat_ids:
+                seat_ids.append(player_id)
+    seat_of = {player_id: seat for seat, player_id in enumerate(seat_ids)}
+
+    votes = np.zeros((len(results_list), len(seat_ids), len(seat_ids)),
+                     dtype=np.int8)
+    storytellers = np.empty(len(results_list), dtype=np.intp)
+    for r, results in enumerate(results_list):
+        seats = [seat_of[player_id] for player_id in results.player_ids]
+        storytellers[r] = seats[results.storyteller]
+        for voter, voted in enumerate(results.votes):
+            if voted >= 0:
+                votes[r, seats[voter], seats[voted]] = 1
+    return votes, storytellers, seat_ids
+
+
+def simulate_votes(n_rounds, n_seats, seed=None):
+    '''Simulates `n_rounds` of random voting among `n_seats` players, with the
+    storyteller rotating each round. Returns (votes, storytellers), as in
+    `batch_scores`'''
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    rounds = np.arange(n_rounds)
+    storytellers = rounds % n_seats
+    # Each player picks one of the other n_seats - 1 cards uniformly
+    choice = rng.integers(0, n_seats - 1, size=(n_rounds, n_seats))
+    seats = np.arange(n_seats)
+    voted = choice + (choice >= seats)  # Skip the player's own seat
+    votes = np.zeros((n_rounds, n_seats, n_seats), dtype=np.int8)
+    votes[rounds[:, None], seats, voted] = 1
+    votes[rounds, storytellers, :] = 0  # The storyteller doesn't vote
+    return votes, storytellers
@@ -0,0 +1,193 @@
+'''Statistics of the rounds and games played.
+
+The statistics are kept in an SQLite database (see config.STATS_DB), shared
+by the worker processes when running under a supervisor, and kept between
+runs. Every round is recorded as a row of `rounds` (chat, game, round number,
+storyteller) and a row per player of the round in `round_players` (player,
+card played, whose card they voted for, points won). The history stays on
+disk: nothing grows in memory with the rounds played.
+
+The aggregates answering `/stats` and `/leaderboard` (games won, storyteller
+success rate, most voted cards, per-chat standings) are updated in place, in
+the same transaction as each round, so queries never scan the history. The
+standings are read in order from an index on (chat, wins, points), which
+SQLite updates with each row, so a leaderboard is never sorted.
+'''
+from collections import namedtuple
+import threading
+import sqlite3
+import os
+
+
+OVERALL = 0  # Chat id of the statistics over all chats
+
+aggregates = ('games', 'wins', 'rounds', 'points', 'storyteller_rounds',
+              'storyteller_successes')
+
+
+class PlayerStats(namedtuple('PlayerStats', ('name',) + aggregates)):
+    '''Aggregated statistics of a player (globally or in a chat)'''
+    __slots__ = ()
+
+    @property
+    def win_rate(self):
+        return self.wins / self.games if self.games else 0
+
+    @property
+    def storyteller_success_rate(self):
+        if not self.storyteller_rounds:
+            return 0
+        return self.storyteller_successes / self.storyteller_rounds
+
+
+class StatsStore:
+    schema = (
+        'CREATE TABLE IF NOT EXISTS rounds (id INTEGER PRIMARY KEY, '
+        'chat_id INTEGER, game_id TEXT, round_number INTEGER, '
+        'storyteller INTEGER)',
+        # voted_for is 0 for the storyteller
+        'CREATE TABLE IF NOT EXISTS round_players (round_id INTEGER, '
+        'seat INTEGER, player_id INTEGER, card INTEGER, voted_for INTEGER, '
+        'delta INTEGER, PRIMARY KEY (round_id, seat)) WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS player_stats (chat_id INTEGER, '
+        'user_id INTEGER, name TEXT, '
+        + ', '.join(f'{column} INTEGER NOT NULL DEFAULT 0'
+                    for column in aggregates)
+        + ', PRIMARY KEY (chat_id, user_id))',
+        'CREATE INDEX IF NOT EXISTS standings '
+        'ON player_stats (chat_id, wins DESC, points DESC)',
+        'CREATE TABLE IF NOT EXISTS card_votes (image_id INTEGER PRIMARY KEY, '
+        'votes INTEGER NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS most_voted ON card_votes (votes DESC)',
+    )
+
+    def __init__(self, path=':memory:'):
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=10,
+                                          check_same_thread=False)
+        if path != ':memory:':
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            for statement in self.schema:
+                self.connection.execute(statement)
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute(
+                    'SELECT COALESCE(MAX(id), 0) FROM rounds').fetchone()[0]
+
+    def _add(self, chat_id, player_id, name, **increments):
+        '''Adds the increments to the global and chat statistics of the
+        player, with its name updated'''
+        columns = ', '.join(increments)
+        placeholders = ', '.join('?'*len(increments))
+        updates = ', '.join(f'{column} = {column} + excluded.{column}'
+                            for column in increments)
+        for chat in (OVERALL, chat_id):
+            self.connection.execute(
+                    f'INSERT INTO player_stats (chat_id, user_id, name, '
+                    f'{columns}) VALUES (?, ?, ?, {placeholders}) '
+                    'ON CONFLICT (chat_id, user_id) DO UPDATE SET '
+                    f'name = excluded.name, {updates}',
+                    (chat, player_id, name, *increments.values()))
+
+    def record_round(self, chat_id, results):
+        '''Records the results (a DixitResults) of a round played in the chat'''
+        storyteller = results.storyteller
+        guessers = results.votes.count(storyteller)
+        # The storyteller scores when some, but not all, find their card
+        success = 0 < guessers < results.n_players - 1
+        player_ids = results.player_ids
+        game_id = None if results.game_id is None else str(results.game_id)
+
+        with self._lock, self.connection:  # One transaction
+            round_id = self.connection.execute(
+                    'INSERT INTO rounds (chat_id, game_id, round_number, '
+                    'storyteller) VALUES (?, ?, ?, ?)',
+                    (chat_id, game_id, results.round_number,
+                     player_ids[storyteller])).lastrowid
+            self.connection.executemany(
+                    'INSERT INTO round_players VALUES (?, ?, ?, ?, ?, ?)',
+                    [(round_id, seat, player_id, results.cards[seat],
+                      0 if voted < 0 else player_ids[voted],
+                      results.delta_score[seat])
+                     for seat, (player_id, voted)
+                     in enumerate(zip(player_ids, results.votes))])
+            self.connection.executemany(
+                    'INSERT INTO card_votes VALUES (?, 1) ON CONFLICT '
+                    '(image_id) DO UPDATE SET votes = votes + 1',
+                    [(results.cards[voted],) for voted in results.votes
+                     if voted >= 0])
+
+            for seat, player_id in enumerate(player_ids):
+                if player_id < 0:  # Dummies have no statistics
+                    continue
+                is_storyteller = seat == storyteller
+                self._add(chat_id, player_id, results.player_names[seat],
+                          rounds=1, points=results.delta_score[seat],
+                          storyteller_rounds=int(is_storyteller),
+                          storyteller_successes=int(is_storyteller
+                                                    and success))
+
+    def record_game_end(self, chat_id, results):
+        '''Records the end of a game, given the results of its last round'''
+        max_score = max(results.score)
+        with self._lock, self.connection:
+            for seat, player_id in enumerate(results.player_ids):
+                if player_id < 0:
+                    continue
+                self._add(chat_id, player_id, results.player_names[seat],
+                          games=1, wins=int(results.score[seat] == max_score))
+
+    def round(self, i):
+        '''Returns the i-th recorded round as a dict of its columns'''
+        with self._lock:
+            chat_id, game_id, round_number, storyteller = \
+                    self.connection.execute(
+                            'SELECT chat_id, game_id, round_number, '
+                            'storyteller FROM rounds WHERE id = ?',
+                            (i + 1,)).fetchone()
+            rows = self.connection.execute(
+                    'SELECT player_id, card, voted_for, delta '
+                    'FROM round_players WHERE round_id = ? ORDER BY seat',
+                    (i + 1,)).fetchall()
+        players, cards, voted_for, deltas = map(list, zip(*rows))
+        return {'chat_id': chat_id, 'game_id': game_id,
+                'round_number': round_number, 'storyteller': storyteller,
+                'players': players, 'cards': cards, 'voted_for': voted_for,
+                'deltas': deltas}
+
+    def get_player(self, user_id, chat_id=None):
+        '''Returns the PlayerStats of the user (in the chat, if given), or
+        None if they haven't played'''
+        with self._lock:
+            row = self.connection.execute(
+                    f'SELECT name, {", ".join(aggregates)} FROM player_stats '
+                    'WHERE chat_id = ? AND user_id = ?',
+                    (OVERALL if chat_id is None else chat_id,
+                     user_id)).fetchone()
+        return None if row is None else PlayerStats(*row)
+
+    def leaderboard(self, chat_id, n=10):
+        '''Returns the top n (user_id, PlayerStats) of the chat, by wins and
+        then by points'''
+        with self._lock:
+            rows = self.connection.execute(
+                    f'SELECT user_id, name, {", ".join(aggregates)} '
+                    'FROM player_stats WHERE chat_id = ? '
+                    'ORDER BY wins DESC, points DESC LIMIT ?',
+                    (chat_id, n)).fetchall()
+        return [(user_id, PlayerStats(*row)) for user_id, *row in rows]
+
+    def most_voted_cards(self, n=5):
+        '''Returns the n (image_id, votes) of the most voted cards'''
+        with self._lock:
+            return self.connection.execute(
+                    'SELECT image_id, votes FROM card_votes '
+                    'ORDER BY votes DESC LIMIT ?', (n,)).fetchall()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,195 @@
+'''Storage of the games and of the per-user data ("games" and "current chat")
+outside of the dispatcher's memory.
+
+A game is stored with its chat's settings (see `utils.stored_keys`), and
+only when it changed (see `utils.save_game_callback`).
+
+`MemoryStore` keeps everything in dicts. `SQLiteStore` keeps it in an SQLite
+database in WAL mode, with a read-through LRU cache of decoded objects:
+`put_*` pickles the object, on the thread that changes it, and the latest
+pickle of each changed object is written in a single transaction when
+`flush` is called. `flush` runs on a job (see `main.setup_dispatcher`), so it
+only writes bytes and never touches the live games.
+
+Objects are pickled. Telegram objects hold a reference to the bot, which
+can't be pickled, so it is stored as a placeholder and replaced by the store's
+`bot` when loading.
+'''
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from telegram import Bot
+import threading
+import pickle
+import sqlite3
+import io
+
+
+class GameStore(ABC):
+    '''Interface of the game stores'''
+    @abstractmethod
+    def get_game(self, chat_id):
+        '''Returns the stored data of the chat's game, or None'''
+
+    @abstractmethod
+    def put_game(self, chat_id, dixit_game):
+        pass
+
+    @abstractmethod
+    def delete_game(self, chat_id):
+        pass
+
+    @abstractmethod
+    def get_user(self, user_id):
+        '''Returns the dict with the user's data, or None'''
+
+    @abstractmethod
+    def put_user(self, user_id, user_data):
+        pass
+
+    def flush(self):
+        '''Writes pending changes'''
+
+    def close(self):
+        self.flush()
+
+
+class MemoryStore(GameStore):
+    def __init__(self):
+        self.games = {}
+        self.users = {}
+
+    def get_game(self, chat_id):
+        return self.games.get(chat_id)
+
+    def put_game(self, chat_id, dixit_game):
+        self.games[chat_id] = dixit_game
+
+    def delete_game(self, chat_id):
+        self.games.pop(chat_id, None)
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    def put_user(self, user_id, user_data):
+        self.users[user_id] = user_data
+
+
+class _BotPickler(pickle.Pickler):
+    def persistent_id(self, obj):
+        return 'bot' if isinstance(obj, Bot) else None
+
+
+class _BotUnpickler(pickle.Unpickler):
+    def __init__(self, file, bot):
+        super().__init__(file)
+        self.bot = bot
+
+    def persistent_load(self, pid):
+        if pid != 'bot':
+            raise pickle.UnpicklingError(f'Unsupported persistent id: {pid!r}')
+        return self.bot
+
+
+def dumps(obj):
+    '''Pickles obj, replacing the bot by a placeholder'''
+    with io.BytesIO() as file:
+        _BotPickler(file, pickle.HIGHEST_PROTOCOL).dump(obj)
+        return file.getvalue()
+
+
+def loads(data, bot=None):
+    '''Unpickles data pickled by `dumps`, with `bot` as the bot'''
+    with io.BytesIO(data) as file:
+        return _BotUnpickler(file, bot).load()
+
+
+_DELETED = object()  # Marks pending deletions
+
+
+class SQLiteStore(GameStore):
+    tables = ('games', 'users')
+
+    def __init__(self, path, bot=None, cache_size=256):
+        self.bot = bot
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # {(table, key): object}, LRU first
+        self._pending = {}  # {(table, key): pickled object or _DELETED}
+        self._lock = threading.RLock()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        for table in self.tables:
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS {table} '
+                                    '(id INTEGER PRIMARY KEY, data BLOB)')
+        self.connection.commit()
+
+    def _cache_put(self, key, obj):
+        self._cache[key] = obj
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _get(self, table, id_):
+        key = (table, id_)
+        with self._lock:
+            data = self._pending.get(key)
+            if data is _DELETED:
+                return None
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            if data is None:
+                row = self.connection.execute(
+                        f'SELECT data FROM {table} WHERE id = ?', (id_,)
+                        ).fetchone()
+                if row is None:
+                    return None
+                data = row[0]
+            obj = loads(data, self.bot)
+            self._cache_put(key, obj)
+            return obj
+
+    def _put(self, table, id_, obj):
+        key = (table, id_)
+        data = obj if obj is _DELETED else dumps(obj)
+        with self._lock:
+            if obj is _DELETED:
+                self._cache.pop(key, None)
+            else:
+                self._cache_put(key, obj)
+            self._pending[key] = data
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            with self.connection:  # One transaction
+                for (table, id_), data in self._pending.items():
+                    if data is _DELETED:
+                        self.connection.execute(
+                                f'DELETE FROM {table} WHERE id = ?', (id_,))
+                    else:
+                        self.connection.execute(
+                                f'INSERT OR REPLACE INTO {table} (id, data) '
+                                'VALUES (?, ?)', (id_, data))
+            self._pending.clear()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def get_game(self, chat_id):
+        return self._get('games', chat_id)
+
+    def put_game(self, chat_id, dixit_game):
+        self._put('games', chat_id, dixit_game)
+
+    def delete_game(self, chat_id):
+        self._put('games', chat_id, _DELETED)
+
+    def get_user(self, user_id):
+        return self._get('users', user_id)
+
+    def put_user(self, user_id, user_data):
+        self._put('users', user_id, user_data)
@@ -0,0 +1,165 @@
+'''Runs the bot as a supervisor process and N worker processes.
+
+The supervisor polls Telegram for updates and routes each one to a worker by
+a stable hash of its chat id, so every chat (and its `chat_data`) is owned by
+exactly one worker. Updates without a chat (inline queries and chosen inline
+results) are routed by the chat of the game their user is in, looked up in
+the user index shared by all workers (see `utils.index_user`).
+
+Spectators (see broadcast.py) are kept by the worker of the game they watch,
+so `/watch <chat id>` is routed by the chat id it names, and `/unwatch` by the
+game the chat watches, looked up in the watch index shared by all workers.
+
+Ctrl+C stops the supervisor, which then stops each worker with a None in its
+queue, so that it finishes its updates and saves its games and statistics.
+The workers and the manager of the shared indexes ignore SIGINT, which the
+terminal sends to the whole process group.
+'''
+from telegram import Bot, Update
+from telegram.ext import Dispatcher, JobQueue
+from telegram.error import NetworkError, RetryAfter
+from multiprocessing.managers import SyncManager
+from queue import Queue
+from zlib import crc32
+import multiprocessing
+import signal
+import threading
+import logging
+import time
+
+
+def watch_command(message):
+    '''Returns the command ('/watch' or '/unwatch') of a /watch or /unwatch
+    message and its arguments, or None for other messages'''
+    if message is None or not message.text:
+        return None
+    command, *args = message.text.split()
+    command = command.split('@')[0]  # As in /watch@bot_name
+    if command not in ('/watch', '/unwatch'):
+        return None
+    return command, args
+
+
+def command_chat_id(message, watch_index):
+    '''Returns the id of the game chat that a /watch or /unwatch command is
+    about, or None for other messages'''
+    command = watch_command(message)
+    if command is None:
+        return None
+    command, args = command
+    if command == '/watch' and len(args) == 1:
+        try:
+            return int(args[0])
+        except ValueError:
+            return None
+    if command == '/unwatch':
+        return watch_index.get(message.chat.id)
+    return None
+
+
+def update_chat_id(update, user_index, watch_index):
+    '''Returns the id of the chat an update belongs to'''
+    game_chat_id = command_chat_id(update.message, watch_index)
+    if game_chat_id is not None:
+        return game_chat_id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    user = update.effective_user
+    if user is None:
+        return 0
+    # Inline updates of users outside of a game are answered by any worker
+    return user_index.get(user.id, user.id)
+
+
+def worker_for(chat_id, n_workers):
+    '''Stable (across processes and restarts) worker number of a chat'''
+    return crc32(str(chat_id).encode()) % n_workers
+
+
+def ignore_sigint():
+    '''Leaves Ctrl+C to the supervisor, which stops the process itself'''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_worker(token, update_queue, user_index, watch_index,
+               json_logs=False):
+    '''Processes the updates put in `update_queue` until it gets a None'''
+    ignore_sigint()
+    from logs import setup_logging
+    from main import setup_dispatcher, start_warm_up
+
+    log_listener = setup_logging(logging.INFO, json_lines=json_logs)
+    bot = Bot(token)
+    job_queue = JobQueue()
+    dispatcher = Dispatcher(bot, Queue(), job_queue=job_queue,
+                            use_context=True)
+    job_queue.set_dispatcher(dispatcher)
+    setup_dispatcher(dispatcher, job_queue, user_index=user_index,
+                     watch_index=watch_index)
+    job_queue.start()
+    logging.info('Worker %s ready', multiprocessing.current_process().name)
+
+    # The dispatcher runs in its own thread, as under an Updater, so that
+    # jobs can also put updates in its queue
+    dispatcher_thread = threading.Thread(target=dispatcher.start,
+                                         name='dispatcher')
+    dispatcher_thread.start()
+    start_warm_up(dispatcher.bot_data)
+    while (data := update_queue.get()) is not None:
+        dispatcher.update_queue.put(Update.de_json(data, bot))
+
+    dispatcher.stop()
+    dispatcher_thread.join()
+    job_queue.stop()
+    dispatcher.bot_data['render_pool'].shutdown()
+    dispatcher.bot_data['animation_pool'].shutdown()
+    dispatcher.bot_data['stats'].close()
+    store = dispatcher.bot_data.get('game_store')
+    if store is not None:
+        store.close()
+    log_listener.stop()
+
+
+def run_supervisor(token, n_workers, json_logs=False, poll_timeout=30):
+    '''Starts `n_workers` workers and routes them the bot's updates'''
+    # Spawned rather than forked, as this process runs threads (the log
+    # listener's): each worker sets up its own logging
+    mp_context = multiprocessing.get_context('spawn')
+    manager = SyncManager(ctx=mp_context)
+    manager.start(ignore_sigint)
+    user_index = manager.dict()  # {user_id: chat_id}
+    watch_index = manager.dict()  # {spectator chat_id: game chat_id}
+    queues = [mp_context.Queue() for _ in range(n_workers)]
+    workers = [mp_context.Process(target=run_worker,
+                                       args=(token, queue, user_index,
+                                             watch_index, json_logs),
+                                       name=f'worker-{n}')
+               for n, queue in enumerate(queues)]
+    for worker in workers:
+        worker.start()
+
+    bot = Bot(token)
+    offset = None
+    try:
+        while True:
+            try:
+                updates = bot.get_updates(offset=offset, timeout=poll_timeout)
+            except RetryAfter as e:
+                time.sleep(e.retry_after)
+                continue
+            except NetworkError as e:
+                logging.warning('Error while getting updates: %s', e)
+                time.sleep(1)
+                continue
+            for update in updates:
+                chat_id = update_chat_id(update, user_index, watch_index)
+                queues[worker_for(chat_id, n_workers)].put(update.to_dict())
+                offset = update.update_id + 1
+    except KeyboardInterrupt:
+        logging.info('Stopping workers')
+    finally:
+        for queue in queues:
+            queue.put(None)
+        for worker in workers:
+            worker.join()
+        manager.shutdown()
@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from admission import AdmissionControl
+
+
+def test_bounded_renders():
+    admission = AdmissionControl(max_renders=2)
+    assert admission.admit(1, now=0)
+    assert admission.admit(2, now=0)
+    assert not admission.admit(3, now=0)
+    admission.done(1, 1.0, now=1)
+    assert admission.admit(3, now=1)
+    # More boards than the limit only go alone
+    assert not admission.admit(4, boards=3, now=1)
+    assert admission.stats(now=1)['shed'] == {'renders': 4}
+
+
+def test_backlog_and_latency():
+    admission = AdmissionControl(max_backlog=10, max_latency=5, window=60)
+    assert not admission.admit(1, backlog=11, now=0)
+    assert admission.admit(1, backlog=10, now=0)
+    admission.done(1, 20.0, now=20)
+    assert not admission.admit(2, now=30)
+    # The slow board is out of the window
+    assert admission.admit(2, now=81)
+    assert admission.stats(now=81)['shed'] == {'backlog': 1, 'latency': 1}
+
+
+def test_fairness():
+    admission = AdmissionControl(max_backlog=10, fair_interval=30)
+    assert admission.admit(1, now=0)
+    admission.done(1, 1.0, now=1)
+    assert admission.admit(1, now=2)  # No pressure
+    admission.done(1, 1.0, now=3)
+    # Under pressure, the chat that just had a board waits for the others
+    assert not admission.admit(1, backlog=6, now=4)
+    assert admission.admit(2, backlog=6, now=4)
+    assert admission.admit(1, backlog=6, now=40)
+
+
+def test_metered_pools():
+    admission = AdmissionControl(max_renders=2)
+    pool = admission.meter(ThreadPoolExecutor(2))
+    release = threading.Event()
+    futures = [pool.submit(release.wait) for _ in range(2)]
+    assert admission.rendering == 2
+    # The pools' jobs are rendering, even with no board admitted
+    assert not admission.admit(1, now=0)
+    release.set()
+    for future in futures:
+        future.result()
+    pool.shutdown()
+    assert admission.rendering == 0
+    assert admission.admit(1, now=0)
+
+
+def test_sends():
+    admission = AdmissionControl(max_send_latency=2, max_send_rate=1,
+                                 window=10)
+    admission.sent(5.0, now=0)
+    assert not admission.admit(1, now=1)
+    # The slow send is out of the window
+    assert admission.admit(1, now=11)
+    for _ in range(11):
+        admission.sent(0.1, now=12)
+    assert not admission.admit(2, now=12)
+    stats = admission.stats(now=12)
+    assert stats['shed'] == {'sends': 2}
+    assert stats['send_rate'] == 1.1
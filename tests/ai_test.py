@@ -0,0 +1,46 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+import ai
+from game import Card
+
+
+@pytest.fixture
+def card_index(tmp_path):
+    '''Index with a red card (1), a blue card (2) and a dark card (3)'''
+    features = np.zeros((4, ai.n_features), dtype=np.float32)
+    features[1, [ai.RED, ai.BRIGHT, ai.VIVID]] = 1
+    features[2, [ai.BLUE, ai.LIT, ai.RICH]] = 1
+    features[3, [ai.DARK, ai.GREY]] = 1
+    path = tmp_path/'card_index.npy'
+    np.save(path, ai.normalize(features))
+    return ai.CardIndex(path)
+
+
+class TestCardIndex:
+    def test_closest_card(self, card_index):
+        cards = [Card(image_id, 10 + image_id) for image_id in (1, 2, 3)]
+        assert card_index.closest_card('Fire!', cards) == cards[0]
+        assert card_index.closest_card('the sad sea', cards) == cards[1]
+        assert card_index.closest_card('Night of fear', cards) == cards[2]
+
+    def test_plays(self, card_index):
+        hand = [Card(image_id, 10 + image_id) for image_id in (1, 2, 3)]
+        assert card_index.player_play(hand, 'Blood and fire') == hand[0]
+        assert card_index.vote(hand[1:], 'The sea at night') in hand[1:]
+        assert card_index.vote(hand[1:], 'Cold blue sky') == hand[1]
+
+    def test_describe(self, card_index):
+        assert card_index.describe(Card(3, 13)) in ('night', 'fear', 'death')
+
+    def test_unknown_clue(self, card_index):
+        cards = [Card(1, 11), Card(2, 12)]
+        assert card_index.closest_card('xyzzy', cards) in cards
+        assert card_index.closest_card('', cards) in cards
+
+
+def test_image_features():
+    from PIL import Image
+    red = ai.image_features(Image.new('RGB', (8, 8), (255, 0, 0)))
+    assert np.argmax(red[:ai.n_hues]) == ai.RED
+    assert red[ai.BRIGHT] == 1 and red[ai.VIVID] == 1
@@ -0,0 +1,39 @@
+from concurrent.futures import Future, TimeoutError
+from time import time
+from PIL import Image
+import io
+import pytest
+pytest.importorskip('cairo')
+import animation
+from benchmarks.draw_bench import card_images, results
+
+
+class Pool:
+    '''class to emulate an executor whose jobs never finish'''
+    def submit(self, function, *args, **kwargs):
+        return Future()
+
+
+def cards(n_cards):
+    return {image_id: file.getvalue()
+            for image_id, file in card_images(n_cards).items()}
+
+
+def test_render_animation():
+    gif = animation.render_animation(results(3), cards(3),
+                                     deadline=time() + 60, n_frames=4,
+                                     card_width=40)
+    image = Image.open(io.BytesIO(gif))
+    assert image.format == 'GIF'
+    assert image.n_frames == 5
+
+
+def test_render_animation_deadline():
+    with pytest.raises(TimeoutError):
+        animation.render_animation(results(3), cards(3), deadline=time() - 1)
+
+
+def test_show_animation_budget():
+    wait = animation.show_animation(results(3), card_images(3), Pool(),
+                                    budget=0.1)
+    assert wait() is None
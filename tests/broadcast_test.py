@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+from telegram.error import RetryAfter, Unauthorized
+from broadcast import Broadcaster
+import broadcast
+
+
+class JobQueue:
+    '''class to emulate telegram's JobQueue, running the repeating job on
+    demand'''
+    def run_repeating(self, callback, interval):
+        self.callback = callback
+
+    def tick(self, bot):
+        self.callback(SimpleNamespace(bot=bot))
+
+
+class Bot:
+    '''class to emulate a telegram bot, recording the messages sent'''
+    def __init__(self):
+        self.sent = []
+        self.errors = {}  # {chat_id: exception to raise once}
+
+    def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.errors:
+            raise self.errors.pop(chat_id)
+        self.sent.append((chat_id, text))
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        self.sent.append((chat_id, photo))
+
+
+class TestBroadcaster:
+    def setup_method(self):
+        self.job_queue = JobQueue()
+        self.bot = Bot()
+        self.broadcaster = Broadcaster(self.job_queue, batch_size=10)
+        for chat_id in range(1, 26):
+            self.broadcaster.subscribe(-100, chat_id)
+
+    def test_batches(self):
+        self.broadcaster.publish_message(-100, 'Hi')
+        self.job_queue.tick(self.bot)
+        assert len(self.bot.sent) == 10 and len(self.broadcaster) == 15
+        self.job_queue.tick(self.bot)
+        self.job_queue.tick(self.bot)
+        assert sorted(self.bot.sent) == [(n, 'Hi') for n in range(1, 26)]
+        assert self.broadcaster.stats()['sent'] == 25
+
+    def test_photo_by_file_id(self):
+        message = SimpleNamespace(photo=[SimpleNamespace(file_id='small'),
+                                         SimpleNamespace(file_id='big')])
+        self.broadcaster.publish_photo(-100, message)
+        for _ in range(3):
+            self.job_queue.tick(self.bot)
+        assert {photo for _, photo in self.bot.sent} == {'big'}
+
+    def test_subscriptions(self):
+        self.broadcaster.subscribe(-200, 1)  # Switches games
+        assert 1 not in self.broadcaster.spectators(-100)
+        assert self.broadcaster.unsubscribe(2) == -100
+        assert self.broadcaster.unsubscribe(2) is None
+        self.broadcaster.drop_game(-100)
+        assert self.broadcaster.spectators(-100) == set()
+        assert self.broadcaster.stats()['spectators'] == 1
+
+    def test_errors(self, monkeypatch):
+        now = [0]
+        monkeypatch.setattr(broadcast, 'monotonic', lambda: now[0])
+        self.bot.errors = {1: RetryAfter(5), 2: Unauthorized('Kicked')}
+        self.broadcaster.publish_message(-100, 'Hi')
+        self.job_queue.tick(self.bot)  # Stops at the rate limit
+        assert self.bot.sent == [] and len(self.broadcaster) == 25
+        now[0] = 4
+        self.job_queue.tick(self.bot)  # Still rate limited
+        assert self.bot.sent == [] and len(self.broadcaster) == 25
+        now[0] = 5
+        for _ in range(3):
+            self.job_queue.tick(self.bot)
+        assert len(self.bot.sent) == 24
+        assert 2 not in self.broadcaster.spectators(-100)
+
+    def test_bounded_queue(self):
+        self.broadcaster.max_queue = 30
+        self.broadcaster.publish_message(-100, 'Old')
+        self.broadcaster.publish_message(-100, 'New')
+        assert len(self.broadcaster) == 30
+        assert self.broadcaster.stats()['dropped'] == 20
+        for _ in range(3):
+            self.job_queue.tick(self.bot)
+        assert [text for _, text in self.bot.sent].count('New') == 25
+
+    def test_shared_watch_index(self):
+        watch_index = {}  # Shared by the workers under a supervisor
+        broadcaster = Broadcaster(self.job_queue, watch_index=watch_index)
+        other_broadcaster = Broadcaster(JobQueue(), watch_index=watch_index)
+        broadcaster.subscribe(-100, 1)
+        broadcaster.subscribe(-100, 2)
+        assert watch_index == {1: -100, 2: -100}
+        # Chat 1 watches a game of another worker instead
+        other_broadcaster.subscribe(-200, 1)
+        broadcaster.publish_message(-100, 'Hi')
+        self.job_queue.tick(self.bot)
+        assert self.bot.sent == [(2, 'Hi')]
+        assert broadcaster.spectators(-100) == {2}
+        assert watch_index == {1: -200, 2: -100}
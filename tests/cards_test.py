@@ -0,0 +1,73 @@
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from hashlib import sha256
+from PIL import Image
+import threading
+import io
+import os
+import pytest
+from cards import CardCache
+
+
+def jpeg(color):
+    with io.BytesIO() as file:
+        Image.new('RGB', (20, 30), color).save(file, 'JPEG')
+        return file.getvalue()
+
+
+class CardHost(BaseHTTPRequestHandler):
+    '''Stands in for the card host, serving /card_<image_id>.jpg'''
+    cards = {1: jpeg('red'), 2: jpeg('blue'), 3: jpeg('red')}
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        image_id = int(self.path[len('/card_'):-len('.jpg')])
+        if image_id not in self.cards:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.end_headers()
+        self.wfile.write(self.cards[image_id])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def card_url():
+    server = HTTPServer(('127.0.0.1', 0), CardHost)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    CardHost.requests.clear()
+    host, port = server.server_address
+    yield lambda image_id: f'http://{host}:{port}/card_{image_id}.jpg'
+    server.shutdown()
+
+
+def test_prefetch(tmp_path, card_url):
+    cache = CardCache(tmp_path, url=card_url)
+    assert 1 not in cache
+    with pytest.raises(KeyError):
+        cache[1]
+    assert CardHost.requests == []  # Reading never fetches
+
+    assert cache.wait([1, 2, 3, 4], timeout=0) is False
+    cache.prefetch([1, 2, 3, 4])
+    assert cache.wait([1, 2, 3], timeout=10) is True
+    assert 4 not in cache  # Not on the host
+    png = cache[1].read()
+    assert png.startswith(b'\x89PNG')
+    assert os.path.exists(tmp_path / f'{sha256(png).hexdigest()}.png')
+    # Cards 1 and 3 are the same image, stored once
+    assert len(list(tmp_path.glob('*.png'))) == 2
+    cache.close()
+
+    # The cache is still there for the next run, without fetching again
+    n_requests = len(CardHost.requests)
+    cache = CardCache(tmp_path, url=card_url)
+    cache.prefetch([1, 2, 3])
+    assert sorted(cache) == [1, 2, 3]
+    assert cache[1].read() == png
+    assert len(CardHost.requests) == n_requests
+    cache.close()
@@ -0,0 +1,62 @@
+import pytest
+from debounce import InlineDebouncer
+
+
+class User:
+    '''class to emulate a telegram user object'''
+    def __init__(self, id_):
+        self.id = id_
+
+
+class InlineQuery:
+    '''class to emulate a telegram inline query object'''
+    def __init__(self, user, query):
+        self.from_user = user
+        self.query = query
+        self.answers = []
+
+    def answer(self, results, **kwargs):
+        self.answers.append(results)
+
+
+class JobQueue:
+    '''class to emulate telegram's JobQueue, running jobs on demand'''
+    def __init__(self):
+        self.jobs = []
+
+    def run_once(self, callback, when, context=None):
+        job = type('Job', (object,), {'context': context})
+        self.jobs.append((callback, type('Context', (object,), {'job': job})))
+
+    def run_all(self):
+        jobs, self.jobs = self.jobs, []
+        for callback, context in jobs:
+            callback(context)
+
+
+class TestInlineDebouncer:
+    @pytest.fixture
+    def job_queue(self):
+        return JobQueue()
+
+    @pytest.fixture
+    def debouncer(self, job_queue):
+        return InlineDebouncer(job_queue)
+
+    def test_only_latest_is_answered(self, debouncer, job_queue):
+        user = User(1)
+        queries = [InlineQuery(user, clue) for clue in ('c', 'cl', 'clu')]
+        for query in queries:
+            debouncer.submit(query, [query.query])
+        job_queue.run_all()
+        assert [q.answers for q in queries] == [[], [], [['clu']]]
+        assert debouncer.stats() == {'received': 3, 'answered': 1, 'saved': 2}
+
+    def test_users_are_independent(self, debouncer, job_queue):
+        first, second = InlineQuery(User(1), 'a'), InlineQuery(User(2), 'b')
+        debouncer.submit(first, ['a'])
+        debouncer.submit(second, ['b'])
+        job_queue.run_all()
+        assert first.answers == [['a']]
+        assert second.answers == [['b']]
+        assert debouncer.saved == 0
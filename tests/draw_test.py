@@ -0,0 +1,28 @@
+from dataclasses import replace
+import io
+import pytest
+pytest.importorskip('cairo')
+import draw
+from benchmarks.draw_bench import card_images, results
+
+
+def test_prerendered_table():
+    round_results = results(4)
+    images = card_images(4)
+    render_context = draw.RenderContext()
+    # During the vote, the votes and scores aren't known yet
+    render_context.prerender(replace(round_results, votes=(-1,)*4,
+                                     score=(0,)*4, delta_score=(0,)*4),
+                             images)
+    table = render_context._table
+
+    with io.BytesIO() as file:
+        draw.save_results_pic(round_results, file, images,
+                              render_context=render_context)
+        assert file.getvalue().startswith(b'\x89PNG')
+    assert render_context._table is table
+
+    # A different clue is a different table
+    render_context.prerender(replace(round_results, clue='Another clue'),
+                             images)
+    assert render_context._table is not table
@@ -1,4 +1,5 @@
 import pytest
+import pickle
 import game
 from exceptions import *
 
@@ -161,3 +162,30 @@ class TestDixitGame:
         assert dixit.round_number == 1
         assert all(len(p.hand) == dixit.cards_per_player
                    for p in dixit.players)
+
+
+def test_results_snapshot():
+    users = [User(id_, name) for id_, name in ((5, 'Ana'), (6, 'Bia'),
+                                               (7, 'Caio'))]
+    for user in users:
+        user.username = None
+    players = [game.Player(user) for user in users]
+    dixit = game.DixitGame(players=players, storyteller=players[1],
+                           clue='the clue')
+    dixit.table.update({p: game.Card(20 + n, n) for n, p in enumerate(players)})
+    dixit.votes.update({players[0]: players[1], players[2]: players[0]})
+    dixit.end_of_round()
+
+    results = dixit.get_results()
+    assert results.player_ids == (5, 6, 7)
+    assert results.player_names == ('Ana', 'Bia', 'Caio')
+    assert results.storyteller == 1
+    assert results.votes == (1, -1, 0)
+    assert results.cards == (20, 21, 22)
+    assert results.score == results.delta_score == (4, 3, 0)
+    assert results.ranking == (0, 1, 2)
+    assert results.voters(1) == [0]
+
+    dixit.housekeeping()  # Clears the round's state
+    assert results.cards == (20, 21, 22) and results.votes == (1, -1, 0)
+    assert pickle.loads(pickle.dumps(results)) == results
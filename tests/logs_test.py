@@ -0,0 +1,48 @@
+import threading
+import logging
+import json
+import io
+import pytest
+from logs import LazyText, setup_logging
+
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def test_lazy_text_built_by_listener(root_logger):
+    stream = io.StringIO()
+    listener = setup_logging(stream=stream)
+    threads = []
+
+    def build(text):
+        threads.append(threading.current_thread())
+        return text
+
+    logging.info('Results: %s', LazyText(build, 'the text'))
+    logging.debug('Not emitted: %s', LazyText(build, 'nothing'))
+    listener.stop()
+    assert 'Results: the text' in stream.getvalue()
+    assert len(threads) == 1
+    assert threads[0] is not threading.current_thread()
+
+
+def test_json_exc_info(root_logger):
+    stream = io.StringIO()
+    listener = setup_logging(json_lines=True, stream=stream)
+    try:
+        raise ValueError('broken')
+    except ValueError:
+        logging.exception('Failed')
+    listener.stop()
+    entry = json.loads(stream.getvalue())
+    assert entry['message'] == 'Failed'
+    assert 'ValueError: broken' in entry['exc_info']
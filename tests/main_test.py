@@ -0,0 +1,303 @@
+from datetime import datetime
+from types import SimpleNamespace
+from queue import Queue
+import threading
+from PIL import Image
+import io
+import pytest
+from telegram import (Update, Message, MessageEntity, Chat, User,
+                      ChosenInlineResult)
+from telegram.ext import Dispatcher, JobQueue, CallbackContext
+from game import DixitGame, Stage
+from tournament import Tournament
+from utils import RenderMode
+import config
+import reaper
+import main
+
+
+CHAT_ID = -100
+
+
+class Bot:
+    '''class to emulate a telegram bot, recording the messages sent'''
+    defaults = None
+    username = 'dixit_bot'
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        self.sent.append((chat_id, photo))
+        return SimpleNamespace(photo=[SimpleNamespace(file_id='photo')])
+
+
+class CardIndex:
+    '''class to emulate ai.CardIndex, recording how each card was chosen'''
+    def __init__(self):
+        self.calls = []
+
+    def storyteller_play(self, hand):
+        self.calls.append('storyteller_play')
+        return hand[0], 'A clue'
+
+    def player_play(self, hand, clue):
+        self.calls.append('player_play')
+        return hand[0]
+
+    def vote(self, table_cards, clue):
+        self.calls.append('vote')
+        return table_cards[0]
+
+
+def png():
+    with io.BytesIO() as file:
+        Image.new('RGB', (236, 354), (40, 90, 160)).save(file, 'PNG')
+        return file.getvalue()
+
+
+@pytest.fixture
+def game_store(monkeypatch):
+    '''Makes the dispatcher fixture keep its games in a MemoryStore'''
+    monkeypatch.setattr(main.config, 'GAME_STORE', 'memory')
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    monkeypatch.setattr(main.config, 'STATS_DB', ':memory:')
+    dispatcher = Dispatcher(Bot(), Queue())
+    job_queue = JobQueue()
+    job_queue.set_dispatcher(dispatcher)
+    main.setup_dispatcher(dispatcher, job_queue)
+    card = png()
+    dispatcher.bot_data['card_images'] = {image_id: io.BytesIO(card)
+                                          for image_id in range(1, 373)}
+    dispatcher.bot_data['cards_loaded'].set()
+    yield dispatcher
+    dispatcher.bot_data['render_pool'].shutdown()
+    dispatcher.bot_data['animation_pool'].shutdown()
+
+
+def command(dispatcher, user):
+    '''Returns the update and context of a command sent by `user`'''
+    update = Update(0, message=Message(0, datetime.now(),
+                                       Chat(CHAT_ID, Chat.GROUP),
+                                       from_user=user))
+    return update, CallbackContext.from_update(update, dispatcher)
+
+
+def start_game(dispatcher, user, n_dummies, render_mode, storyteller=None):
+    '''Starts a game of `user` and dummies, as /start does. The storyteller
+    is chosen at random, unless its id is given'''
+    dixit_game = DixitGame(master=user)
+    for n in range(1, n_dummies + 1):
+        dixit_game.add_player(User(-n, f'Dummy {n}', False))
+    dispatcher.chat_data[CHAT_ID].update(dixit_game=dixit_game,
+                                         render_mode=render_mode)
+    dispatcher.user_data[user.id]['current chat'] = CHAT_ID
+    dixit_game.start_game(user)
+    if storyteller is not None:
+        dixit_game.storyteller = dixit_game.get_player_by_id(storyteller)
+    update, context = command(dispatcher, user)
+    main.run_plays(main.storytellers_turn(update, context), update, context)
+    return dixit_game
+
+
+def choose(dispatcher, user, card, clue=''):
+    '''Sends the card chosen by `user` in an inline query'''
+    update = Update(0, chosen_inline_result=ChosenInlineResult(
+            str(card.id), user, clue))
+    context = CallbackContext.from_update(update, dispatcher)
+    assert context.chat_data is None  # Chosen inline results have no chat
+    main.inline_choices(update, context)
+
+
+def human_play(dixit_game, human):
+    '''The card (and clue) that the human plays in the current stage'''
+    if dixit_game.stage == Stage.STORYTELLER:
+        return human.hand[0], 'A clue'
+    if dixit_game.stage == Stage.PLAYERS:
+        return human.hand[0], ''
+    return next(card for player, card in dixit_game.table.items()
+                if player != human), ''
+
+
+@pytest.fixture(params=[RenderMode.TEXT, RenderMode.FULL])
+def render_mode(request):
+    if request.param != RenderMode.TEXT:
+        pytest.importorskip('cairo')
+    return request.param
+
+
+def test_dummies_vote(dispatcher, render_mode):
+    user = User(1, 'Human', False)
+    dixit_game = start_game(dispatcher, user, 3, render_mode, storyteller=-1)
+    human = dixit_game.get_player_by_id(user.id)
+    assert dixit_game.stage == Stage.PLAYERS
+    assert len(dixit_game.table) == 3  # The dummies played their cards
+
+    # The human's card is the last one: the vote starts, and the dummies vote
+    choose(dispatcher, user, human.hand[0])
+    assert dixit_game.stage == Stage.VOTE
+    assert {voter.id for voter in dixit_game.votes} == {-2, -3}
+
+
+def test_inline_round(dispatcher, render_mode):
+    user = User(1, 'Human', False)
+    dixit_game = start_game(dispatcher, user, 3, render_mode)
+    human = dixit_game.get_player_by_id(user.id)
+    for _ in range(2):  # The human plays at most twice in a round
+        if dixit_game.round_number > 1:
+            break
+        choose(dispatcher, user, *human_play(dixit_game, human))
+    assert dixit_game.round_number == 2
+    assert sum(dixit_game.score.values()) > 0
+    boards = [sent for _, sent in dispatcher.bot.sent
+              if not isinstance(sent, str)]
+    assert len(boards) == (render_mode == RenderMode.FULL)
+    # The messages to the chat count in the admission control
+    admission = dispatcher.bot_data['admission']
+    assert admission.stats()['send_rate'] == round(
+            len(dispatcher.bot.sent)/config.ADMISSION_WINDOW, 2)
+
+
+def test_late_turn_timeout(dispatcher):
+    user = User(1, 'Human', False)
+    dixit_game = start_game(dispatcher, user, 3, RenderMode.TEXT)
+    update = main.TurnTimeout(CHAT_ID, user, dixit_game)
+    del dispatcher.chat_data[CHAT_ID]['dixit_game']  # The game was closed
+    n_sent = len(dispatcher.bot.sent)
+    main.turn_timeout_callback(update,
+                               CallbackContext.from_update(update, dispatcher))
+    assert len(dispatcher.bot.sent) == n_sent
+
+
+def test_turn_timeout_is_no_action(dispatcher):
+    user = User(1, 'Human', False)
+    dixit_game = start_game(dispatcher, user, 3, RenderMode.TEXT,
+                            storyteller=user.id)
+    dixit_game.last_human_action -= 3600  # Everyone left an hour ago
+    update = main.TurnTimeout(CHAT_ID, user, dixit_game)
+    main.turn_timeout_callback(update,
+                               CallbackContext.from_update(update, dispatcher))
+    # The round was played without its players, who are still idle
+    assert dixit_game.round_number == 2
+    assert dixit_game.last_activity - dixit_game.last_human_action > 3000
+    timeouts = dict.fromkeys(Stage, 1800)
+    assert reaper.find_idle_games({CHAT_ID: dixit_game}, timeouts) \
+           == [CHAT_ID]
+
+
+def test_invalid_play(dispatcher):
+    user = User(1, 'Human', False)
+    dixit_game = start_game(dispatcher, user, 3, RenderMode.TEXT,
+                            storyteller=-1)
+    storyteller = dixit_game.storyteller
+    assert dixit_game.stage == Stage.PLAYERS
+    # The storyteller can't put another card on the table
+    update, context = command(dispatcher, user)
+    main.run_plays([(storyteller, storyteller.hand[0], '')], update, context)
+    _, text = dispatcher.bot.sent[-1]
+    assert text.startswith('As the Storyteller, you have already chosen')
+    assert dixit_game.stage == Stage.PLAYERS
+
+
+def test_ai_dummies(dispatcher):
+    card_index = dispatcher.bot_data['card_index'] = CardIndex()
+    user = User(1, 'Human', False)
+    dixit_game = start_game(dispatcher, user, 3, RenderMode.TEXT,
+                            storyteller=-1)
+    human = dixit_game.get_player_by_id(user.id)
+    choose(dispatcher, user, human.hand[0])
+    assert card_index.calls == ['storyteller_play'] + ['player_play']*2 \
+                               + ['vote']*2
+
+
+def test_watch_leaves_stored_games(game_store, dispatcher):
+    store = dispatcher.bot_data['game_store']
+    user = User(1, 'Human', False)
+    watched_game, own_game = DixitGame(master=user), DixitGame(master=user)
+    dispatcher.chat_data[CHAT_ID]['dixit_game'] = watched_game
+    # The watcher's chat has a game too, owned by another worker
+    store.put_game(-300, own_game)
+
+    message = Message(0, datetime.now(), Chat(-300, Chat.GROUP),
+                      from_user=User(2, 'Watcher', False),
+                      text=f'/watch {CHAT_ID}',
+                      entities=[MessageEntity(MessageEntity.BOT_COMMAND, 0,
+                                              len('/watch'))],
+                      bot=dispatcher.bot)
+    dispatcher.process_update(Update(0, message=message))
+    assert dispatcher.bot_data['broadcaster'].stats()['spectators'] == 1
+    assert store.get_game(-300) is own_game
+    assert 'dixit_game' not in dispatcher.chat_data[-300]
+
+
+def test_game_store(game_store, dispatcher):
+    store = dispatcher.bot_data['game_store']
+    user = User(1, 'Human', False)
+    dixit_game = start_game(dispatcher, user, 3, RenderMode.COMPACT)
+    update, context = command(dispatcher, user)
+    main.save_game_callback(update, context)
+    stored_data = store.get_game(CHAT_ID)
+    assert stored_data == {'dixit_game': dixit_game,
+                           'render_mode': RenderMode.COMPACT}
+    # Unchanged games aren't put again
+    store.games.clear()
+    main.save_game_callback(update, context)
+    assert store.get_game(CHAT_ID) is None
+
+    # After a restart, the game comes back with its settings
+    store.put_game(CHAT_ID, stored_data)
+    dispatcher.chat_data[CHAT_ID].clear()
+    main.load_game_callback(update, context)
+    assert dispatcher.chat_data[CHAT_ID]['dixit_game'] is dixit_game
+    assert dispatcher.chat_data[CHAT_ID]['render_mode'] == RenderMode.COMPACT
+    store.games.clear()
+    main.save_game_callback(update, context)
+    assert store.get_game(CHAT_ID) is None
+
+    dixit_game.touch()
+    main.save_game_callback(update, context)
+    assert store.get_game(CHAT_ID)['dixit_game'] is dixit_game
+    del dispatcher.chat_data[CHAT_ID]['dixit_game']
+    main.save_game_callback(update, context)
+    assert store.get_game(CHAT_ID) is None
+
+
+def test_cancel_tournament(dispatcher):
+    master, player = User(1, 'Master', False), User(2, 'Player', False)
+    tournament = Tournament(master)
+    tournament.add_player(player)
+    dispatcher.chat_data[CHAT_ID]['tournament'] = tournament
+    user_index = dispatcher.bot_data['user_index']
+    for user in (master, player):
+        user_index[user.id] = CHAT_ID
+        dispatcher.user_data[user.id].update({'games': [CHAT_ID],
+                                              'current chat': CHAT_ID})
+
+    main.cancel_tournament_callback(*command(dispatcher, player))
+    assert dispatcher.chat_data[CHAT_ID]['tournament'] is tournament
+    main.cancel_tournament_callback(*command(dispatcher, master))
+    assert 'tournament' not in dispatcher.chat_data[CHAT_ID]
+    assert user_index == {}
+    assert dispatcher.user_data[player.id] == {'games': []}
+    assert dispatcher.bot.sent[-1] == (CHAT_ID,
+                                       'The tournament was cancelled.')
+
+
+def test_prerenders_not_metered(dispatcher):
+    admission = dispatcher.bot_data['admission']
+    release = threading.Event()
+    # A pre-render is only speculative, and a tournament board is counted
+    # as an admitted board
+    dispatcher.bot_data['render_pool'].submit(release.wait)
+    try:
+        assert admission.rendering == 0
+        assert admission.admit(CHAT_ID, boards=config.ADMISSION_MAX_RENDERS)
+        assert admission.rendering == config.ADMISSION_MAX_RENDERS
+    finally:
+        release.set()
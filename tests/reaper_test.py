@@ -0,0 +1,91 @@
+from queue import Queue
+from telegram import User
+from telegram.ext import Dispatcher, TypeHandler
+import reaper
+from game import DixitGame, Stage
+from tournament import Tournament
+
+
+class Game:
+    '''class to emulate a DixitGame with the given activity'''
+    def __init__(self, stage, last_human_action):
+        self.stage = stage
+        self.last_human_action = last_human_action
+
+
+class Timer:
+    '''class to emulate a timer of the timer wheel'''
+    cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Bot:
+    '''class to emulate a telegram bot, recording the messages sent'''
+    defaults = None
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+def test_find_idle_games():
+    timeouts = {Stage.LOBBY: 60, Stage.STORYTELLER: 30, Stage.PLAYERS: 30,
+                Stage.VOTE: 30}
+    active_games = {1: Game(Stage.LOBBY, 50),
+                    2: Game(Stage.VOTE, 50),
+                    3: Game(Stage.PLAYERS, 90)}
+    assert reaper.find_idle_games(active_games, timeouts, now=100) == [2]
+    assert reaper.find_idle_games(active_games, timeouts, now=200) == [1, 2, 3]
+
+
+def test_reap_idle_games():
+    dispatcher = Dispatcher(Bot(), Queue())
+    dispatcher.add_handler(TypeHandler(reaper.ReapIdleGames,
+                                       reaper.reap_idle_games, strict=True))
+    timeouts = dict.fromkeys(Stage, 60)
+    user = User(1, 'Player', False)
+    for chat_id, idle in ((-1, True), (-2, False)):
+        dixit_game = DixitGame(master=user)
+        if idle:
+            dixit_game.last_human_action -= 120
+        dispatcher.chat_data[chat_id].update(dixit_game=dixit_game,
+                                             render_mode=None)
+    dispatcher.user_data[1].update({'games': [-1], 'current chat': -1})
+
+    dispatcher.process_update(reaper.ReapIdleGames(timeouts))
+    assert dispatcher.chat_data[-1] == {}
+    assert 'dixit_game' in dispatcher.chat_data[-2]
+    assert dispatcher.user_data[1] == {'games': []}
+    assert [chat_id for chat_id, _ in dispatcher.bot.sent] == [-1]
+
+
+def test_reap_idle_tournament():
+    dispatcher = Dispatcher(Bot(), Queue())
+    dispatcher.add_handler(TypeHandler(reaper.ReapIdleGames,
+                                       reaper.reap_idle_games, strict=True))
+    users = [User(id_, f'Player {id_}', False) for id_ in range(1, 5)]
+    dispatcher.bot_data['user_index'] = dict.fromkeys(
+            (user.id for user in users), -1)
+    for started in (False, True):
+        tournament = Tournament(users[0], table_size=2)
+        for user in users[1:]:
+            tournament.add_player(user)
+        if started:
+            tournament.start(users[0])
+        timer = Timer()
+        dispatcher.chat_data[-1].update(tournament=tournament,
+                                        turn_timers={1: timer})
+        assert reaper.find_idle_games({-1: tournament},
+                                      dict.fromkeys(Stage, 60)) == []
+
+        # Everything is idle with negative timeouts
+        dispatcher.process_update(
+                reaper.ReapIdleGames(dict.fromkeys(Stage, -1)))
+        assert dispatcher.chat_data[-1] == {}
+        assert timer.cancelled
+        assert dispatcher.bot_data['user_index'] == {}
+        assert 'tournament was closed' in dispatcher.bot.sent[-1][1]
@@ -0,0 +1,51 @@
+import pytest
+import scoring
+
+
+class TestScoring:
+    def test_round_delta(self):
+        # 0 is the storyteller, 1 found the card, 2 and 3 voted for 1
+        votes = {1: 0, 2: 1, 3: 1}
+        assert scoring.round_delta(votes, 0, range(4)) == \
+               {0: 3, 1: 5, 2: 0, 3: 0}
+
+    def test_round_delta_bad_clue(self):
+        # Everyone found the card
+        votes = {1: 0, 2: 0, 3: 0}
+        assert scoring.round_delta(votes, 0, range(4)) == \
+               {0: 0, 1: 2, 2: 2, 3: 2}
+
+    def test_odyssey_rules(self):
+        odyssey = scoring.CompiledRules(scoring.ODYSSEY)
+        # 0 is the storyteller, 1 and 2 found the card, 3 to 6 voted for 2
+        votes = {1: 0, 2: 0, 3: 2, 4: 2, 5: 2, 6: 2}
+        assert odyssey(votes, 0, range(7)) == \
+               {0: 4, 1: 3, 2: 6, 3: 0, 4: 0, 5: 0, 6: 0}
+
+    def test_max_votes(self):
+        rules = scoring.CompiledRules(scoring.TRADITIONAL, max_votes=3)
+        assert rules({1: 0, 2: 0, 3: 1}, 0, range(4)) == \
+               {0: 3, 1: 4, 2: 3, 3: 0}
+        with pytest.raises(ValueError):
+            rules({1: 0, 2: 0, 3: 1, 4: 1}, 0, range(5))
+
+    @pytest.mark.parametrize('rule_set', scoring.rule_sets.values())
+    def test_batch_matches_round_delta(self, rule_set):
+        pytest.importorskip('numpy')
+        n_rounds, n_seats = 200, 5
+        rules = scoring.CompiledRules(rule_set)
+        votes, storytellers = scoring.simulate_votes(n_rounds, n_seats, seed=0)
+        delta, cumulative, rankings = scoring.batch_scores(votes, storytellers,
+                                                           rules=rule_set)
+
+        score = [0]*n_seats
+        for r in range(n_rounds):
+            round_votes = {voter: int(votes[r, voter].argmax())
+                           for voter in range(n_seats) if votes[r, voter].any()}
+            expected = rules(round_votes, int(storytellers[r]),
+                             range(n_seats))
+            assert list(delta[r]) == [expected[s] for s in range(n_seats)]
+            score = [s + expected[i] for i, s in enumerate(score)]
+            assert list(cumulative[r]) == score
+            assert sorted(score, reverse=True) == \
+                   list(cumulative[r][rankings[r]])
@@ -0,0 +1,79 @@
+from uuid import uuid4
+from game import DixitResults
+from stats import StatsStore
+
+
+player_ids = (1, 2, -1)
+player_names = ('Ana', 'Bia', 'Bot')
+
+
+def make_results(storyteller, votes, score, delta_score, game_id,
+                 round_number):
+    return DixitResults(
+            game_id=game_id, game_number=1, round_number=round_number,
+            player_ids=player_ids, player_names=player_names,
+            storyteller=storyteller, votes=votes, cards=(10, 11, 12),
+            clue='clue', score=score, delta_score=delta_score,
+            ranking=tuple(sorted(range(3), key=lambda seat: -score[seat])))
+
+
+class TestStatsStore:
+    def setup_method(self):
+        self.stats = StatsStore()
+        game_id = uuid4()
+        # Bia finds Ana's card, Bot doesn't: Ana succeeds as storyteller
+        self.stats.record_round(100, make_results(
+                0, (-1, 0, 1), (3, 4, 0), (3, 4, 0), game_id, 1))
+        # Everyone finds Bia's card: she fails as storyteller
+        last = make_results(1, (1, -1, 1), (5, 4, 2), (2, 0, 2), game_id, 2)
+        self.stats.record_round(100, last)
+        self.stats.record_game_end(100, last)
+
+    def test_columns(self):
+        assert len(self.stats) == 2
+        second = self.stats.round(1)
+        assert second['storyteller'] == 2
+        assert second['players'] == [1, 2, -1]
+        assert second['cards'] == [10, 11, 12]
+        assert second['voted_for'] == [2, 0, 2]
+        assert second['deltas'] == [2, 0, 2]
+
+    def test_aggregates(self):
+        ana, bia = self.stats.get_player(1), self.stats.get_player(2, 100)
+        assert (ana.wins, ana.games, ana.points) == (1, 1, 5)
+        assert ana.storyteller_success_rate == 1
+        assert bia.win_rate == 0 and bia.storyteller_success_rate == 0
+        assert self.stats.get_player(-1) is None
+        assert self.stats.get_player(1, chat_id=200) is None
+        assert self.stats.most_voted_cards(1) == [(11, 3)]
+
+    def test_leaderboard(self):
+        assert [user_id for user_id, _ in self.stats.leaderboard(100)] == [1, 2]
+        assert self.stats.leaderboard(200) == []
+        # The standings are read from their index, without sorting
+        plan = self.stats.connection.execute(
+                'EXPLAIN QUERY PLAN SELECT user_id FROM player_stats '
+                'WHERE chat_id = ? ORDER BY wins DESC, points DESC LIMIT 10',
+                (100,)).fetchall()
+        assert not any('TEMP B-TREE' in row[-1] for row in plan)
+
+
+def test_shared_between_stores(tmp_path):
+    path = str(tmp_path/'stats.sqlite3')
+    stats, other_stats = StatsStore(path), StatsStore(path)
+    game_id = uuid4()
+    # Each worker records the games of its own chats
+    stats.record_round(100, make_results(0, (-1, 0, 1), (3, 4, 0), (3, 4, 0),
+                                         game_id, 1))
+    other_stats.record_round(200, make_results(0, (-1, 0, 0), (0, 2, 2),
+                                               (0, 2, 2), uuid4(), 1))
+    assert stats.get_player(1).rounds == other_stats.get_player(1).rounds == 2
+    assert stats.get_player(2, 200).points == 2
+    stats.close()
+    other_stats.close()
+
+    # And the statistics are still there in the next run
+    stats = StatsStore(path)
+    assert len(stats) == 2
+    assert stats.get_player(2).points == 6
+    stats.close()
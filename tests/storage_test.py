@@ -0,0 +1,70 @@
+import pytest
+import storage
+from telegram import Bot, User
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return storage.MemoryStore()
+    return storage.SQLiteStore(tmp_path/'games.sqlite3', cache_size=2)
+
+
+class TestGameStore:
+    def test_games(self, store):
+        assert store.get_game(1) is None
+        store.put_game(1, {'round_number': 1})
+        store.put_game(2, {'round_number': 5})
+        assert store.get_game(1) == {'round_number': 1}
+        store.delete_game(1)
+        store.flush()
+        assert store.get_game(1) is None
+        assert store.get_game(2) == {'round_number': 5}
+
+    def test_users(self, store):
+        store.put_user(10, {'games': [1], 'current chat': 1})
+        store.flush()
+        assert store.get_user(10) == {'games': [1], 'current chat': 1}
+        assert store.get_user(11) is None
+
+    def test_interface(self):
+        with pytest.raises(TypeError):
+            storage.GameStore()
+
+
+class TestSQLiteStore:
+    def test_persists_between_stores(self, tmp_path):
+        bot = Bot('123:abc')
+        user = User.de_json({'id': 1, 'first_name': 'A', 'is_bot': False},
+                            bot)
+        store = storage.SQLiteStore(tmp_path/'games.sqlite3', bot=bot)
+        for n in range(10):  # Only the last state is written
+            store.put_game(-100, {'players': [user], 'round_number': n})
+        store.close()
+
+        other_bot = Bot('456:def')
+        store = storage.SQLiteStore(tmp_path/'games.sqlite3', bot=other_bot)
+        game = store.get_game(-100)
+        assert game['round_number'] == 9
+        assert game['players'] == [user]
+        assert game['players'][0].bot is other_bot
+
+    def test_writes_on_flush(self, tmp_path):
+        store = storage.SQLiteStore(tmp_path/'games.sqlite3')
+        for n in range(100):
+            store.put_game(n, 'a')
+        count = 'SELECT COUNT(*) FROM games'
+        assert store.connection.execute(count).fetchone() == (0,)
+        store.flush()
+        assert store.connection.execute(count).fetchone() == (100,)
+
+    def test_put_snapshots_the_object(self, tmp_path):
+        store = storage.SQLiteStore(tmp_path/'games.sqlite3', cache_size=1)
+        game = {'round_number': 1}
+        store.put_game(1, game)
+        game['round_number'] = 2  # Changed after it was put, not put again
+        store.put_game(2, {'round_number': 7})  # Evicts game from the cache
+        assert store.get_game(1) == {'round_number': 1}
+        store.flush()
+        store._cache.clear()
+        assert store.get_game(1) == {'round_number': 1}
@@ -0,0 +1,24 @@
+from datetime import datetime
+from telegram import Update, Message, Chat, User
+from supervisor import update_chat_id
+
+
+def command(chat_id, text):
+    return Update(0, message=Message(0, datetime.now(),
+                                     Chat(chat_id, Chat.GROUP),
+                                     from_user=User(1, 'Player', False),
+                                     text=text))
+
+
+def test_watch_routing():
+    watch_index = {-300: -200}
+    # Routed to the worker of the game, which keeps its spectators
+    assert update_chat_id(command(-300, '/watch -100'), {}, watch_index) \
+           == -100
+    assert update_chat_id(command(-300, '/watch@dixit_bot -100'), {},
+                          watch_index) == -100
+    assert update_chat_id(command(-300, '/unwatch'), {}, watch_index) == -200
+    # Commands that name no game stay in the chat's worker
+    assert update_chat_id(command(-300, '/watch'), {}, watch_index) == -300
+    assert update_chat_id(command(-400, '/unwatch'), {}, watch_index) == -400
+    assert update_chat_id(command(-300, '/stats'), {}, watch_index) == -300
@@ -0,0 +1,31 @@
+import random
+from timers import TimerWheel
+
+
+class TestTimerWheel:
+    def test_timers_fire_on_time(self):
+        wheel = TimerWheel(resolution=1, n_slots=4, n_levels=3)
+        fired = []
+        random.seed(0)
+        delays = [random.randint(1, 63) for _ in range(200)]
+        for n, delay in enumerate(delays):
+            if n % 50 == 0:  # Schedule some timers with the wheel turned
+                wheel.advance()
+            wheel.schedule(delay, lambda delay, tick: fired.append(
+                    (wheel.tick - tick, delay)), delay, wheel.tick)
+        for _ in range(200):
+            wheel.advance()
+        assert len(fired) == len(delays)
+        assert all(elapsed == delay for elapsed, delay in fired)
+        assert len(wheel) == 0
+
+    def test_cancel(self):
+        wheel = TimerWheel(resolution=0.5)
+        fired = []
+        timers = [wheel.schedule(n, fired.append, n) for n in range(1, 11)]
+        for timer in timers[::2]:
+            timer.cancel()
+        assert not timers[0].active and timers[1].active
+        for _ in range(20):
+            wheel.advance()
+        assert fired == [2, 4, 6, 8, 10]
@@ -0,0 +1,72 @@
+import pytest
+from telegram import User
+from exceptions import *
+from tournament import Tournament
+
+
+@pytest.fixture
+def tournament():
+    users = [User(id_, f'Player {id_}', False) for id_ in range(1, 15)]
+    tournament = Tournament(users[0], table_size=4, n_rounds=2)
+    for user in users[1:]:
+        tournament.add_player(user)
+    return tournament
+
+
+class TestTournament:
+    def test_seating(self, tournament):
+        tournament.start(tournament.master.user)
+        sizes = sorted(len(table.players) for table in tournament.tables)
+        assert sizes == [3, 3, 4, 4]
+        for table in tournament.tables:
+            for player in table.players:
+                assert tournament.table_of(player.id) is table
+        assert tournament.tables[0].stage == 1
+
+    def test_start_errors(self, tournament):
+        with pytest.raises(UserIsNotMasterError):
+            tournament.start(tournament.players[1].user)
+        tournament.start(tournament.master.user)
+        with pytest.raises(GameAlreadyStartedError):
+            tournament.start(tournament.master.user)
+        with pytest.raises(GameAlreadyStartedError):
+            tournament.add_player(User(99, 'Late', False))
+
+        small = Tournament(User(1, 'Alone', False))
+        with pytest.raises(TooFewPlayersError):
+            small.start(small.master.user)
+
+    def test_round_synchronisation(self, tournament):
+        tournament.start(tournament.master.user)
+        *first, last = tournament.tables
+        for n, table in enumerate(first):
+            assert not tournament.finish_round(table, f'results {n}')
+        assert tournament.finish_round(last, 'last results')
+        assert tournament.next_round() == ['results 0', 'results 1',
+                                           'results 2', 'last results']
+        assert tournament.round_number == 2
+        assert not tournament.finish_round(last, 'last results')
+
+    def test_seated_at(self, tournament):
+        tournament.start(tournament.master.user)
+        master_id = tournament.master.id
+        own_table = tournament.table_of(master_id)
+        assert tournament.master in own_table.players
+        assert tournament.seat_of(master_id) is own_table
+        table, other_table = [table for table in tournament.tables
+                              if table is not own_table][:2]
+        with tournament.seated_at(table):
+            assert tournament.table_of(master_id) is table
+            assert tournament.seat_of(master_id) is own_table
+            with tournament.seated_at(other_table):
+                assert tournament.table_of(master_id) is other_table
+            assert tournament.table_of(master_id) is table
+        assert tournament.table_of(master_id) is own_table
+
+    def test_standings(self, tournament):
+        tournament.start(tournament.master.user)
+        for n, table in enumerate(tournament.tables):
+            table.score[table.players[0]] = 10 - n
+        standings = tournament.standings()
+        assert len(standings) == 14
+        assert [score for _, score in standings[:4]] == [10, 9, 8, 7]
@@ -0,0 +1,96 @@
+'''A hierarchical timer wheel, shared by all games for their turn timers.
+
+Time advances in ticks of `resolution` seconds, driven by a single repeating
+job. Level 0 has a slot per tick; each higher level has slots spanning a
+whole turn of the level below, and its timers cascade down when their slot
+comes up. Scheduling and cancelling are O(1): a timer knows the slot (a dict)
+it is in.
+'''
+from math import ceil
+from itertools import count
+import threading
+
+
+class Timer:
+    __slots__ = ('id', 'deadline', 'callback', 'args', '_slot')
+
+    def __init__(self, id_, deadline, callback, args):
+        self.id = id_
+        self.deadline = deadline  # In ticks
+        self.callback = callback
+        self.args = args
+        self._slot = None
+
+    def __repr__(self):
+        return f'Timer(id={self.id}, deadline={self.deadline})'
+
+    @property
+    def active(self):
+        return self._slot is not None
+
+    def cancel(self):
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            slot.pop(self.id, None)
+
+
+class TimerWheel:
+    def __init__(self, resolution=1.0, n_slots=64, n_levels=4):
+        '''The wheel covers delays of up to n_slots**n_levels ticks'''
+        self.resolution = resolution
+        self.n_slots = n_slots
+        self.levels = [[{} for _ in range(n_slots)] for _ in range(n_levels)]
+        self.tick = 0
+        self._ids = count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(slot) for level in self.levels for slot in level)
+
+    def _insert(self, timer):
+        # The timer goes to the lowest level where the digits (in base
+        # n_slots) of its deadline above that level match the current tick's
+        span = self.n_slots
+        level = 0
+        while (level < len(self.levels) - 1
+               and timer.deadline // span != self.tick // span):
+            level += 1
+            span *= self.n_slots
+        slot = self.levels[level][
+                timer.deadline // (span // self.n_slots) % self.n_slots]
+        slot[timer.id] = timer
+        timer._slot = slot
+
+    def schedule(self, delay, callback, *args):
+        '''Calls `callback(*args)` after `delay` seconds (rounded up to the
+        resolution). Returns the Timer, which can be cancelled'''
+        ticks = max(1, ceil(delay/self.resolution))
+        ticks = min(ticks, self.n_slots**len(self.levels) - 1)
+        with self._lock:
+            timer = Timer(next(self._ids), self.tick + ticks, callback, args)
+            self._insert(timer)
+        return timer
+
+    def advance(self):
+        '''Advances the wheel by one tick and runs the expired timers'''
+        with self._lock:
+            self.tick += 1
+            span = self.n_slots
+            for level in self.levels[1:]:
+                if self.tick % span:
+                    break
+                slot = level[self.tick // span % self.n_slots]
+                timers = list(slot.values())
+                slot.clear()
+                for timer in timers:
+                    self._insert(timer)
+                span *= self.n_slots
+
+            slot = self.levels[0][self.tick % self.n_slots]
+            expired = list(slot.values())
+            slot.clear()
+            for timer in expired:
+                timer._slot = None
+
+        for timer in expired:
+            timer.callback(*timer.args)
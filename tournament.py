@@ -0,0 +1,154 @@
+'''Tournaments: a large group of players split into several tables, each a
+DixitGame, playing in the same chat at the same time.
+
+The players are seated at tables of at most `table_size` players, as even as
+possible, and every table plays `n_rounds` rounds. The rounds are played in
+step: a table that finishes its round waits for the others, so that the
+results boards of every table can be rendered at once (see
+`draw.render_boards`) before all tables start their next round. The
+standings add up the players' scores at their tables.
+
+While a tournament is on, `utils.get_game` returns the table of the user of
+the update, or the one the bot is acting on (see `Tournament.seated_at`).
+
+Like games, tournaments whose players have been idle for too long are evicted
+by the reaper (see reaper.py), and the master can cancel them with
+/canceltournament.
+'''
+from contextlib import contextmanager
+from math import ceil
+from random import shuffle
+from time import time
+from telegram import User
+from exceptions import *
+from game import DixitGame, Player, EndCriterion, Stage
+
+
+class Tournament:
+    min_players = 3
+
+    def __init__(self, master, table_size=6, n_rounds=3):
+        self.master = Player(master) if isinstance(master, User) else master
+        self.players = [self.master]
+        self.table_size = table_size
+        self.n_rounds = n_rounds
+        self.tables = []
+        self.round_number = 1
+        self.round_results = {}  # {table index: DixitResults}, this round
+        self._seats = {}  # {player id: table index}
+        self._acting = None
+        self._last_human_action = time()  # Updated by `touch`
+
+    @property
+    def started(self):
+        return bool(self.tables)
+
+    def touch(self):
+        '''Records that the players had some activity now'''
+        self._last_human_action = time()
+
+    @property
+    def last_human_action(self):
+        '''Time of the last activity of the players, at any table'''
+        return max([self._last_human_action]
+                   + [table.last_human_action for table in self.tables])
+
+    @property
+    def stage(self):
+        '''Stage of the tournament, for its idle timeout: LOBBY until it
+        starts, then the stage of the tables that are furthest behind'''
+        if not self.started:
+            return Stage.LOBBY
+        return min(table.stage for table in self.tables)
+
+    @property
+    def users(self):
+        return [player.user for player in self.players]
+
+    def add_player(self, user):
+        player = Player(user) if isinstance(user, User) else user
+        if self.started:
+            raise GameAlreadyStartedError("Damn you, {user.first_name}! "
+                    "The tournament has started already!")
+        if player in self.players:
+            raise UserAlreadyInGameError("Damn you, {user.first_name}! You "
+                    "have already joined the tournament!")
+        self.players.append(player)
+        self.touch()
+
+    def seat_players(self):
+        '''Splits the players at random into tables whose sizes differ by at
+        most one. Returns the players of each table'''
+        players = self.players.copy()
+        shuffle(players)
+        n_tables = ceil(len(players)/self.table_size)
+        return [players[n::n_tables] for n in range(n_tables)]
+
+    def start(self, user):
+        '''Seats the players and starts the games of every table'''
+        if user != self.master.user:
+            raise UserIsNotMasterError("Damn you, {user.first_name}! "
+                    "You are not the master {dixit_game.master}!")
+        if self.started:
+            raise GameAlreadyStartedError("Damn you, {user.first_name}! "
+                    "The tournament has started already!")
+        if len(self.players) < self.min_players:
+            raise TooFewPlayersError("A tournament needs at least "
+                    f"{self.min_players} players, {{user.first_name}}!")
+
+        for n, players in enumerate(self.seat_players()):
+            table = DixitGame(players=players,
+                              end_criterion=EndCriterion.ROUNDS,
+                              end_criterion_number=self.n_rounds)
+            table.start_game(table.master.user)
+            self.tables.append(table)
+            for player in players:
+                self._seats[player.id] = n
+        self.touch()
+
+    def table_of(self, user_id):
+        '''Returns the table the bot is acting on, if any, or the table of the
+        user'''
+        if self._acting is not None:
+            return self._acting
+        return self.seat_of(user_id)
+
+    def seat_of(self, player_id):
+        '''Returns the table the player is seated at'''
+        return self.tables[self._seats[player_id]]
+
+    def table_number(self, table):
+        return self.tables.index(table) + 1
+
+    @contextmanager
+    def seated_at(self, table):
+        '''Makes `table_of` return `table`, to play at a table on behalf of
+        its players (e.g. to start its next round)'''
+        previous, self._acting = self._acting, table
+        try:
+            yield table
+        finally:
+            self._acting = previous
+
+    def finish_round(self, table, results):
+        '''Records that the table finished the current round. Returns whether
+        every table has finished it'''
+        self.round_results[self.tables.index(table)] = results
+        return len(self.round_results) == len(self.tables)
+
+    def next_round(self):
+        '''Returns the results of every table in the round that ended, in
+        table order, and starts the next round'''
+        results = [self.round_results[n] for n in range(len(self.tables))]
+        self.round_results.clear()
+        self.round_number += 1
+        return results
+
+    def has_ended(self):
+        return all(table.has_ended() for table in self.tables)
+
+    def standings(self):
+        '''Returns [(player, score)] over all tables, best first'''
+        scores = [(player, score) for table in self.tables
+                  for player, score in table.score.items()]
+        return sorted(scores, key=lambda item: item[1], reverse=True)
@@ -3,14 +3,28 @@ from telegram import (InlineKeyboardButton, InlineKeyboardMarkup,
 from telegram.error import TelegramError
 from uuid import uuid4
 from functools import wraps
+from contextlib import contextmanager
+from time import perf_counter
 from exceptions import *
-from enum import IntEnum
-from PIL import Image
-from cairo import ImageSurface
+from supervisor import watch_command
+from enum import Enum, IntEnum
 from random import choice
 import logging
 import os
 
+@contextmanager
+def metered_send(context):
+    '''Times a send to the current chat, for the admission control of the
+    results boards (see admission.py)'''
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        admission = context.bot_data.get('admission')
+        if admission is not None:
+            admission.sent(perf_counter() - start)
+
+
 def send_message(text, update, context, button=None, **kwargs):
     '''Sends message to group chat specified in update and logs it. If the
     button argument is passed, shows the users a button with the specified
@@ -23,19 +37,62 @@ def send_message(text, update, context, button=None, **kwargs):
         markup = InlineKeyboardMarkup(keyboard)
 
     chat_id = get_chat_id(context)
-    context.bot.send_message(chat_id=chat_id, text=text, reply_markup=markup,
-                             **kwargs)
-    logging.debug(f'Sent message "{text}" to chat {chat_id=}')
+    with metered_send(context):
+        context.bot.send_message(chat_id=chat_id, text=text,
+                                 reply_markup=markup, **kwargs)
+    logging.debug('Sent message "%s" to chat chat_id=%s', text, chat_id)
 
 
 def send_photo(photo, update, context, **kwargs):
-    '''Sends photo to group chat specified in update and logs it.'''
+    '''Sends photo to group chat specified in update and logs it. Returns the
+    sent message'''
     chat_id = get_chat_id(context)
-    context.bot.send_photo(chat_id=chat_id, photo=photo, **kwargs)
+    with metered_send(context):
+        message = context.bot.send_photo(chat_id=chat_id, photo=photo,
+                                         **kwargs)
     if isinstance(photo, str):
-        logging.debug(f'Sent photo "{photo}" to chat {chat_id=}')
+        logging.debug('Sent photo "%s" to chat chat_id=%s', photo, chat_id)
     else:
-        logging.debug(f'Sent photo to chat {chat_id=}')
+        logging.debug('Sent photo to chat chat_id=%s', chat_id)
+    return message
+
+
+def send_animation(animation, update, context, **kwargs):
+    '''Sends animation to group chat specified in update and logs it. Returns
+    the sent message'''
+    chat_id = get_chat_id(context)
+    with metered_send(context):
+        message = context.bot.send_animation(chat_id=chat_id,
+                                             animation=animation, **kwargs)
+    logging.debug('Sent animation to chat chat_id=%s', chat_id)
+    return message
+
+
+def broadcast_message(text, context, **kwargs):
+    '''Sends the message to the spectators of the current chat's game'''
+    context.bot_data['broadcaster'].publish_message(get_chat_id(context),
+                                                    text, **kwargs)
+
+
+def broadcast_photo(message, context, **kwargs):
+    '''Sends the photo of a message sent to the current chat to its game's
+    spectators, without uploading it again'''
+    context.bot_data['broadcaster'].publish_photo(get_chat_id(context),
+                                                  message, **kwargs)
+
+
+def broadcast_animation(message, context, **kwargs):
+    '''Sends the animation of a message sent to the current chat to its game's
+    spectators, without uploading it again'''
+    context.bot_data['broadcaster'].publish_animation(get_chat_id(context),
+                                                      message, **kwargs)
+
+
+def get_card_images(context):
+    '''Returns the card images, waiting for them if they are still being
+    loaded (see `main.warm_up`)'''
+    context.bot_data['cards_loaded'].wait()
+    return context.bot_data['card_images']
 
 
 def get_active_games(context):
@@ -53,36 +110,131 @@ def get_active_games(context):
 
 def find_user_games(context, user):
     '''Finds the `chat_id`'s of the games where the `user` is playing.
-    Returns a {chat_id: dixit_game} dict.
+    Returns a {chat_id: dixit_game} dict. The game is None if it is owned by
+    another worker process (see supervisor.py).
     '''
-    return {chat_id: dixit_game
-            for chat_id, dixit_game in get_active_games(context).items()
-            if user in dixit_game.users}
+    user_index = context.bot_data.get('user_index')
+    if user_index is None:
+        return {chat_id: dixit_game
+                for chat_id, dixit_game in get_active_games(context).items()
+                if user in dixit_game.users}
+    chat_id = user_index.get(user.id)
+    if chat_id is None:
+        return {}
+    return {chat_id: get_active_games(context).get(chat_id)}
+
+
+def index_user(context, user):
+    '''Records in the user index, shared by all workers, that `user` plays in
+    the current chat'''
+    context.bot_data['user_index'][user.id] = get_chat_id(context)
+
+
+def unindex_game(context, dixit_game):
+    '''Removes the players of `dixit_game` from the user index'''
+    user_index = context.bot_data['user_index']
+    for player in dixit_game.players + dixit_game.lobby:
+        user_index.pop(player.id, None)
+
+
+def get_chat_data(context):
+    """Returns the chat_data of the current chat. Unlike `context.chat_data`,
+    it is there in updates without a chat, such as chosen inline results"""
+    return context.dispatcher.chat_data[get_chat_id(context)]
 
 
 def get_game(context):
-    """Retrieves the current chat from user_data"""
-    chat_id = get_chat_id(context)
-    data = context.dispatcher.chat_data[chat_id]
+    """Retrieves the current chat from user_data. In a tournament, returns the
+    user's table (see tournament.py)"""
+    data = get_chat_data(context)
+    tournament = data.get('tournament')
+    if tournament is not None and tournament.started:
+        user_id, _ = context._user_id_and_data
+        return tournament.table_of(user_id)
     return data['dixit_game']
 
 
 def set_game(context):
     """Stores current chat ID in `user_data` and sets it as 'current chat'.
+    The user's data is also saved in the game store, if there is one.
     """
     chat_id = get_chat_id(context)
     context.user_data.setdefault('games', []).append(chat_id)
     context.user_data['current chat'] = chat_id
+    store = context.bot_data.get('game_store')
+    if store is not None:
+        user_id, _ = context._user_id_and_data
+        store.put_user(user_id, {'games': context.user_data['games'],
+                                 'current chat': chat_id})
 
 
 def get_chat_id(context):
     try:
         chat_id = context.user_data['current chat']
     except KeyError:
-        chat_id, _ = context._chat_id_and_data
+        # The user's data may be in the game store, e.g. after a restart
+        store = context.bot_data.get('game_store')
+        user_id, _ = context._user_id_and_data
+        stored_data = store and store.get_user(user_id)
+        if stored_data:
+            context.user_data.update(stored_data)
+            chat_id = stored_data['current chat']
+        else:
+            chat_id, _ = context._chat_id_and_data
     return chat_id
 
 
+def routed_by_game(update):
+    '''Whether the update is a /watch or /unwatch command, which goes to the
+    worker of the game it is about rather than of its chat (see
+    supervisor.py). That worker doesn't own the chat's game, so the game
+    store handlers leave it alone'''
+    return watch_command(update.message) is not None
+
+
+# The chat data stored with the game in the game store
+stored_keys = ('dixit_game', 'render_mode', 'added_dummies')
+
+
+def load_game_callback(update, context):
+    '''Puts the game of the current chat, and its settings, in `chat_data`
+    from the game store, if it isn't there (e.g. after a restart)'''
+    if routed_by_game(update):
+        return
+    try:
+        chat_id = get_chat_id(context)
+    except TypeError:  # Update with no chat and no user
+        return
+    chat_data = context.dispatcher.chat_data[chat_id]
+    if 'dixit_game' not in chat_data:
+        stored_data = context.bot_data['game_store'].get_game(chat_id)
+        if stored_data is not None:
+            chat_data.update(stored_data)
+            chat_data['stored_activity'] = \
+                    stored_data['dixit_game'].last_activity
+
+
+def save_game_callback(update, context):
+    '''Saves the game of the current chat, as left by the handlers, in the
+    game store, if it changed (see `DixitGame.touch`)'''
+    if routed_by_game(update):
+        return
+    try:
+        chat_id = get_chat_id(context)
+    except TypeError:  # Update with no chat and no user
+        return
+    store = context.bot_data['game_store']
+    chat_data = context.dispatcher.chat_data[chat_id]
+    dixit_game = chat_data.get('dixit_game')
+    if dixit_game is None:
+        if chat_data.pop('stored_activity', None) is not None:
+            store.delete_game(chat_id)
+    elif dixit_game.last_activity != chat_data.get('stored_activity'):
+        store.put_game(chat_id, {key: chat_data[key] for key in stored_keys
+                                 if key in chat_data})
+        chat_data['stored_activity'] = dixit_game.last_activity
+
+
 def ensure_game(exists=True):
     '''Decorator to ensure a game exists before callbacks are made.
     Ensures the opposite if `exists= False`
@@ -92,7 +244,10 @@ def ensure_game(exists=True):
         def safe_callback(update, context):
             # Checks if there is an ongoing game
             user = update.message.from_user
-            if ('dixit_game' in context.chat_data.keys()) != exists:
+            # No game can be created while there is a tournament
+            in_progress = ('dixit_game' in context.chat_data
+                           or not exists and 'tournament' in context.chat_data)
+            if in_progress != exists:
                 if exists:
                     send_message(f"Damn you, {user.first_name}! First, create a "
                                   "new game with /newgame!", update, context)
@@ -131,14 +286,26 @@ def menu_card(card, player, text='🎴', clue=None):
             )
 
 
-def random_card_id(player, card_list):
-    '''Returns message with a random chosen card from card_list'''
-    card_id = choice(card_list).id
-    return card_id
+def random_card(card_list):
+    '''Returns a random card from card_list'''
+    return choice(card_list)
 
 
-def random_card_from_hand(player):
-    return random_card_id(player, player.hand)
+def exception_text(e, update, context):
+    '''Returns the text of an exception raised by the game, formatted with
+    the user of the update, the game and the player'''
+    user = update.effective_user
+    try:
+        dixit_game = get_game(context)
+    except KeyError:
+        # The chat has no game (anymore), e.g. for a late timeout
+        dixit_game = None
+    try:
+        player = dixit_game.get_player_by_id(user.id)
+    except (AttributeError, UserNotPlayingError):
+        # dixit_game não definido OU player não existe
+        player = None
+    return str(e).format(user=user, dixit_game=dixit_game, player=player)
 
 
 def handle_exceptions(*exceptions):
@@ -147,27 +314,17 @@ def handle_exceptions(*exceptions):
     '''
     def decorator(f):
         def msg_f(update, context, *args, **kwargs):
-            user = update.effective_user
-            dixit_game = get_game(context)
-            try:
-                player = dixit_game.get_player_by_id(user.id)
-            except (AttributeError, UserNotPlayingError):
-                # dixit_game não definido OU player não existe
-                player = None
-
-            subs = {'user': user,
-                    'dixit_game': dixit_game,
-                    'player': player}
             try:
                 return f(update, context, *args, **kwargs)
             except exceptions as e:
-                text = str(e).format(**subs)
-                send_message(text, update, context)
+                send_message(exception_text(e, update, context), update,
+                             context)
         return msg_f
     return decorator
 
 
 def convert_jpg_to_png(filename_jpg, delete_jpg=False):
+    from PIL import Image  # Imported on first use, to start up faster
     if not filename_jpg.endswith('.jpg'):
         raise ValueError(f'{filename_jpg} does not end with .jpg')
     file_jpg = Image.open(filename_jpg)
@@ -179,6 +336,7 @@ def convert_jpg_to_png(filename_jpg, delete_jpg=False):
 
 # Load card images into memory.
 def load_cards():
+    from cairo import ImageSurface  # Imported on first use, to start up faster
     card_images = {}
     for card_file in os.listdir('assets/cards/png/'):
         image = open(f'assets/cards/png/{card_file}', 'rb')
@@ -187,6 +345,14 @@ def load_cards():
     assert len(card_images) == 372
     return card_images
 
+class RenderMode(Enum):
+    '''How the results of each round are shown in a chat'''
+    FULL = 0  # Results board with every card and vote
+    COMPACT = 1  # Storyteller's card and scoreboard
+    TEXT = 2  # Storyteller's card and text messages
+    ANIMATED = 3  # Results board, with the votes and scores animated
+
+
 class TelegramPhotoSize(IntEnum):
     # The sizes are from my experience. Don't trust this
     SMALL = 0 # 160x160